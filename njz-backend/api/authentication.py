@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Copied into every token so authenticated requests can be served from the
+# claims alone (see JWTStatelessUserAuthentication in settings). simplejwt's
+# TokenUser reads is_staff and is_superuser from these claims (since 5.3), which
+# the staff-only gates such as request profiling rely on; a change of role takes
+# effect with the next access token.
+USER_CLAIMS = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'is_superuser')
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the basic user fields as claims; the access token
+    derived from it inherits them.
+    """
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+
+def _user_cache():
+    # Shared by all workers, so an invalidation is seen by every one of them
+    return caches['users']
+
+
+def _user_cache_key(user_id):
+    return f'api:user:{user_id}'
+
+
+def resolve_user(user, use_cache=True):
+    """
+    Return the full User (with its profile joined) behind a token user.
+    Read-only callers may use the short-TTL cache (JWT_USER_CACHE_TTL seconds);
+    callers that write should pass use_cache=False. Raises AuthenticationFailed,
+    as simplejwt's database-backed authentication would, when the user has been
+    deleted or deactivated since the token was issued.
+    """
+    if isinstance(user, User):
+        return user
+    ttl = getattr(settings, 'JWT_USER_CACHE_TTL', 0)
+    key = _user_cache_key(user.id)
+    full_user = _user_cache().get(key) if use_cache and ttl else None
+    if full_user is None:
+        try:
+            full_user = User.objects.select_related('profile').get(pk=user.id)
+        except User.DoesNotExist:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if ttl:
+            _user_cache().set(key, full_user, ttl)
+    if not full_user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return full_user
+
+
+def invalidate_user_cache(user_id):
+    _user_cache().delete(_user_cache_key(user_id))
@@ -1,6 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 
@@ -35,8 +35,23 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
     """
-    Save user profile when user is updated
+    Save user profile when user is updated, only if the profile was loaded
+    alongside it; partial saves such as last_login updates never touch it
     """
+    if created or update_fields or not User.profile.is_cached(instance):
+        return
     instance.profile.save()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drop the cached user/profile used by token-authenticated requests, so a
+    deleted or deactivated user is turned away on their next request
+    """
+    from .authentication import invalidate_user_cache
+    invalidate_user_cache(instance.pk if sender is User else instance.user_id)
@@ -1,3 +1,94 @@
 from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 
-# Create your tests here.
+from .authentication import ClaimsRefreshToken
+
+
+class TokenAuthQueryCountTests(TestCase):
+    def setUp(self):
+        caches['users'].clear()
+        self.user = User.objects.create_user(
+            username='alice', password='S3cure-pass-123', email='alice@example.com',
+            first_name='Alice', last_name='Smith',
+        )
+        self.token = str(ClaimsRefreshToken.for_user(self.user).access_token)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_authentication_reads_user_from_claims(self):
+        request = Request(APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}'))
+        with self.assertNumQueries(0):
+            user, _ = JWTStatelessUserAuthentication().authenticate(request)
+        self.assertEqual(user.id, self.user.id)
+        self.assertEqual(user.username, 'alice')
+        self.assertEqual(user.email, 'alice@example.com')
+
+    def test_staff_flags_come_from_claims(self):
+        self.user.is_staff = True
+        self.user.save()
+        token = str(ClaimsRefreshToken.for_user(self.user).access_token)
+        request = Request(APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+        user, _ = JWTStatelessUserAuthentication().authenticate(request)
+        self.assertTrue(user.is_staff)
+        self.assertFalse(user.is_superuser)
+
+    def test_user_cache_is_shared_between_workers(self):
+        # A LocMemCache is private to each process: the post_save invalidation in
+        # one worker would leave the others serving the old user
+        self.assertNotIn('LocMemCache', type(caches['users']).__name__)
+
+    def test_profile_get_is_served_from_cache(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api:profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['username'], 'alice')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api:profile'))
+        self.assertEqual(response.data['data']['email'], 'alice@example.com')
+
+    def test_profile_update_refreshes_cache(self):
+        self.client.get(reverse('api:profile'))
+        response = self.client.patch(
+            reverse('api:profile'), {'first_name': 'Alicia', 'profile': {'phone_number': '12345'}}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('api:profile'))
+        self.assertEqual(response.data['data']['first_name'], 'Alicia')
+        self.assertEqual(response.data['data']['profile']['phone_number'], '12345')
+
+    def test_deleted_user_is_rejected(self):
+        self.client.get(reverse('api:profile'))
+        self.user.delete()
+        self.assertEqual(self.client.get(reverse('api:profile')).status_code, 401)
+        response = self.client.post(reverse('api:change_password'), {
+            'old_password': 'S3cure-pass-123', 'new_password': 'N3w-secure-pass', 'new_password2': 'N3w-secure-pass',
+        }, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_inactive_user_is_rejected(self):
+        self.client.get(reverse('api:profile'))
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('api:profile'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'].code, 'user_inactive')
+        self.assertEqual(self.client.patch(reverse('api:profile'), {'first_name': 'Al'}, format='json').status_code, 401)
+        self.assertFalse(User.objects.filter(first_name='Al').exists())
+
+    def test_rag_chat_list_authenticates_from_claims(self):
+        # The chat page is the only query; the user is not loaded
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('rag:chat_list_create'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_save_does_not_write_unloaded_profile(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            user.save(update_fields=['first_name'])
+        with self.assertNumQueries(1):
+            user.save()
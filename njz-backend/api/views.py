@@ -7,6 +7,7 @@ from rest_framework.generics import CreateAPIView, RetrieveUpdateAPIView
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
+from .authentication import ClaimsRefreshToken, resolve_user
 from .serializers import (
     UserSerializer, 
     UserUpdateSerializer, 
@@ -65,7 +66,7 @@ class RegisterView(CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             return Response({
                 'status': 'success',
                 'message': 'User registered successfully',
@@ -104,7 +105,7 @@ class LoginView(APIView):
             user = authenticate(username=username, password=password)
             
             if user:
-                refresh = RefreshToken.for_user(user)
+                refresh = ClaimsRefreshToken.for_user(user)
                 return Response({
                     'status': 'success',
                     'message': 'Login successful',
@@ -169,8 +170,9 @@ class ProfileView(RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserUpdateSerializer
 
-    def get_object(self):
-        return self.request.user
+    def get_object(self, use_cache=True):
+        # request.user is built from the token claims; load the full user lazily
+        return resolve_user(self.request.user, use_cache=use_cache)
 
     def retrieve(self, request, *args, **kwargs):
         user = self.get_object()
@@ -181,7 +183,7 @@ class ProfileView(RetrieveUpdateAPIView):
         }, status=status.HTTP_200_OK)
 
     def update(self, request, *args, **kwargs):
-        user = self.get_object()
+        user = self.get_object(use_cache=False)
         serializer = self.get_serializer(user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -204,9 +206,9 @@ class ChangePasswordView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        serializer = ChangePasswordSerializer(data=request.data, context={'request': request})
+        user = resolve_user(request.user, use_cache=False)
+        serializer = ChangePasswordSerializer(data=request.data, context={'request': request, 'user': user})
         if serializer.is_valid():
-            user = request.user
             user.set_password(serializer.validated_data['new_password'])
             user.save()
             return Response({
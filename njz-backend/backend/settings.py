@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -83,12 +84,61 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Selected from the environment:
+#   DB_ENGINE=sqlite (default)  WAL journal, busy timeout and relaxed fsync so
+#                               readers never block on the single writer.
+#                               DB_SQLITE_TUNING=off restores the stock setup.
+#   DB_ENGINE=postgres          DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT.
+#                               DB_POOL=on uses psycopg's connection pool
+#                               (pip install "psycopg[binary,pool]"), otherwise
+#                               connections persist for DB_CONN_MAX_AGE seconds.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite').lower()
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    DB_POOL = os.environ.get('DB_POOL', 'off').lower() in ('1', 'on', 'true', 'yes')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'njz'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # The pool keeps connections itself; Django must not also hold them open
+            'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                },
+            } if DB_POOL else {},
+        }
+    }
+else:
+    DB_SQLITE_TUNING = os.environ.get('DB_SQLITE_TUNING', 'on').lower() not in ('0', 'off', 'false', 'no')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE if DB_SQLITE_TUNING else 0,
+            'OPTIONS': {
+                'timeout': 20,
+                # Take the write lock at BEGIN so concurrent writers queue on the
+                # busy timeout instead of failing with "database is locked"
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA cache_size=-20000;'
+                ),
+            } if DB_SQLITE_TUNING else {},
+        }
     }
-}
 
 
 # Password validation
@@ -135,7 +185,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Builds request.user from the token claims without a database lookup
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
@@ -181,6 +232,24 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Seconds a full user + profile loaded for a token user stays cached (0 disables)
+JWT_USER_CACHE_TTL = 30
+
+# 'default' is per worker (retrieval hits and other data that is only ever
+# stale, never wrong). Cached users live in 'users', which every worker must
+# share so that the post_save invalidation reaches all of them: a file cache on
+# one host, or e.g. USER_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# with USER_CACHE_LOCATION=redis://host:6379 across hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'users': {
+        'BACKEND': os.environ.get('USER_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('USER_CACHE_LOCATION', str(BASE_DIR / '.cache' / 'users')),
+    },
+}
+
 # CORS Configuration
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 CORS_ALLOW_CREDENTIALS = True
@@ -188,3 +257,112 @@ CORS_ALLOW_CREDENTIALS = True
 # Media files configuration
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Uploaded files are spooled straight to a temp file instead of memory; the RAG
+# views then stream them into place (and downloads to disk) in 1 MB pieces,
+# hashing as they go. Larger files are rejected with 413: an upload stops being
+# spooled as soon as it passes RAG_UPLOAD_MAX_BYTES.
+FILE_UPLOAD_HANDLERS = [
+    'rag.transfer.MaxSizeUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+RAG_UPLOAD_MAX_BYTES = int(os.environ.get('RAG_UPLOAD_MAX_BYTES', 100 * 1024 * 1024))
+RAG_DOWNLOAD_MAX_BYTES = int(os.environ.get('RAG_DOWNLOAD_MAX_BYTES', 100 * 1024 * 1024))
+RAG_DOWNLOAD_TIMEOUT = (5, 30)  # (connect, read) seconds
+RAG_HTTP_POOL_SIZE = 10
+RAG_DOCUMENT_CACHE_SIZE = 4  # HackRx document indexes kept per worker, by content hash
+RAG_HACKRX_MAX_DOCUMENTS = 10
+RAG_HACKRX_PARALLEL_DOCUMENTS = 4  # documents downloaded and indexed at once
+# Multi-file uploads (`files` field): processes extracting and chunking files at once
+# (each worker starts its own pool with a spaCy pipeline on the first such upload;
+# 1 chunks in the request thread), and chunks per embedding call across files; the
+# chat index is written once per request
+RAG_UPLOAD_MAX_FILES = 50
+RAG_UPLOAD_PARALLEL_FILES = int(os.environ.get('RAG_UPLOAD_PARALLEL_FILES', 4))
+RAG_UPLOAD_EMBED_BATCH = 256
+
+# Chunk embedding for uploads and HackRx documents: chunks are sorted by length into
+# batches of RAG_EMBED_BATCH_SIZE. With RAG_EMBED_PROCESSES > 0 the batches go to that
+# many worker processes (each loads its own model, RAG_EMBED_THREADS torch threads
+# each, 0 = CPU count / processes). Leave at 0 under several gunicorn workers, which
+# already use the cores; `manage.py embedding_benchmark` measures the gain.
+RAG_EMBED_PROCESSES = int(os.environ.get('RAG_EMBED_PROCESSES', 0))
+RAG_EMBED_THREADS = int(os.environ.get('RAG_EMBED_THREADS', 0))
+RAG_EMBED_BATCH_SIZE = 64
+
+# Knowledge graph of each chat (graph.sqlite3 in the chat directory), updated on
+# upload: entities are taken from the spaCy parse done for chunking and linked when
+# they share a sentence (at most RAG_GRAPH_MAX_ENTITIES_PER_SENTENCE per sentence).
+# A depth-2 graph query adds up to RAG_GRAPH_FANOUT neighbours of each neighbour.
+RAG_GRAPH_ENABLED = True
+RAG_GRAPH_MAX_ENTITIES_PER_SENTENCE = 12
+RAG_GRAPH_FANOUT = 10
+
+# Top-k chunk ids/distances per (chat, index version, normalized query, k), kept
+# in the default cache; answers are not cached, so prompt changes reuse retrieval.
+RAG_RETRIEVAL_CACHE_TTL = 600
+
+# Tiering of per-chat indexes by decayed access score (half-life in hours). The
+# RAG_TIER_HOT_CHATS top chats stay resident in each worker, other chats are
+# memory-mapped, and `manage.py chat_tiers --apply` gzips chats idle for
+# RAG_TIER_COLD_AFTER_DAYS (they are decompressed on their next access).
+RAG_TIER_HOT_CHATS = int(os.environ.get('RAG_TIER_HOT_CHATS', 16))
+RAG_TIER_COLD_AFTER_DAYS = 30
+RAG_TIER_HALF_LIFE_HOURS = 24
+RAG_TIER_ACCESS_FLUSH_SECONDS = 30
+
+# LLM admission control, per worker process: request and token budgets per
+# minute (0 = unlimited), concurrent calls, and per-priority queue depth and
+# wait limits beyond which clients get 429 with Retry-After.
+RAG_LLM_REQUESTS_PER_MINUTE = int(os.environ.get('RAG_LLM_REQUESTS_PER_MINUTE', 60))
+RAG_LLM_TOKENS_PER_MINUTE = int(os.environ.get('RAG_LLM_TOKENS_PER_MINUTE', 250000))
+RAG_LLM_MAX_IN_FLIGHT = 8
+RAG_LLM_MAX_QUEUE = {'interactive': 32, 'batch': 128}
+RAG_LLM_MAX_WAIT_SECONDS = {'interactive': 20, 'batch': 120}
+# Send LLM calls over plain HTTP to a Gemini-compatible server instead of the SDK,
+# e.g. `manage.py fake_gemini` during load tests
+RAG_LLM_BASE_URL = os.environ.get('RAG_LLM_BASE_URL', '')
+RAG_LLM_TIMEOUT = (5, 60)  # (connect, read) seconds
+# Multi-question prompts for HackRx batches: questions whose retrieved excerpts overlap
+# by at least RAG_LLM_BATCH_MIN_OVERLAP share one call, up to RAG_LLM_BATCH_QUESTIONS
+# questions and RAG_LLM_BATCH_MAX_EXCERPTS distinct excerpts. 1 question disables packing.
+RAG_LLM_BATCH_QUESTIONS = 5
+RAG_LLM_BATCH_MIN_OVERLAP = 0.5
+RAG_LLM_BATCH_MAX_EXCERPTS = 8
+
+# Metrics endpoint (/rag/metrics/) is only served to these client addresses
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# On-demand profiling of the RAG views. A request is profiled when it sends
+# "X-RAG-Profile: 1" (or ?profile=1) together with "X-RAG-Profile-Token" or a
+# staff user's session or bearer token, or when it is picked by the sample rate.
+# Profiles land in RAG_PROFILE_DIR, outside MEDIA_ROOT.
+RAG_PROFILING_TOKEN = os.environ.get('RAG_PROFILING_TOKEN', '')
+RAG_PROFILE_SAMPLE_RATE = float(os.environ.get('RAG_PROFILE_SAMPLE_RATE', '0'))
+RAG_PROFILE_DIR = os.environ.get('RAG_PROFILE_DIR', str(BASE_DIR / '.profiles'))
+RAG_PROFILE_TOP_N = 25
+
+# Request tracing of the RAG views: a span tree per request (download, extract, chunk,
+# embed, search, prompt_build, llm...) with the trace id in the X-RAG-Trace-Id header.
+# A RAG_TRACE_SAMPLE_RATE share of traces is written span by span to
+# RAG_TRACE_DIR/traces-<pid>.jsonl; requests slower than RAG_TRACE_SLOW_MS are always
+# written whole to slow-<pid>.jsonl. Files rotate at RAG_TRACE_MAX_BYTES. Traces hold
+# chat ids and document names, so they are kept out of MEDIA_ROOT.
+RAG_TRACE_ENABLED = os.environ.get('RAG_TRACE_ENABLED', '1') == '1'
+RAG_TRACE_DIR = os.environ.get('RAG_TRACE_DIR', str(BASE_DIR / '.traces'))
+RAG_TRACE_SAMPLE_RATE = float(os.environ.get('RAG_TRACE_SAMPLE_RATE', '0.01'))
+RAG_TRACE_SLOW_MS = int(os.environ.get('RAG_TRACE_SLOW_MS', 2000))
+RAG_TRACE_MAX_BYTES = 20 * 1024 * 1024
+RAG_TRACE_BACKUPS = 5
+RAG_TRACE_MAX_SPANS = 2000
+
+# Conversation memory sent with chat queries: the last RAG_MEMORY_TURNS turns
+# verbatim, older messages folded into a stored summary in batches; at most
+# RAG_MEMORY_SUMMARY_CALLS summary calls per query, none for
+# RAG_MEMORY_SUMMARY_BACKOFF seconds after one fails.
+RAG_MEMORY_TURNS = 4
+RAG_MEMORY_SUMMARY_BATCH = 6
+RAG_MEMORY_SUMMARY_CALLS = 3
+RAG_MEMORY_SUMMARY_BACKOFF = 60
+RAG_MEMORY_SUMMARY_CHARS = 2000
+RAG_MEMORY_MESSAGE_CHARS = 1000
@@ -0,0 +1,36 @@
+# Gunicorn settings, picked up automatically when gunicorn is started from this directory:
+#
+#   gunicorn backend.wsgi:application
+#
+# RAG_PRELOAD=1 (the default) loads the models and indexes once in the master and
+# shares them copy-on-write with the workers; RAG_PRELOAD=0 restores the layout where
+# every worker loads its own copy. RAG_TORCH_THREADS pins the inference threads per
+# worker (default: CPU count divided by the number of workers).
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = os.environ.get("RAG_PRELOAD", "1") == "1"
+
+
+def on_starting(server):
+    # Runs in the master after the app is imported (with preload_app) and before forking
+    if server.cfg.preload_app:
+        from rag.preload import preload_models
+        preload_models()
+        server.log.info("Preloaded RAG models for copy-on-write sharing")
+
+
+def post_fork(server, worker):
+    from rag.preload import set_inference_threads, threads_per_worker
+    threads = threads_per_worker(server.cfg.workers)
+    set_inference_threads(threads)
+    server.log.info(f"Worker {worker.pid}: {threads} inference threads")
+
+
+def post_worker_init(worker):
+    # Without preload_app each worker loads the app itself and fills its own hot tier
+    if not worker.cfg.preload_app:
+        from rag.views import preload_hot_chats
+        preload_hot_chats()
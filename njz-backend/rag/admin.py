@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Chat, KnowledgeGraph
+from .models import Chat, ChatMessage, KnowledgeGraph
 
 admin.site.register(Chat)
+admin.site.register(ChatMessage)
 admin.site.register(KnowledgeGraph)
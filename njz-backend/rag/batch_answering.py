@@ -0,0 +1,108 @@
+import json
+import re
+from typing import Dict, List, Sequence
+
+from .metrics import counter
+
+PACKED_QUESTIONS = counter(
+    "rag_llm_packed_questions_total",
+    "Questions answered through multi-question prompts, by outcome (answered, fallback).",
+    ["result"],
+)
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_NUMBERED_LINE = re.compile(r"^\s*(?:Q(?:uestion)?\s*)?(\d+)\s*[\).:\-]\s*(.+?)\s*$", re.IGNORECASE)
+
+
+def group_by_overlap(contexts: Sequence[Sequence[int]], max_questions: int = 5,
+                     min_overlap: float = 0.5, max_excerpts: int = 12) -> List[List[int]]:
+    """
+    Greedily pack questions whose retrieved chunk ids overlap into shared prompts.
+    A question joins the open group holding the largest share of its chunks, if that
+    share is at least `min_overlap` and the group stays within `max_questions` and
+    `max_excerpts` distinct chunks; otherwise it opens a group of its own. Returns
+    groups of question positions, each in question order.
+    """
+    groups: List[List[int]] = []
+    chunks: List[set] = []
+    for i, context in enumerate(contexts):
+        ids = set(context)
+        best, best_share = None, 0.0
+        for g, members in enumerate(groups):
+            if len(members) >= max_questions or len(chunks[g] | ids) > max_excerpts:
+                continue
+            share = len(chunks[g] & ids) / len(ids) if ids else 0.0
+            if share > best_share:
+                best, best_share = g, share
+        if best is not None and best_share >= min_overlap:
+            groups[best].append(i)
+            chunks[best] |= ids
+        else:
+            groups.append([i])
+            chunks.append(ids)
+    return groups
+
+
+def build_batch_prompt(questions: Sequence[str], excerpts: Sequence[str]) -> str:
+    """One prompt for several questions; shared excerpts appear once."""
+    numbered = "\n".join(f"{n}. {q}" for n, q in enumerate(questions, 1))
+    return (
+        "You are an expert assistant. Use the following document excerpts to answer each question precisely. "
+        "Keep every answer to **one line strictly**, plain text without markdown.\n\n"
+        "Excerpts:\n" + "\n---\n".join(excerpts) + "\n\n"
+        "Questions:\n" + numbered + "\n\n"
+        'Reply with JSON only, in the form {"answers": [{"id": 1, "answer": "..."}, ...]}, '
+        "with one entry per question number."
+    )
+
+
+def _json_payload(text: str):
+    text = _FENCE.sub("", text.strip())
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return None
+    start = min(starts)
+    end = text.rfind("}" if text[start] == "{" else "]")
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+
+def parse_batch_answers(text: str, count: int) -> Dict[int, str]:
+    """
+    Answers by question number (1-based) from a multi-question reply. Accepts the
+    requested {"answers": [{"id", "answer"}]} shape, a bare list (by id or by
+    position), a {"1": "..."} mapping, or, when the reply is not JSON at all,
+    numbered lines. Numbers out of range and empty answers are dropped, so the
+    caller can re-ask whatever is missing.
+    """
+    answers: Dict[int, str] = {}
+    payload = _json_payload(text)
+    if isinstance(payload, dict) and "answers" in payload:
+        payload = payload["answers"]
+    if isinstance(payload, list):
+        for position, item in enumerate(payload, 1):
+            if isinstance(item, dict):
+                number = item.get("id", item.get("question", position))
+                answer = item.get("answer")
+            else:
+                number, answer = position, item
+            try:
+                answers.setdefault(int(number), answer)
+            except (TypeError, ValueError):
+                continue
+    elif isinstance(payload, dict):
+        for number, answer in payload.items():
+            if str(number).isdigit():
+                answers.setdefault(int(number), answer)
+    else:
+        for line in text.splitlines():
+            match = _NUMBERED_LINE.match(line)
+            if match:
+                answers.setdefault(int(match.group(1)), match.group(2))
+    return {
+        number: answer.strip()
+        for number, answer in answers.items()
+        if 1 <= number <= count and isinstance(answer, str) and answer.strip()
+    }
@@ -0,0 +1,195 @@
+import json
+import math
+import os
+import platform
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+# ========== SYNTHETIC DOCUMENTS ==========
+_WORDS = (
+    "policy insured premium coverage claim hospital benefit period waiting "
+    "deductible sum assured renewal exclusion treatment accident illness "
+    "maternity daycare ambulance room rent co-payment network provider "
+    "cashless reimbursement grace nominee proposal disclosure endorsement "
+    "the a of to and in for with under any shall be is are not by from"
+).split()
+
+
+def synthetic_text(words: int, rng: random.Random) -> str:
+    """Generate policy-like prose with sentence boundaries for spaCy."""
+    sentences = []
+    written = 0
+    while written < words:
+        n = rng.randint(8, 24)
+        sentence = " ".join(rng.choice(_WORDS) for _ in range(n))
+        sentences.append(sentence.capitalize() + ".")
+        written += n
+    return " ".join(sentences)
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_synthetic_pdf(path: str, pages: int, words_per_page: int = 350, seed: int = 0) -> str:
+    """
+    Write a plain-text PDF with the given number of pages.
+    Generated by hand so benchmarks need nothing beyond pypdf to read it back.
+    """
+    rng = random.Random(seed)
+    font_id = 3
+    objects = {
+        1: "<< /Type /Catalog /Pages 2 0 R >>",
+        font_id: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    next_id = 4
+    for _ in range(pages):
+        words = synthetic_text(words_per_page, rng).split()
+        lines = [" ".join(words[i:i + 14]) for i in range(0, len(words), 14)]
+        body = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(
+            f"({_pdf_escape(line)}) '" for line in lines
+        ) + " ET"
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        objects[content_id] = f"<< /Length {len(body.encode('latin-1'))} >>\nstream\n{body}\nendstream"
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        kids.append(f"{page_id} 0 R")
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += f"{obj_id} 0 obj\n{objects[obj_id]}\nendobj\n".encode("latin-1")
+    xref_at = len(out)
+    size = max(objects) + 1
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode("latin-1")
+    for obj_id in range(1, size):
+        out += f"{offsets[obj_id]:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
+
+
+# ========== FAKE LLM ==========
+class FakeGeminiResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Drop-in stand-in for genai.GenerativeModel with a fixed latency."""
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, prompt, *args, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeGeminiResponse(f"Stub answer for a {len(prompt)} character prompt.")
+
+
+# ========== HTTP LOAD ==========
+def run_closed_loop(requests_mix, concurrency: int, duration: float) -> dict:
+    """
+    `concurrency` threads each send the (method, url, kwargs) requests of
+    `requests_mix` in turn, back to back, for `duration` seconds.
+    """
+    import requests
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(offset):
+        session = requests.Session()
+        i = offset
+        local_latencies, local_errors = [], 0
+        while time.perf_counter() < deadline:
+            method, url, kwargs = requests_mix[i % len(requests_mix)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, timeout=30, **kwargs)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            local_latencies.append((time.perf_counter() - start) * 1000)
+            local_errors += 0 if ok else 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = len(latencies)
+    return {
+        "requests": total,
+        "requests_per_sec": total / elapsed if elapsed else 0.0,
+        "error_rate": sum(errors) / total if total else 0.0,
+        "latency": percentiles(latencies),
+    }
+
+
+# ========== STATISTICS & RESULTS ==========
+def percentiles(samples: List[float], points=(50, 95, 99), suffix: str = "_ms") -> Dict[str, float]:
+    """Nearest-rank percentiles, in the same unit as the samples."""
+    if not samples:
+        return {f"p{p}{suffix}": 0.0 for p in points}
+    ordered = sorted(samples)
+    result = {}
+    for p in points:
+        rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+        result[f"p{p}{suffix}"] = ordered[rank]
+    return result
+
+
+def environment_info() -> dict:
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_results(results: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+def compare_results(current: dict, baseline: dict, tolerance: float = 0.10, prefix: str = "") -> List[str]:
+    """
+    Walk both result trees and report metrics that moved the wrong way by more
+    than `tolerance`. Keys ending in "_per_sec" are higher-is-better, keys ending
+    in "_ms" are lower-is-better; anything else is ignored.
+    """
+    regressions = []
+    for key, value in current.items():
+        if key not in baseline:
+            continue
+        name = f"{prefix}{key}"
+        old = baseline[key]
+        if isinstance(value, dict) and isinstance(old, dict):
+            regressions.extend(compare_results(value, old, tolerance, prefix=f"{name}."))
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            if key.endswith("_per_sec") and value < old * (1 - tolerance):
+                regressions.append(f"{name}: {old:.2f} -> {value:.2f}")
+            elif key.endswith("_ms") and value > old * (1 + tolerance):
+                regressions.append(f"{name}: {old:.2f} -> {value:.2f}")
+    return regressions
@@ -0,0 +1,244 @@
+import fcntl
+import json
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Files of a chunk store, all sharing one base path
+OFFSETS_SUFFIX = ".offsets.npy"      # int64[n + 1], byte offsets of each chunk in the text blob
+TEXT_SUFFIX = ".text"                # UTF-8 chunk texts, back to back
+SOURCE_IDS_SUFFIX = ".source_ids.npy"  # int32[n], index into the sources list
+CHUNK_IDS_SUFFIX = ".chunk_ids.npy"    # int32[n], chunk number within its source
+SOURCES_SUFFIX = ".sources.json"     # interned source names
+LOCK_SUFFIX = ".lock"                # flock'ed by writers, see store_lock
+
+
+class ChunkStore:
+    """
+    Columnar chunk metadata: an offsets array and one text blob, plus interned source
+    ids. Everything is memory-mapped, so opening a store costs the same for ten chunks
+    or ten million, and only the chunks that are looked up are ever decoded.
+
+    Indexing gives the same {"source", "chunk_id", "chunk_text"} dicts as the JSON
+    metadata lists it replaces.
+    """
+
+    def __init__(self, offsets, text, source_ids, chunk_ids, sources: List[str]):
+        self.offsets = offsets
+        self.text_blob = text
+        self.source_ids = source_ids
+        self.chunk_ids = chunk_ids
+        self.sources = sources
+        self._source_ranges = None
+
+    @classmethod
+    def empty(cls) -> "ChunkStore":
+        return cls(np.zeros(1, dtype=np.int64), b"", np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), [])
+
+    @staticmethod
+    def exists(base: str) -> bool:
+        return os.path.exists(base + OFFSETS_SUFFIX)
+
+    @classmethod
+    def open(cls, base: str) -> "ChunkStore":
+        offsets = np.load(base + OFFSETS_SUFFIX, mmap_mode="r")
+        source_ids = np.load(base + SOURCE_IDS_SUFFIX, mmap_mode="r")
+        chunk_ids = np.load(base + CHUNK_IDS_SUFFIX, mmap_mode="r")
+        with open(base + SOURCES_SUFFIX, "r", encoding="utf-8") as f:
+            sources = json.load(f)
+        text = b""
+        if offsets[-1] > 0:
+            with open(base + TEXT_SUFFIX, "rb") as f:
+                # The mapping stays valid after the file object is closed
+                text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(offsets, text, source_ids, chunk_ids, sources)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _position(self, i: int) -> int:
+        n = len(self)
+        i = int(i)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("chunk index out of range")
+        return i
+
+    def text(self, i: int) -> str:
+        i = self._position(i)
+        return self.text_blob[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8")
+
+    def source(self, i: int) -> str:
+        return self.sources[int(self.source_ids[self._position(i)])]
+
+    def source_ranges(self) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        [start, end) chunk id ranges of each source. The chunks of one upload are
+        appended together, so a source is normally a single range; computed once
+        per open store from the source id column.
+        """
+        if self._source_ranges is None:
+            ids = np.asarray(self.source_ids[:len(self)])
+            ranges: Dict[str, List[Tuple[int, int]]] = {}
+            if len(ids):
+                bounds = np.concatenate([[0], np.flatnonzero(np.diff(ids)) + 1, [len(ids)]])
+                for start, end in zip(bounds[:-1], bounds[1:]):
+                    ranges.setdefault(self.sources[int(ids[start])], []).append((int(start), int(end)))
+            self._source_ranges = ranges
+        return self._source_ranges
+
+    def __getitem__(self, i: int) -> dict:
+        i = self._position(i)
+        return {"source": self.source(i), "chunk_id": int(self.chunk_ids[i]), "chunk_text": self.text(i)}
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+# ========== LOCKING ==========
+_held_locks = threading.local()
+
+
+@contextmanager
+def store_lock(base: str):
+    """
+    Lock the store at `base` against writers in other threads and processes (an
+    flock on `<base>.lock`). Appending reads the committed length and writes past
+    it, so writers must hold it from reading that length until the offsets are
+    committed. Re-entering in the same thread is a no-op.
+    """
+    base = os.path.abspath(base)
+    held = getattr(_held_locks, "bases", None)
+    if held is None:
+        held = _held_locks.bases = set()
+    if base in held:
+        yield
+        return
+    with open(base + LOCK_SUFFIX, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        held.add(base)
+        try:
+            yield
+        finally:
+            held.discard(base)
+            # Closing the file releases the lock
+
+
+# ========== WRITING ==========
+def _save_array_atomic(path: str, array: np.ndarray):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _save_sources_atomic(path: str, sources: List[str]):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(sources, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _encode(entries: Iterable[dict], sources: List[str], start: int):
+    lookup = {name: i for i, name in enumerate(sources)}
+    texts, source_ids, chunk_ids, ends = [], [], [], []
+    end = start
+    for entry in entries:
+        data = entry["chunk_text"].encode("utf-8")
+        texts.append(data)
+        end += len(data)
+        ends.append(end)
+        source = entry["source"]
+        if source not in lookup:
+            lookup[source] = len(sources)
+            sources.append(source)
+        source_ids.append(lookup[source])
+        chunk_ids.append(entry["chunk_id"])
+    return (b"".join(texts), np.asarray(ends, dtype=np.int64),
+            np.asarray(source_ids, dtype=np.int32), np.asarray(chunk_ids, dtype=np.int32))
+
+
+def _commit(base, offsets, source_ids, chunk_ids, sources, before_commit: Optional[Callable[[], None]] = None):
+    # The offsets array is replaced last: until then readers see the previous chunk count
+    _save_sources_atomic(base + SOURCES_SUFFIX, sources)
+    _save_array_atomic(base + SOURCE_IDS_SUFFIX, source_ids)
+    _save_array_atomic(base + CHUNK_IDS_SUFFIX, chunk_ids)
+    if before_commit is not None:
+        before_commit()
+    _save_array_atomic(base + OFFSETS_SUFFIX, offsets)
+
+
+def write_chunk_store(base: str, entries: Iterable[dict], before_commit: Optional[Callable[[], None]] = None):
+    """
+    Write `entries` ({"source", "chunk_id", "chunk_text"} dicts) as a new store.
+    `before_commit` runs once everything but the offsets is written.
+    """
+    sources: List[str] = []
+    text, ends, source_ids, chunk_ids = _encode(entries, sources, 0)
+    tmp = f"{base}{TEXT_SUFFIX}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(text)
+    os.replace(tmp, base + TEXT_SUFFIX)
+    _commit(base, np.concatenate([np.zeros(1, dtype=np.int64), ends]), source_ids, chunk_ids, sources,
+            before_commit)
+
+
+def append_chunk_store(base: str, entries: Iterable[dict], before_commit: Optional[Callable[[], None]] = None):
+    """
+    Append to an existing store without rewriting its text: new texts go after the
+    last committed offset and only the small columns are rewritten. `before_commit`
+    runs after the new rows are written but before the offsets that make them
+    visible, e.g. to save the index that points at them. Callers hold store_lock.
+    """
+    if not ChunkStore.exists(base):
+        write_chunk_store(base, entries, before_commit)
+        return
+    store = ChunkStore.open(base)
+    start = int(store.offsets[-1])
+    sources = list(store.sources)
+    text, ends, source_ids, chunk_ids = _encode(entries, sources, start)
+    mode = "r+b" if os.path.exists(base + TEXT_SUFFIX) else "wb"
+    with open(base + TEXT_SUFFIX, mode) as f:
+        # Drop anything past the last committed offset, left by an interrupted append
+        f.seek(start)
+        f.write(text)
+        f.truncate()
+    _commit(
+        base,
+        np.concatenate([np.asarray(store.offsets), ends]),
+        # Columns may run past the offsets after an interrupted append or a truncation
+        np.concatenate([np.asarray(store.source_ids[:len(store)]), source_ids]),
+        np.concatenate([np.asarray(store.chunk_ids[:len(store)]), chunk_ids]),
+        sources,
+        before_commit,
+    )
+
+
+def truncate_chunk_store(base: str, length: int):
+    """
+    Drop the chunks past the first `length`. Only the offsets are shortened; the
+    stale texts and column entries are overwritten by the next append.
+    """
+    store = ChunkStore.open(base)
+    if length < len(store):
+        _save_array_atomic(base + OFFSETS_SUFFIX, np.asarray(store.offsets[:length + 1]))
+
+
+def load_chunk_store(base: str, legacy_json_path: Optional[str] = None) -> ChunkStore:
+    """
+    Open the store at `base`. A metadata JSON list from before the store existed is
+    converted once on first load; the JSON file is left in place but no longer read.
+    """
+    if ChunkStore.exists(base):
+        return ChunkStore.open(base)
+    if legacy_json_path and os.path.exists(legacy_json_path):
+        with open(legacy_json_path, "r", encoding="utf-8") as f:
+            write_chunk_store(base, json.load(f))
+        return ChunkStore.open(base)
+    return ChunkStore.empty()
@@ -0,0 +1,128 @@
+"""
+Chunk embedding for ingestion. Texts are sorted by length and cut into batches,
+so a batch pads to roughly its own length rather than to the longest chunk of the
+upload, and with `processes` > 0 the batches are spread over a pool of worker
+processes, each holding its own model with a pinned number of torch threads.
+Vectors always come back in the order of the input texts.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# ========== WORKER PROCESS ==========
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+
+    from .preload import set_inference_threads
+
+    set_inference_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(texts, batch_size=len(texts), convert_to_numpy=True).astype("float32")
+
+
+def _warm_up(_):
+    # Long enough that every worker, not just the first one ready, picks up a task
+    time.sleep(0.05)
+    return os.getpid()
+
+
+# ========== BATCHING ==========
+def length_sorted_batches(texts: Sequence[str], batch_size: int) -> List[np.ndarray]:
+    """Positions of `texts` in batches of similar length, longest batches first."""
+    order = np.argsort([-len(text) for text in texts], kind="stable")
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+# ========== ENGINE ==========
+class EmbeddingEngine:
+    """
+    Drop-in for `SentenceTransformer.encode` in the ingestion paths. With
+    processes=0 batches are encoded in this process with `model`; otherwise the
+    pool is started on first use (never at import, so gunicorn can fork safely)
+    with `threads_per_process` torch threads per worker, by default the CPU count
+    divided by the number of processes.
+    """
+
+    def __init__(self, model=None, model_name: Optional[str] = None, processes: int = 0,
+                 threads_per_process: Optional[int] = None, batch_size: int = 64, dimension: int = 0):
+        if not processes and model is None:
+            raise ValueError("An in-process engine needs a model")
+        if processes and not model_name:
+            raise ValueError("A multi-process engine needs a model name to load in its workers")
+        self.model = model
+        self.model_name = model_name
+        self.processes = processes
+        self.threads_per_process = threads_per_process or max(1, (os.cpu_count() or 1) // max(1, processes))
+        self.batch_size = batch_size
+        self.dimension = dimension
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def feed_size(self) -> int:
+        """Texts per encode() call that keep every worker busy."""
+        return self.batch_size * max(1, self.processes) * 2
+
+    def start(self) -> "EmbeddingEngine":
+        with self._lock:
+            if self.processes and self._pool is None:
+                self._start_pool()
+        return self
+
+    def _start_pool(self):
+        # spawn: forking a process that already ran torch can deadlock its thread pools
+        pool = ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(self.model_name, self.threads_per_process),
+        )
+        # Wait for every worker to load its model now rather than inside the first batch
+        ready = set()
+        while len(ready) < self.processes:
+            ready.update(pool.map(_warm_up, range(self.processes * 2)))
+        self._pool = pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def encode(self, sentences: Sequence[str], batch_size: Optional[int] = None, convert_to_numpy: bool = True,
+               **kwargs) -> np.ndarray:
+        """
+        float32 vectors of `sentences`, in input order. `batch_size` is accepted for
+        compatibility with SentenceTransformer.encode; the engine's own batch size
+        is used.
+        """
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        if not len(sentences):
+            return np.zeros((0, self.dimension), dtype="float32")
+        batches = length_sorted_batches(sentences, self.batch_size)
+        if self.processes:
+            self.start()
+            results = self._pool.map(_encode_batch, [[sentences[i] for i in batch] for batch in batches])
+        else:
+            results = (
+                self.model.encode([sentences[i] for i in batch], batch_size=len(batch),
+                                  convert_to_numpy=True).astype("float32")
+                for batch in batches
+            )
+        out = None
+        for batch, vecs in zip(batches, results):
+            if out is None:
+                out = np.empty((len(sentences), vecs.shape[1]), dtype="float32")
+            out[batch] = vecs
+        return out
@@ -0,0 +1,36 @@
+from django.conf import settings
+
+from .llm_scheduler import LLMBusy
+from .transfer import HTTP_SESSION
+
+
+class GeminiResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class GeminiRESTModel:
+    """
+    Minimal generateContent client over plain HTTP with the pooled session. Used in
+    place of the SDK model when RAG_LLM_BASE_URL points at a Gemini-compatible
+    server, such as the `fake_gemini` stand-in used for load tests. An upstream 429
+    surfaces as LLMBusy so clients see the same backpressure as from the scheduler.
+    """
+
+    def __init__(self, base_url: str, model_name: str, api_key: str = ""):
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model_name}:generateContent"
+        self.api_key = api_key
+
+    def generate_content(self, prompt: str) -> GeminiResponse:
+        response = HTTP_SESSION.post(
+            self.url,
+            json={"contents": [{"role": "user", "parts": [{"text": prompt}]}]},
+            params={"key": self.api_key} if self.api_key else None,
+            timeout=getattr(settings, "RAG_LLM_TIMEOUT", (5, 60)),
+        )
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After", "1")
+            raise LLMBusy("Upstream LLM rate limit", int(retry_after) if retry_after.isdigit() else 1)
+        response.raise_for_status()
+        parts = response.json()["candidates"][0]["content"]["parts"]
+        return GeminiResponse("".join(part.get("text", "") for part in parts))
@@ -0,0 +1,278 @@
+"""
+Per-chat knowledge graph of named entities that co-occur in a sentence.
+
+Uploads count entity mentions and co-occurring pairs on the spaCy docs already
+parsed for chunking, so NER runs once per page, and add the counts to a SQLite
+file in the chat directory with one bulk upsert per table, so ingesting a document
+costs one transaction however many relations it holds. Text that was not parsed
+that way goes through `nlp.pipe` with only the components NER and sentence
+boundaries need. Edges are stored in both directions and indexed by (src, weight, dst): the
+neighbours of an entity, heaviest first, are one index range scan. Triggers keep
+the number of entities and edges in `totals`, so reading them is not a scan.
+"""
+import itertools
+import os
+import sqlite3
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+GRAPH_FILE = "graph.sqlite3"
+# Components kept for extraction; tagger, lemmatizer etc. do not affect entities
+_NER_PIPES = ("tok2vec", "ner", "parser", "senter", "sentencizer", "entity_ruler")
+# Numbers carry no meaning as graph nodes
+IGNORED_LABELS = frozenset({"CARDINAL", "ORDINAL"})
+MAX_DEPTH = 2
+
+Entity = Tuple[str, str]  # (name, label)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    label TEXT NOT NULL,
+    mentions INTEGER NOT NULL,
+    UNIQUE (name, label)
+);
+CREATE INDEX IF NOT EXISTS entities_by_mentions ON entities (mentions, id);
+CREATE TABLE IF NOT EXISTS edges (
+    src INTEGER NOT NULL,
+    dst INTEGER NOT NULL,
+    weight INTEGER NOT NULL,
+    PRIMARY KEY (src, dst)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edges_by_weight ON edges (src, weight, dst);
+CREATE TABLE IF NOT EXISTS totals (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS count_entities AFTER INSERT ON entities
+BEGIN UPDATE totals SET value = value + 1 WHERE name = 'entities'; END;
+CREATE TRIGGER IF NOT EXISTS count_edges AFTER INSERT ON edges
+BEGIN UPDATE totals SET value = value + 1 WHERE name = 'edges'; END;
+"""
+
+
+# ========== EXTRACTION ==========
+class CooccurrenceCounts:
+    """
+    Entity mentions and sentence-level co-occurrences of a set of chunks. A
+    sentence is counted once, so the overlap repeated at the start of each chunk
+    is not counted twice, and contributes at most `max_entities` distinct
+    entities, which bounds its pairs.
+    """
+
+    def __init__(self, max_entities: int = 12):
+        self.max_entities = max_entities
+        self.mentions: Counter = Counter()
+        self.pairs: Counter = Counter()
+        self._seen_sentences = set()
+
+    def add_doc(self, doc):
+        sentences = doc.sents if doc.has_annotation("SENT_START") else [doc[:]]
+        for sent in sentences:
+            key = sent.text.strip()
+            if not sent.ents or key in self._seen_sentences:
+                continue
+            self._seen_sentences.add(key)
+            entities = []
+            for ent in sent.ents:
+                name = " ".join(ent.text.split())
+                entity = (name, ent.label_)
+                if name and ent.label_ not in IGNORED_LABELS and entity not in entities:
+                    entities.append(entity)
+            entities = entities[:self.max_entities]
+            self.mentions.update(entities)
+            self.pairs.update(itertools.combinations(sorted(entities), 2))
+
+
+def extract_cooccurrences(texts: Iterable[str], nlp, batch_size: int = 64, max_entities: int = 12) -> CooccurrenceCounts:
+    counts = CooccurrenceCounts(max_entities=max_entities)
+    disable = [name for name in nlp.pipe_names if name not in _NER_PIPES]
+    for doc in nlp.pipe(texts, batch_size=batch_size, disable=disable):
+        counts.add_doc(doc)
+    return counts
+
+
+# ========== STORE ==========
+class GraphStore:
+    """
+    The knowledge graph of one chat, in `<chat dir>/graph.sqlite3`. With
+    `read_only` the file must exist and is opened without creating or changing
+    anything, as the read views do.
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        if read_only:
+            self.conn = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True,
+                                        timeout=30, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.has_totals = bool(self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'totals'").fetchone())
+        if read_only:
+            return
+        # Readers keep working while an upload writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        if not self.has_totals:
+            # New file, or one written before totals were kept: count once
+            with self.conn:
+                self.conn.execute("INSERT OR IGNORE INTO totals SELECT 'entities', COUNT(*) FROM entities")
+                self.conn.execute("INSERT OR IGNORE INTO totals SELECT 'edges', COUNT(*) FROM edges")
+            self.has_totals = True
+
+    @classmethod
+    def for_chat_dir(cls, chat_dir: str, read_only: bool = False) -> "GraphStore":
+        return cls(os.path.join(chat_dir, GRAPH_FILE), read_only=read_only)
+
+    @staticmethod
+    def exists(chat_dir: str) -> bool:
+        return os.path.exists(os.path.join(chat_dir, GRAPH_FILE))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, counts: CooccurrenceCounts) -> Dict[str, int]:
+        """Add mention and co-occurrence counts in one transaction."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO entities (name, label, mentions) VALUES (?, ?, ?) "
+                "ON CONFLICT (name, label) DO UPDATE SET mentions = mentions + excluded.mentions",
+                [(name, label, n) for (name, label), n in counts.mentions.items()],
+            )
+            ids = self._ids(counts.mentions)
+            rows = []
+            for (a, b), n in counts.pairs.items():
+                rows.append((ids[a], ids[b], n))
+                rows.append((ids[b], ids[a], n))
+            self.conn.executemany(
+                "INSERT INTO edges (src, dst, weight) VALUES (?, ?, ?) "
+                "ON CONFLICT (src, dst) DO UPDATE SET weight = weight + excluded.weight",
+                rows,
+            )
+        return {"entities": len(counts.mentions), "relations": len(counts.pairs)}
+
+    def _ids(self, entities: Iterable[Entity]) -> Dict[Entity, int]:
+        wanted = set(entities)
+        names = sorted({name for name, _ in wanted})
+        ids = {}
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(names), 500):
+            batch = names[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT id, name, label FROM entities WHERE name IN ({','.join('?' * len(batch))})", batch
+            )
+            for row in rows:
+                entity = (row["name"], row["label"])
+                if entity in wanted:
+                    ids[entity] = row["id"]
+        return ids
+
+    def stats(self) -> Dict[str, int]:
+        if not self.has_totals:
+            # Opened read-only before an upload added the totals table
+            totals = {name: self.conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+                      for name in ("entities", "edges")}
+            return {"entities": totals["entities"], "relations": totals["edges"] // 2}
+        totals = dict(self.conn.execute("SELECT name, value FROM totals").fetchall())
+        return {"entities": totals.get("entities", 0), "relations": totals.get("edges", 0) // 2}
+
+    # ========== READS ==========
+    # Pages are keyset-paginated from the heaviest row down; a cursor is the
+    # (count, id) of the last row of the previous page.
+    def entities(self, limit: int, cursor: Optional[Tuple[int, int]] = None) -> Tuple[List[dict], Optional[Tuple[int, int]]]:
+        """Entities by mention count, most mentioned first."""
+        sql = "SELECT id, name, label, mentions FROM entities"
+        params: list = []
+        if cursor is not None:
+            sql += " WHERE (mentions, id) < (?, ?)"
+            params.extend(cursor)
+        rows = self.conn.execute(sql + " ORDER BY mentions DESC, id DESC LIMIT ?", params + [limit + 1]).fetchall()
+        page = [dict(row) for row in rows[:limit]]
+        next_cursor = (page[-1]["mentions"], page[-1]["id"]) if len(rows) > limit else None
+        return page, next_cursor
+
+    def find(self, name: str, label: Optional[str] = None) -> List[dict]:
+        name = " ".join(name.split())
+        sql = "SELECT id, name, label, mentions FROM entities WHERE name = ?"
+        params = [name]
+        if label:
+            sql += " AND label = ?"
+            params.append(label)
+        return [dict(row) for row in self.conn.execute(sql + " ORDER BY mentions DESC", params)]
+
+    def neighbours(self, entity_id: int, limit: int,
+                   cursor: Optional[Tuple[int, int]] = None) -> Tuple[List[dict], Optional[Tuple[int, int]]]:
+        """Neighbours of an entity with their edge weight, heaviest first."""
+        sql = "SELECT dst, weight FROM edges WHERE src = ?"
+        params: list = [entity_id]
+        if cursor is not None:
+            sql += " AND (weight, dst) < (?, ?)"
+            params.extend(cursor)
+        rows = self.conn.execute(sql + " ORDER BY weight DESC, dst DESC LIMIT ?", params + [limit + 1]).fetchall()
+        page = [{"id": row["dst"], "weight": row["weight"]} for row in rows[:limit]]
+        next_cursor = (page[-1]["weight"], page[-1]["id"]) if len(rows) > limit else None
+        return page, next_cursor
+
+    def neighbourhood(self, entity_id: int, limit: int, cursor: Optional[Tuple[int, int]] = None,
+                      depth: int = 1, fanout: int = 10) -> Tuple[dict, Optional[Tuple[int, int]]]:
+        """
+        One page of an entity's neighbours and, for depth 2, up to `fanout` of each
+        of their own neighbours: at most limit * (fanout + 1) edges per page.
+        Returns {"nodes", "edges"} and the cursor of the next page.
+        """
+        page, next_cursor = self.neighbours(entity_id, limit, cursor)
+        edges = [{"source": entity_id, "target": n["id"], "weight": n["weight"]} for n in page]
+        if min(depth, MAX_DEPTH) > 1:
+            # Edges are undirected: one between two neighbours is listed once
+            seen = set()
+            for n in page:
+                second, _ = self.neighbours(n["id"], fanout)
+                for m in second:
+                    pair = frozenset((n["id"], m["id"]))
+                    if m["id"] != entity_id and pair not in seen:
+                        seen.add(pair)
+                        edges.append({"source": n["id"], "target": m["id"], "weight": m["weight"]})
+        node_ids = {entity_id}
+        node_ids.update(edge["target"] for edge in edges)
+        return {"nodes": self._nodes(node_ids), "edges": edges}, next_cursor
+
+    def _nodes(self, ids: Sequence[int]) -> List[dict]:
+        ids = sorted(ids)
+        nodes = []
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT id, name, label, mentions FROM entities WHERE id IN ({','.join('?' * len(batch))})", batch
+            )
+            nodes.extend(dict(row) for row in rows)
+        return nodes
+
+
+def add_to_graph(chat_dir: str, counts_by_source: Dict[str, CooccurrenceCounts]) -> Dict[str, int]:
+    """Add the counts of newly ingested sources to the chat's graph; returns the entities and relations added."""
+    added = Counter()
+    with GraphStore.for_chat_dir(chat_dir) as store:
+        for counts in counts_by_source.values():
+            added.update(store.add(counts))
+    return dict(added)
+
+
+def parse_cursor(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """'<count>.<id>' from a next link; ValueError if malformed."""
+    if not value:
+        return None
+    count, _, entity_id = value.partition(".")
+    return int(count), int(entity_id)
+
+
+def format_cursor(cursor: Tuple[int, int]) -> str:
+    return f"{cursor[0]}.{cursor[1]}"
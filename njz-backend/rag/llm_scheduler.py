@@ -0,0 +1,180 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .metrics import counter, gauge, histogram
+
+INTERACTIVE, BATCH = "interactive", "batch"
+PRIORITIES = (INTERACTIVE, BATCH)  # highest first
+
+QUEUE_WAIT_SECONDS = histogram(
+    "rag_llm_queue_wait_seconds", "Time LLM calls waited for the scheduler, by priority.", ["priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+QUEUE_DEPTH = gauge("rag_llm_queue_depth", "LLM calls waiting in the scheduler, by priority.", ["priority"])
+REJECTED = counter("rag_llm_rejected_total", "LLM calls turned away by the scheduler.", ["priority", "reason"])
+
+
+class LLMBusy(Exception):
+    """The scheduler is saturated; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        # A zero limit disables the bucket; bursts are capped at a tenth of the minute's budget
+        self.rate = per_minute / 60.0
+        self.capacity = max(per_minute / 10.0, 1.0) if per_minute else 0.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float, now: float) -> float:
+        """Seconds until `cost` tokens are available; 0 if they are now (or unlimited)."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost: float):
+        if self.rate:
+            self.tokens -= min(cost, self.capacity)
+
+
+class LLMScheduler:
+    """
+    Process-wide admission control for LLM calls. Calls are granted strictly by
+    priority (interactive before batch), round-robin across callers within a
+    priority, and only when the request and token buckets and the in-flight limit
+    allow. A full queue, or a wait beyond the priority's limit, raises LLMBusy.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, max_in_flight: int,
+                 max_queue: Dict[str, int], max_wait: Dict[str, float]):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        # priority -> caller -> waiting tickets; callers rotate to the back once served
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+
+    @classmethod
+    def from_settings(cls) -> "LLMScheduler":
+        return cls(
+            requests_per_minute=getattr(settings, "RAG_LLM_REQUESTS_PER_MINUTE", 60),
+            tokens_per_minute=getattr(settings, "RAG_LLM_TOKENS_PER_MINUTE", 0),
+            max_in_flight=getattr(settings, "RAG_LLM_MAX_IN_FLIGHT", 8),
+            max_queue=getattr(settings, "RAG_LLM_MAX_QUEUE", {INTERACTIVE: 32, BATCH: 128}),
+            max_wait=getattr(settings, "RAG_LLM_MAX_WAIT_SECONDS", {INTERACTIVE: 20, BATCH: 120}),
+        )
+
+    def depth(self, priority: str) -> int:
+        return sum(len(q) for q in self._queues[priority].values())
+
+    def retry_after(self, priority: str) -> int:
+        """Rough seconds until the calls ahead of a new `priority` call have been served."""
+        ahead = sum(self.depth(p) for p in PRIORITIES[:PRIORITIES.index(priority) + 1]) + self.in_flight
+        rate = self.requests.rate or 1.0
+        return max(1, math.ceil(ahead / rate))
+
+    def check_admission(self, priority: str):
+        """Raise LLMBusy now if a call of this priority would be turned away for queue depth."""
+        with self._cond:
+            if self.depth(priority) >= self.max_queue[priority]:
+                REJECTED.inc(priority=priority, reason="queue_full")
+                raise LLMBusy("LLM queue is full, retry later", self.retry_after(priority))
+
+    def _next_ticket(self):
+        for priority in PRIORITIES:
+            for queue in self._queues[priority].values():
+                return queue[0]
+        return None
+
+    def _grant_delay(self, cost: float, now: float) -> Optional[float]:
+        # None: wait for a call to finish; otherwise seconds until the buckets allow it
+        if self.in_flight >= self.max_in_flight:
+            return None
+        return max(self.requests.delay(1, now), self.tokens.delay(cost, now))
+
+    def _dequeue(self, priority: str, caller: str, ticket):
+        callers = self._queues[priority]
+        queue = callers.get(caller)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if queue:
+            callers.move_to_end(caller)
+        else:
+            del callers[caller]
+
+    def acquire(self, priority: str = INTERACTIVE, caller: str = "anonymous", cost: float = 0) -> float:
+        """Block until the call may run; returns the time waited in seconds."""
+        ticket = object()
+        start = time.monotonic()
+        deadline = start + self.max_wait[priority]
+        with self._cond:
+            if self.depth(priority) >= self.max_queue[priority]:
+                REJECTED.inc(priority=priority, reason="queue_full")
+                raise LLMBusy("LLM queue is full, retry later", self.retry_after(priority))
+            self._queues[priority].setdefault(caller, deque()).append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._grant_delay(cost, now) if self._next_ticket() is ticket else None
+                    if delay == 0:
+                        self.requests.take(1)
+                        self.tokens.take(cost)
+                        self.in_flight += 1
+                        self._dequeue(priority, caller, ticket)
+                        self._cond.notify_all()
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        REJECTED.inc(priority=priority, reason="wait_timeout")
+                        raise LLMBusy("Timed out waiting for the LLM, retry later", self.retry_after(priority))
+                    self._cond.wait(min(remaining, delay) if delay else remaining)
+            except BaseException:
+                self._dequeue(priority, caller, ticket)
+                self._cond.notify_all()
+                raise
+        waited = time.monotonic() - start
+        QUEUE_WAIT_SECONDS.observe(waited, priority=priority)
+        return waited
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE, caller: str = "anonymous", cost: float = 0):
+        self.acquire(priority, caller, cost)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def estimate_tokens(prompt: str) -> int:
+    # About four characters per token for English text
+    return len(prompt) // 4 + 1
+
+
+LLM_SCHEDULER = LLMScheduler.from_settings()
+for _priority in PRIORITIES:
+    QUEUE_DEPTH.set_function(lambda p=_priority: LLM_SCHEDULER.depth(p), priority=_priority)
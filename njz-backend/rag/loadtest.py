@@ -0,0 +1,211 @@
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .benchmarking import make_synthetic_pdf, percentiles
+
+_GENERATE = re.compile(r"^/v1beta/models/[^/:]+:generateContent")
+_DOCUMENT = re.compile(r"^/docs/(\d+)\.pdf$")
+_PACKED_QUESTIONS = re.compile(r"Questions:(.*?)Reply with JSON", re.DOTALL)
+_NUMBERED = re.compile(r"^\d+\. ", re.MULTILINE)
+
+
+# ========== FAKE GEMINI SERVER ==========
+class FakeGeminiServer:
+    """
+    Local stand-in for the Gemini generateContent API, plus a static PDF host for
+    HackRx document URLs. Latency is log-normal around `latency_ms` (`sigma` 0 makes
+    it fixed); `error_rate` of calls fail with 500 and `throttle_rate` with 429.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 800.0, sigma: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, documents: Optional[List[bytes]] = None,
+                 seed: Optional[int] = None):
+        self.latency = latency_ms / 1000.0
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.documents = documents or []
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "throttled": 0, "documents": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGeminiServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _draw(self) -> Tuple[float, Optional[int]]:
+        with self.lock:
+            delay = self.latency * math.exp(self.rng.gauss(0, self.sigma)) if self.sigma else self.latency
+            roll = self.rng.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 500
+        return delay, None
+
+    def _count(self, key: str):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body: bytes, content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                match = _DOCUMENT.match(self.path)
+                if not match or int(match.group(1)) >= len(server.documents):
+                    self._send(404, b'{"error": "not found"}')
+                    return
+                server._count("documents")
+                self._send(200, server.documents[int(match.group(1))], content_type="application/pdf")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if not _GENERATE.match(self.path):
+                    self._send(404, b'{"error": "not found"}')
+                    return
+                server._count("calls")
+                delay, failure = server._draw()
+                time.sleep(delay)
+                if failure == 429:
+                    server._count("throttled")
+                    self._send(429, b'{"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}',
+                               headers={"Retry-After": "1"})
+                    return
+                if failure:
+                    server._count("errors")
+                    self._send(500, b'{"error": {"code": 500, "status": "INTERNAL"}}')
+                    return
+                text = f"Stub answer for a {len(body)} byte request."
+                try:
+                    prompt = "".join(part.get("text", "") for content in json.loads(body)["contents"]
+                                     for part in content["parts"])
+                except (ValueError, KeyError, TypeError):
+                    prompt = ""
+                packed = _PACKED_QUESTIONS.search(prompt)
+                if packed:
+                    # Multi-question prompt: one JSON answer per numbered question
+                    count = len(_NUMBERED.findall(packed.group(1)))
+                    text = json.dumps({"answers": [{"id": n, "answer": text} for n in range(1, count + 1)]})
+                reply = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]},
+                                         "finishReason": "STOP"}]}
+                self._send(200, json.dumps(reply).encode("utf-8"))
+
+        return Handler
+
+
+def build_documents(count: int, pages: int) -> List[bytes]:
+    """Distinct synthetic PDFs, so uploads and HackRx runs are not deduplicated away."""
+    documents = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for i in range(count):
+            path = make_synthetic_pdf(os.path.join(workdir, f"doc_{i}.pdf"), pages, seed=i)
+            with open(path, "rb") as f:
+                documents.append(f.read())
+    return documents
+
+
+# ========== OPEN-LOOP LOAD ==========
+def poisson_schedule(rates: Dict[str, float], duration: float, rng: random.Random) -> List[Tuple[float, str]]:
+    """Arrival offsets per endpoint with exponential gaps at the given requests/sec, merged in time order."""
+    schedule = []
+    for name, rate in rates.items():
+        if rate <= 0:
+            continue
+        t = rng.expovariate(rate)
+        while t < duration:
+            schedule.append((t, name))
+            t += rng.expovariate(rate)
+    schedule.sort()
+    return schedule
+
+
+def run_open_loop(requests_by_name: Dict[str, Callable], rates: Dict[str, float], duration: float,
+                  max_in_flight: int = 256, seed: int = 0) -> dict:
+    """
+    Fire requests on a fixed arrival schedule regardless of how fast responses come
+    back, so a slow server builds a queue instead of slowing the load down. Latency is
+    measured from the scheduled send time, which counts time spent waiting for a free
+    client thread. Each callable takes a requests.Session and returns a response.
+    """
+    import requests
+
+    schedule = poisson_schedule(rates, duration, random.Random(seed))
+    local = threading.local()
+    lock = threading.Lock()
+    samples = {name: {"latencies": [], "statuses": {}, "errors": 0} for name in rates}
+
+    def fire(name, scheduled):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        try:
+            status = requests_by_name[name](session).status_code
+        except requests.RequestException:
+            status = "exception"
+        latency = (time.perf_counter() - scheduled) * 1000
+        with lock:
+            sample = samples[name]
+            sample["latencies"].append(latency)
+            sample["statuses"][str(status)] = sample["statuses"].get(str(status), 0) + 1
+            if status == "exception" or status >= 400:
+                sample["errors"] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for offset, name in schedule:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, name, start + offset)
+    elapsed = time.perf_counter() - start
+
+    report = {}
+    for name, sample in samples.items():
+        completed = len(sample["latencies"])
+        report[name] = {
+            "offered_rate": rates[name],
+            "requests": completed,
+            "throughput_per_sec": (completed - sample["errors"]) / elapsed if elapsed else 0.0,
+            "error_rate": sample["errors"] / completed if completed else 0.0,
+            "statuses": sample["statuses"],
+            "latency": percentiles(sample["latencies"]),
+        }
+    return report
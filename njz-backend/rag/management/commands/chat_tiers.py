@@ -0,0 +1,89 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rag import tiering
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign every chat index to the hot, warm or cold tier from its access stats and "
+        "report tier sizes and tier changes since the previous run. With --apply, cold "
+        "chats are compressed on disk; workers preload the hot list at startup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--apply", action="store_true", help="Compress chats assigned to the cold tier.")
+        parser.add_argument("--hot", type=int, default=getattr(settings, "RAG_TIER_HOT_CHATS", 16),
+                            help="Number of chats ranked hot.")
+        parser.add_argument("--cold-after-days", type=float,
+                            default=getattr(settings, "RAG_TIER_COLD_AFTER_DAYS", 30),
+                            help="Chats not accessed for this long are cold.")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        from rag.views import MEDIA_DIR
+
+        now = time.time()
+        chats, sizes, compressed = {}, {}, set()
+        for entry in os.scandir(MEDIA_DIR):
+            if not (entry.is_dir() and entry.name.startswith("chat_")):
+                continue
+            chat_id = entry.name[len("chat_"):]
+            stats = tiering.read_access(entry.path)
+            if not stats["last_access"]:
+                # Never queried since tracking started: age it by its last write
+                stats["last_access"] = entry.stat().st_mtime
+            chats[chat_id] = stats
+            sizes[chat_id] = tiering.directory_size(entry.path)
+            if tiering.is_compressed(entry.path):
+                compressed.add(chat_id)
+
+        tiers = tiering.assign_tiers(chats, options["hot"], options["cold_after_days"] * 86400, now)
+
+        saved = 0
+        if options["apply"]:
+            for chat_id, tier in tiers.items():
+                if tier == tiering.COLD and chat_id not in compressed:
+                    chat_dir = os.path.join(MEDIA_DIR, f"chat_{chat_id}")
+                    # Skipped if the chat was used since it was ranked
+                    saved += tiering.compress_chat(chat_dir, idle_seconds=options["cold_after_days"] * 86400)
+                    if tiering.is_compressed(chat_dir):
+                        sizes[chat_id] = tiering.directory_size(chat_dir)
+                        compressed.add(chat_id)
+
+        previous = tiering.load_state(MEDIA_DIR)
+        changes = tiering.tier_changes(previous.get("tiers", {}), tiers)
+        hours = (now - previous["generated_at"]) / 3600 if previous.get("generated_at") else None
+        hot = sorted((c for c, t in tiers.items() if t == tiering.HOT),
+                     key=lambda c: tiering.decay(chats[c]["score"], chats[c]["last_access"], now), reverse=True)
+        tiering.save_state(MEDIA_DIR, {"generated_at": now, "tiers": tiers, "hot": hot})
+
+        report = {
+            "tiers": {
+                tier: {
+                    "chats": sum(1 for t in tiers.values() if t == tier),
+                    "bytes": sum(sizes[c] for c, t in tiers.items() if t == tier),
+                }
+                for tier in tiering.TIERS
+            },
+            "compressed_on_disk": len(compressed),
+            "bytes_saved": saved,
+            "hours_since_last_run": hours,
+            "changes": changes,
+            "changes_per_hour": {k: v / hours for k, v in changes.items()} if hours else {},
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for tier, row in report["tiers"].items():
+            self.stdout.write(f"{tier:>5}: {row['chats']} chats, {row['bytes'] / 1e6:.1f} MB")
+        self.stdout.write(f"🗜️ {len(compressed)} chats compressed on disk, {saved / 1e6:.1f} MB saved this run")
+        if hours:
+            for change, count in sorted(changes.items()):
+                self.stdout.write(f"  {change}: {count} ({count / hours:.2f}/h)")
+        else:
+            self.stdout.write("First run: tier changes are reported from the next run on.")
@@ -0,0 +1,113 @@
+import json
+import secrets
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from rag.benchmarking import compare_results, environment_info, run_closed_loop, save_results
+from rag.models import Chat
+
+BENCH_USERNAME = "db_benchmark"
+
+
+def database_mode() -> str:
+    db = settings.DATABASES["default"]
+    engine = db["ENGINE"].rsplit(".", 1)[-1]
+    options = db.get("OPTIONS", {})
+    if engine == "sqlite3":
+        tuning = "wal" if "init_command" in options else "stock"
+        return f"sqlite-{tuning}-age{db.get('CONN_MAX_AGE', 0)}"
+    if "pool" in options:
+        return f"{engine}-pool{options['pool'].get('max_size')}"
+    return f"{engine}-age{db.get('CONN_MAX_AGE', 0)}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrency benchmark of the auth and chat endpoints against a running server. "
+        "Start the server with the DB_* environment of the mode under test and run this "
+        "command with the same environment; compare modes with --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=15.0, help="Seconds per scenario.")
+        parser.add_argument("--label", help="Name of this run; defaults to the database mode.")
+        parser.add_argument("--output", default="db_benchmark.json")
+        parser.add_argument("--baseline", help="Results JSON of another mode to compare against.")
+        parser.add_argument("--tolerance", type=float, default=0.10)
+
+    def handle(self, *args, **options):
+        # A fresh password per run; the user, its chat and the messages posted are deleted afterwards
+        password = secrets.token_urlsafe(24)
+        user, chat = self.setup_fixtures(password)
+        try:
+            self.run_benchmark(options, chat, password)
+        finally:
+            # Cascades to the benchmark chat and its messages
+            user.delete()
+
+    def run_benchmark(self, options, chat, password):
+        base = options["base_url"].rstrip("/")
+        token = self.login(base, password)
+
+        auth = {"Authorization": f"Bearer {token}"}
+        login_body = {"username": BENCH_USERNAME, "password": password}
+        scenarios = {
+            "login": [("POST", f"{base}/api/auth/login/", {"json": login_body})],
+            "profile": [("GET", f"{base}/api/auth/profile/", {"headers": auth})],
+            "chat_write": [("POST", f"{base}/rag/chats/{chat.id}/messages/",
+                            {"json": {"content": "benchmark message", "sender": "user"}})],
+            "chat_read": [("GET", f"{base}/rag/chats/{chat.id}/messages/?limit=50", {})],
+        }
+        scenarios["mixed"] = scenarios["chat_write"] + scenarios["chat_read"] + scenarios["profile"]
+
+        results = {
+            "label": options["label"] or database_mode(),
+            "environment": environment_info(),
+            "concurrency": options["concurrency"],
+            "duration": options["duration"],
+            "scenarios": {},
+        }
+        for name, requests_mix in scenarios.items():
+            stats = run_closed_loop(requests_mix, options["concurrency"], options["duration"])
+            results["scenarios"][name] = stats
+            self.stdout.write(
+                f"⏱️ {name}: {stats['requests_per_sec']:.1f} req/s, "
+                f"p50 {stats['latency']['p50_ms']:.1f} ms, p99 {stats['latency']['p99_ms']:.1f} ms, "
+                f"errors {stats['error_rate']:.2%}"
+            )
+
+        save_results(results, options["output"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Saved {results['label']} results to {options['output']}"))
+
+        if options["baseline"]:
+            with open(options["baseline"], "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            self.stdout.write(f"Compared with {baseline.get('label', options['baseline'])}:")
+            for name, stats in results["scenarios"].items():
+                old = baseline.get("scenarios", {}).get(name)
+                if old:
+                    ratio = stats["requests_per_sec"] / old["requests_per_sec"] if old["requests_per_sec"] else 0
+                    self.stdout.write(f"  {name}: {ratio:.2f}x throughput")
+            for line in compare_results(results["scenarios"], baseline.get("scenarios", {}), options["tolerance"]):
+                self.stdout.write(self.style.WARNING(f"  slower: {line}"))
+
+    def setup_fixtures(self, password):
+        # Left over if an earlier run was killed before cleaning up
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create_user(
+            BENCH_USERNAME, email="db_benchmark@example.com", password=password,
+            first_name="DB", last_name="Benchmark",
+        )
+        chat = Chat.objects.create(user=user, name="db benchmark")
+        return user, chat
+
+    def login(self, base, password):
+        response = requests.post(f"{base}/api/auth/login/",
+                                 json={"username": BENCH_USERNAME, "password": password}, timeout=30)
+        response.raise_for_status()
+        return response.json()["data"]["tokens"]["access"]
@@ -0,0 +1,83 @@
+import json
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from rag.benchmarking import compare_results, environment_info, save_results, synthetic_text
+from rag.embedding_engine import EmbeddingEngine
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Chunk embedding throughput per number of worker processes, on synthetic chunks of "
+        "mixed length. Each run is checked against in-process embeddings in input order. "
+        "Use the best setting for RAG_EMBED_PROCESSES / RAG_EMBED_THREADS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunks", type=int, default=2000)
+        parser.add_argument("--processes", type=_int_list, default=[0, 1, 2, 4],
+                            help="Comma separated worker process counts; 0 embeds in this process.")
+        parser.add_argument("--threads-per-process", type=int, default=None,
+                            help="Torch threads per worker (default: CPU count / processes).")
+        parser.add_argument("--batch-size", type=int, default=64)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="embedding_benchmark.json")
+        parser.add_argument("--baseline", help="Previous results JSON to compare against.")
+        parser.add_argument("--tolerance", type=float, default=0.10)
+
+    def handle(self, *args, **options):
+        # Imported here so `manage.py help` does not load the models
+        from rag import views
+
+        rng = random.Random(options["seed"])
+        # Chunks as the chunker produces them: mostly long, with short tails and headings
+        chunks = [synthetic_text(rng.choice((12, 40, 120, 220)), rng) for _ in range(options["chunks"])]
+        reference = views.embedding_model.encode(chunks[:256], convert_to_numpy=True).astype("float32")
+
+        results = {"environment": environment_info(), "options": {
+            k: options[k] for k in ("chunks", "processes", "threads_per_process", "batch_size", "seed")
+        }, "runs": {}}
+        for processes in options["processes"]:
+            engine = EmbeddingEngine(
+                model=views.embedding_model, model_name=views.EMBEDDING_MODEL_NAME, processes=processes,
+                threads_per_process=options["threads_per_process"], batch_size=options["batch_size"],
+            )
+            try:
+                engine.start()  # worker start-up and model loading are not timed
+                engine.encode(chunks[:options["batch_size"]])
+                start = time.perf_counter()
+                vecs = engine.encode(chunks)
+                elapsed = time.perf_counter() - start
+            finally:
+                engine.close()
+            if not np.allclose(vecs[:len(reference)], reference, atol=1e-4):
+                raise CommandError(f"Embeddings with {processes} processes do not match the in-process model")
+            name = f"{processes}_processes" if processes else "in_process"
+            results["runs"][name] = {
+                "processes": processes,
+                "threads_per_process": engine.threads_per_process if processes else None,
+                "seconds": elapsed,
+                "embeddings_per_sec": len(chunks) / elapsed,
+            }
+            self.stdout.write(f"⏱️ {name}: {len(chunks) / elapsed:.1f} embeddings/sec")
+
+        save_results(results, options["output"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Saved embedding benchmark results to {options['output']}"))
+
+        if options["baseline"]:
+            with open(options["baseline"], "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            regressions = compare_results(results["runs"], baseline.get("runs", {}), options["tolerance"])
+            if regressions:
+                self.stdout.write(self.style.WARNING("Regressions against baseline:"))
+                for line in regressions:
+                    self.stdout.write(f"  {line}")
+            else:
+                self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
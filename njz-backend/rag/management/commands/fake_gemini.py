@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rag.loadtest import FakeGeminiServer, build_documents
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local Gemini stand-in with configurable latency and errors. Point the app "
+        "at it with RAG_LLM_BASE_URL=http://HOST:PORT; synthetic PDFs are served at /docs/N.pdf."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency-ms", type=float, default=800.0, help="Median LLM latency.")
+        parser.add_argument("--latency-sigma", type=float, default=0.3,
+                            help="Log-normal spread of the latency; 0 for a fixed latency.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls failing with 500.")
+        parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of calls failing with 429.")
+        parser.add_argument("--documents", type=int, default=4, help="Synthetic PDFs to serve.")
+        parser.add_argument("--pages", type=int, default=10, help="Pages per synthetic PDF.")
+
+    def handle(self, *args, **options):
+        server = FakeGeminiServer(
+            host=options["host"], port=options["port"], latency_ms=options["latency_ms"],
+            sigma=options["latency_sigma"], error_rate=options["error_rate"],
+            throttle_rate=options["throttle_rate"], documents=build_documents(options["documents"], options["pages"]),
+        ).start()
+        self.stdout.write(self.style.SUCCESS(f"🤖 Fake Gemini listening on {server.url}"))
+        try:
+            while True:
+                time.sleep(10)
+                self.stdout.write(f"calls {server.stats['calls']}, errors {server.stats['errors']}, "
+                                  f"throttled {server.stats['throttled']}, documents {server.stats['documents']}")
+        except KeyboardInterrupt:
+            server.stop()
+
@@ -0,0 +1,246 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import faiss
+from django.core.management.base import BaseCommand, CommandError
+
+from rag.chunkstore import write_chunk_store
+from rag.embedding_engine import EmbeddingEngine
+from rag.pipeline import iter_chunks, iter_pages
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+# ========== WORKER PROCESS ==========
+_worker_nlp = None
+
+
+def _init_worker(spacy_model: str):
+    # Workers are spawned (this process has run torch), so each loads only spaCy, not the app
+    global _worker_nlp
+    import spacy
+
+    _worker_nlp = spacy.load(spacy_model)
+
+
+def _extract_and_chunk_file(path: str):
+    return list(iter_chunks(iter_pages(path), _worker_nlp))
+
+
+# ========== ATOMIC OUTPUT ==========
+def _write_json_atomic(path, data, indent=None):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _write_index_atomic(index, path):
+    tmp = f"{path}.tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+
+
+# ========== CHECKPOINT ==========
+CHECKPOINT_VERSION = 2
+
+
+def new_checkpoint() -> dict:
+    return {"version": CHECKPOINT_VERSION, "completed": [], "failed": {}, "shards": []}
+
+
+def file_key(path: Path) -> str:
+    """
+    Identity of an input file in the checkpoint: its resolved path, size and
+    modification time, so a file replaced or edited under the same name is
+    ingested again and two folders' `a.pdf` are different files.
+    """
+    stat = path.stat()
+    return f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_checkpoint(output_dir: str) -> dict:
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return new_checkpoint()
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        # Older checkpoints list files by name only and cannot tell a changed file apart
+        raise CommandError(f"{path} was written by an older version of this command; rerun with --restart")
+    return checkpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Ingest a folder of PDFs: extraction and chunking run in a process pool, chunks are "
+        "embedded in batches, and output is written as checkpointed shards so an interrupted "
+        "run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdf_folder")
+        parser.add_argument("--output", help="Shard directory (default: MEDIA_ROOT/ingest).")
+        parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                            help="Extraction/chunking processes.")
+        parser.add_argument("--batch-size", type=int, default=256,
+                            help="Chunks per embedding call.")
+        parser.add_argument("--embed-processes", type=int, default=None,
+                            help="Embedding worker processes (default: RAG_EMBED_PROCESSES; 0 embeds in this process).")
+        parser.add_argument("--embed-threads", type=int, default=None,
+                            help="Torch threads per embedding process (default: CPU count / processes).")
+        parser.add_argument("--checkpoint-every", type=int, default=20,
+                            help="Files per shard; a checkpoint is written after each shard.")
+        parser.add_argument("--restart", action="store_true",
+                            help="Ignore an existing checkpoint and start over.")
+        parser.add_argument("--merge", action="store_true",
+                            help="Merge all shards into the global faiss_index.idx and chunk store when done.")
+
+    def handle(self, *args, **options):
+        from rag import views
+
+        pdf_folder = Path(options["pdf_folder"])
+        if not pdf_folder.is_dir():
+            raise CommandError(f"{pdf_folder} is not a directory")
+        output_dir = options["output"] or os.path.join(views.MEDIA_DIR, "ingest")
+        os.makedirs(output_dir, exist_ok=True)
+
+        checkpoint = new_checkpoint() if options["restart"] else load_checkpoint(output_dir)
+        completed = set(checkpoint["completed"])
+
+        pdf_files = sorted(p for p in pdf_folder.glob("*.pdf"))
+        # path -> checkpoint key of the files still to ingest
+        todo = {p: key for p, key in ((p, file_key(p)) for p in pdf_files) if key not in completed}
+        self.stdout.write(
+            f"📄 {len(pdf_files)} PDFs found, {len(pdf_files) - len(todo)} already ingested, {len(todo)} to go"
+        )
+        if todo:
+            processes = options["embed_processes"]
+            embedder = EmbeddingEngine(
+                model=views.embedding_model, model_name=views.EMBEDDING_MODEL_NAME, dimension=views.d,
+                processes=views.INGEST_EMBEDDER.processes if processes is None else processes,
+                threads_per_process=options["embed_threads"], batch_size=views.INGEST_EMBEDDER.batch_size,
+            )
+            try:
+                self.ingest(views, embedder, todo, output_dir, checkpoint, options)
+            finally:
+                embedder.close()
+        if checkpoint["failed"]:
+            self.stdout.write(self.style.WARNING(f"❌ {len(checkpoint['failed'])} files failed:"))
+            for path, error in checkpoint["failed"].items():
+                self.stdout.write(f"  {path}: {error}")
+        if options["merge"]:
+            self.merge_shards(output_dir, checkpoint, views.INDEX_PATH, views.CHUNKS_PATH)
+
+    def ingest(self, views, embedder, todo, output_dir, checkpoint, options):
+        batch_size = max(options["batch_size"], embedder.feed_size)
+        shard_files = []
+        shard_index = faiss.IndexFlatL2(views.d)
+        shard_metadata = []
+        pending_chunks, pending_meta = [], []
+        stats = {"processed": 0, "files": 0, "chunks": 0, "embedded": 0}
+        started = time.perf_counter()
+
+        def embed_pending():
+            if not pending_chunks:
+                return
+            shard_index.add(embedder.encode(pending_chunks))
+            shard_metadata.extend(pending_meta)
+            stats["embedded"] += len(pending_chunks)
+            pending_chunks.clear()
+            pending_meta.clear()
+
+        def flush_shard():
+            nonlocal shard_index, shard_metadata, shard_files
+            embed_pending()
+            if not shard_files:
+                return
+            name = f"shard_{len(checkpoint['shards']):05d}"
+            _write_index_atomic(shard_index, os.path.join(output_dir, f"{name}.idx"))
+            _write_json_atomic(os.path.join(output_dir, f"{name}.json"), shard_metadata)
+            checkpoint["shards"].append({"name": name, "files": len(shard_files), "chunks": len(shard_metadata)})
+            checkpoint["completed"].extend(shard_files)
+            _write_json_atomic(os.path.join(output_dir, CHECKPOINT_FILE), checkpoint, indent=2)
+            self.stdout.write(f"💾 Checkpoint: {name} with {len(shard_files)} files, {len(shard_metadata)} chunks")
+            shard_index = faiss.IndexFlatL2(views.d)
+            shard_metadata, shard_files = [], []
+
+        workers = max(1, options["workers"])
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(views.SPACY_MODEL_NAME,)) as pool:
+            queue = iter(todo)
+            in_flight = {}
+            # Keep a bounded window of submissions so chunk lists don't pile up in memory
+            for path in queue:
+                in_flight[pool.submit(_extract_and_chunk_file, str(path))] = path
+                if len(in_flight) >= 2 * workers:
+                    break
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = in_flight.pop(future)
+                    stats["processed"] += 1
+                    try:
+                        chunks = future.result()
+                    except Exception as e:
+                        checkpoint["failed"][str(path.resolve())] = str(e)
+                        self.stdout.write(self.style.ERROR(f"❌ Error processing {path.name}: {e}"))
+                    else:
+                        checkpoint["failed"].pop(str(path.resolve()), None)
+                        pending_chunks.extend(chunks)
+                        pending_meta.extend(
+                            {"source": path.name, "chunk_id": i, "chunk_text": chunk} for i, chunk in enumerate(chunks)
+                        )
+                        shard_files.append(todo[path])
+                        stats["files"] += 1
+                        stats["chunks"] += len(chunks)
+                    if len(pending_chunks) >= batch_size:
+                        embed_pending()
+                    if len(shard_files) >= options["checkpoint_every"]:
+                        flush_shard()
+                    self.report_progress(stats, len(todo), started)
+                    next_path = next(queue, None)
+                    if next_path is not None:
+                        in_flight[pool.submit(_extract_and_chunk_file, str(next_path))] = next_path
+        flush_shard()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Ingested {stats['files']} files, {stats['chunks']} chunks in {elapsed:.1f}s "
+            f"({stats['files'] / elapsed:.2f} files/s, {stats['embedded'] / elapsed:.1f} embeddings/s)"
+        ))
+
+    def report_progress(self, stats, total, started):
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(
+            f"⏱️ {stats['processed']}/{total} files | {stats['files'] / elapsed:.2f} files/s | "
+            f"{stats['chunks'] / elapsed:.1f} chunks/s | {stats['embedded'] / elapsed:.1f} embeddings/s"
+        )
+
+    def merge_shards(self, output_dir, checkpoint, index_path, chunks_path):
+        merged_index = None
+        for shard in checkpoint["shards"]:
+            index = faiss.read_index(os.path.join(output_dir, f"{shard['name']}.idx"))
+            if merged_index is None:
+                merged_index = faiss.IndexFlatL2(index.d)
+            if index.ntotal:
+                merged_index.add(index.reconstruct_n(0, index.ntotal))
+        if merged_index is None:
+            self.stdout.write("Nothing to merge.")
+            return
+
+        def shard_metadata():
+            # One shard's metadata in memory at a time
+            for shard in checkpoint["shards"]:
+                with open(os.path.join(output_dir, f"{shard['name']}.json"), "r", encoding="utf-8") as f:
+                    yield from json.load(f)
+
+        # As in a chat commit, the index is saved before the offsets that make the chunks visible
+        write_chunk_store(chunks_path, shard_metadata(),
+                          before_commit=lambda: _write_index_atomic(merged_index, index_path))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Merged {len(checkpoint['shards'])} shards ({merged_index.ntotal} vectors) into {index_path}"
+        ))
@@ -0,0 +1,185 @@
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rag.benchmarking import compare_results, environment_info, save_results
+from rag.loadtest import FakeGeminiServer, build_documents, run_open_loop
+
+QUESTIONS = [
+    "What is the grace period for premium payment?",
+    "What does clause {n} cover?",
+    "Are pre-existing diseases covered, and after how long?",
+    "Summarise the exclusions in section {n}.",
+]
+
+
+def parse_rates(value: str) -> dict:
+    """'query=20,upload=0.5,hackrx=1' -> {'query': 20.0, 'upload': 0.5, 'hackrx': 1.0}"""
+    rates = {}
+    for part in value.split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() not in ("query", "upload", "hackrx"):
+            raise CommandError(f"Unknown endpoint {name!r} in --rates (use query, upload, hackrx)")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class Command(BaseCommand):
+    help = (
+        "Open-loop HTTP load test of query, upload_pdf and hackrx/run at fixed arrival "
+        "rates. With --start-server it runs gunicorn against a local Gemini stand-in, so "
+        "results reflect the server rather than the real API's latency and quota."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8001",
+                            help="Server under test; started here with --start-server.")
+        parser.add_argument("--start-server", action="store_true",
+                            help="Start gunicorn and a fake Gemini server for the run.")
+        parser.add_argument("--rates", default="query=5,upload=0.2,hackrx=0.5",
+                            help="Requests/sec per endpoint, e.g. query=20,upload=0.5,hackrx=1.")
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load.")
+        parser.add_argument("--max-in-flight", type=int, default=256, help="Client threads.")
+        parser.add_argument("--latency-ms", type=float, default=800.0, help="Median fake LLM latency.")
+        parser.add_argument("--latency-sigma", type=float, default=0.3, help="Log-normal spread of it.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fake LLM calls failing with 500.")
+        parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fake LLM calls failing with 429.")
+        parser.add_argument("--llm-rpm", type=int, default=0,
+                            help="RAG_LLM_REQUESTS_PER_MINUTE for the started server; 0 for unlimited.")
+        parser.add_argument("--documents", type=int, default=8, help="Distinct synthetic PDFs.")
+        parser.add_argument("--pages", type=int, default=10, help="Pages per synthetic PDF.")
+        parser.add_argument("--chat-id", type=int, default=1000000,
+                            help="Chat to query; uploads go to the chat ids after it.")
+        parser.add_argument("--keep-data", action="store_true",
+                            help="Keep the chats created by the run (only removed with --start-server).")
+        parser.add_argument("--output", default="load_test.json")
+        parser.add_argument("--baseline", help="Earlier results JSON to compare against.")
+        parser.add_argument("--tolerance", type=float, default=0.10)
+
+    def handle(self, *args, **options):
+        import requests
+
+        rates = parse_rates(options["rates"])
+        base = options["base_url"].rstrip("/")
+        documents = build_documents(options["documents"], options["pages"])
+        fake = FakeGeminiServer(
+            latency_ms=options["latency_ms"], sigma=options["latency_sigma"], error_rate=options["error_rate"],
+            throttle_rate=options["throttle_rate"], documents=documents, seed=0,
+        ).start()
+        self.stdout.write(f"🤖 Fake Gemini on {fake.url}")
+
+        server = None
+        counter = itertools.count()
+        # Chat directories that exist before the run are never removed
+        existing_chats = self._chat_dirs()
+        try:
+            if options["start_server"]:
+                server = self._start_server(base, fake.url, options["llm_rpm"])
+
+            chat_id = options["chat_id"]
+            response = requests.post(f"{base}/rag/chats/{chat_id}/upload_pdf/",
+                                     files={"file": ("seed.pdf", documents[0], "application/pdf")}, timeout=300)
+            if response.status_code != 200:
+                raise CommandError(f"Seeding chat {chat_id} failed: {response.status_code} {response.text[:200]}")
+
+            def query(session):
+                n = next(counter)
+                question = QUESTIONS[n % len(QUESTIONS)].format(n=n % 40)
+                return session.post(f"{base}/rag/chats/{chat_id}/query/", json={"question": question}, timeout=120)
+
+            def upload(session):
+                n = next(counter)
+                pdf = documents[n % len(documents)]
+                return session.post(f"{base}/rag/chats/{chat_id + 1 + n}/upload_pdf/",
+                                    files={"file": (f"load_{n}.pdf", pdf, "application/pdf")}, timeout=300)
+
+            def hackrx(session):
+                n = next(counter)
+                return session.post(f"{base}/rag/hackrx/run", timeout=300, json={
+                    "documents": f"{fake.url}/docs/{n % len(documents)}.pdf",
+                    "questions": [q.format(n=n % 40) for q in QUESTIONS],
+                })
+
+            self.stdout.write(f"🚀 {options['duration']:.0f}s at {rates}")
+            endpoints = run_open_loop({"query": query, "upload": upload, "hackrx": hackrx}, rates,
+                                      options["duration"], max_in_flight=options["max_in_flight"])
+        finally:
+            if server:
+                server.terminate()
+                server.wait(timeout=30)
+            fake.stop()
+            # Only a server started here writes to this MEDIA_ROOT
+            if server and not options["keep_data"]:
+                self._remove_chats(options["chat_id"], next(counter), existing_chats)
+
+        results = {
+            "environment": environment_info(),
+            "config": {key: options[key] for key in (
+                "rates", "duration", "latency_ms", "latency_sigma", "error_rate", "throttle_rate", "llm_rpm", "pages")},
+            "endpoints": endpoints,
+            "fake_llm": dict(fake.stats),
+        }
+        for name, report in endpoints.items():
+            latency = report["latency"]
+            self.stdout.write(
+                f"⏱️ {name}: {report['requests']} requests, {report['throughput_per_sec']:.2f} ok/s "
+                f"(offered {report['offered_rate']:.2f}/s), p50 {latency['p50_ms']:.0f} ms, "
+                f"p95 {latency['p95_ms']:.0f} ms, p99 {latency['p99_ms']:.0f} ms, errors {report['error_rate']:.2%} "
+                f"{report['statuses']}"
+            )
+        self.stdout.write(f"🤖 fake LLM: {fake.stats}")
+
+        save_results(results, options["output"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Saved results to {options['output']}"))
+
+        if options["baseline"]:
+            with open(options["baseline"], "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            regressions = compare_results(results["endpoints"], baseline.get("endpoints", {}), options["tolerance"])
+            if regressions:
+                self.stdout.write(self.style.WARNING("⚠️ Regressions:"))
+                for line in regressions:
+                    self.stdout.write(f"  {line}")
+            else:
+                self.stdout.write(self.style.SUCCESS("No regressions beyond tolerance"))
+
+    def _start_server(self, base: str, llm_url: str, llm_rpm: int) -> subprocess.Popen:
+        import requests
+
+        env = dict(os.environ, RAG_LLM_BASE_URL=llm_url, RAG_LLM_REQUESTS_PER_MINUTE=str(llm_rpm),
+                   GUNICORN_BIND=base.split("://", 1)[-1])
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "backend.wsgi:application"],
+                                  cwd=settings.BASE_DIR, env=env)
+        deadline = time.monotonic() + 300
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"gunicorn exited with {server.returncode}")
+            try:
+                if requests.get(f"{base}/rag/metrics/", timeout=2).status_code == 200:
+                    self.stdout.write(f"🟢 Server up on {base}")
+                    return server
+            except requests.RequestException:
+                pass
+            time.sleep(1)
+        server.terminate()
+        raise CommandError("gunicorn did not come up within 300s")
+
+    @staticmethod
+    def _chat_dirs() -> set:
+        media = getattr(settings, "MEDIA_ROOT", "media")
+        return {name for name in os.listdir(media) if name.startswith("chat_")} if os.path.isdir(media) else set()
+
+    def _remove_chats(self, chat_id: int, used: int, existing: set):
+        # The queried chat plus every upload chat after it, if this run created them
+        media = getattr(settings, "MEDIA_ROOT", "media")
+        for n in range(-1, used):
+            name = f"chat_{chat_id + 1 + n}"
+            if name not in existing:
+                shutil.rmtree(os.path.join(media, name), ignore_errors=True)
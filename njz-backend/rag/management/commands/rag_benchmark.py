@@ -0,0 +1,208 @@
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from pypdf import PdfReader
+
+from rag.benchmarking import (
+    FakeGeminiModel,
+    compare_results,
+    environment_info,
+    make_synthetic_pdf,
+    percentiles,
+    save_results,
+    synthetic_text,
+)
+from rag.llm_scheduler import BATCH, INTERACTIVE, LLMScheduler
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline benchmark of the ingestion and query paths on synthetic PDFs with a stubbed LLM. "
+        "Writes JSON results and optionally compares them against a baseline run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=_int_list, default=[10, 50, 200],
+                            help="Comma separated synthetic document sizes, in pages.")
+        parser.add_argument("--words-per-page", type=int, default=350)
+        parser.add_argument("--index-sizes", type=_int_list, default=[1_000, 10_000, 100_000],
+                            help="Comma separated vector counts for the search benchmark.")
+        parser.add_argument("--search-queries", type=int, default=200)
+        parser.add_argument("--queries", type=int, default=100,
+                            help="Number of end-to-end chat queries to time.")
+        parser.add_argument("--llm-latency-ms", type=float, default=0.0,
+                            help="Latency of the stubbed Gemini model.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="rag_benchmark.json")
+        parser.add_argument("--baseline", help="Previous results JSON to compare against.")
+        parser.add_argument("--tolerance", type=float, default=0.10,
+                            help="Relative change tolerated before a metric is reported as a regression.")
+
+    def handle(self, *args, **options):
+        # Imported here so `manage.py help` does not load the models
+        from rag import views
+
+        rng = random.Random(options["seed"])
+        results = {"environment": environment_info(), "options": {
+            k: options[k] for k in ("pages", "words_per_page", "index_sizes", "search_queries",
+                                    "queries", "llm_latency_ms", "seed")
+        }}
+
+        with tempfile.TemporaryDirectory(prefix="rag_bench_") as workdir:
+            pdfs = {}
+            for pages in options["pages"]:
+                path = os.path.join(workdir, f"synthetic_{pages}p.pdf")
+                pdfs[pages] = make_synthetic_pdf(path, pages, options["words_per_page"], seed=options["seed"])
+
+            results["extraction"] = self.bench_extraction(pdfs)
+            results["chunking"], largest_chunks = self.bench_chunking(views, pdfs)
+            results["embedding"] = self.bench_embedding(views, largest_chunks)
+            results["search"] = self.bench_search(options["index_sizes"], options["search_queries"], rng)
+            results["end_to_end"] = self.bench_end_to_end(
+                views, pdfs[max(pdfs)], workdir, options["queries"],
+                options["llm_latency_ms"] / 1000, rng,
+            )
+
+        save_results(results, options["output"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Saved benchmark results to {options['output']}"))
+
+        if options["baseline"]:
+            with open(options["baseline"], "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            measured = {k: v for k, v in results.items() if k not in ("environment", "options")}
+            regressions = compare_results(measured, baseline, options["tolerance"])
+            if regressions:
+                self.stdout.write(self.style.WARNING("Regressions against baseline:"))
+                for line in regressions:
+                    self.stdout.write(f"  {line}")
+            else:
+                self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
+
+    # ========== STAGES ==========
+    def bench_extraction(self, pdfs):
+        out = {}
+        for pages, path in pdfs.items():
+            start = time.perf_counter()
+            reader = PdfReader(path)
+            text = "\n\n".join(page.extract_text() or "" for page in reader.pages)
+            elapsed = time.perf_counter() - start
+            out[f"{pages}_pages"] = {
+                "seconds": elapsed,
+                "chars": len(text),
+                "pages_per_sec": pages / elapsed,
+            }
+            self.stdout.write(f"⏱️ extract {pages} pages: {pages / elapsed:.1f} pages/sec")
+        return out
+
+    def bench_chunking(self, views, pdfs):
+        out = {}
+        largest_chunks = []
+        for pages, path in pdfs.items():
+            reader = PdfReader(path)
+            text = "\n\n".join(page.extract_text() or "" for page in reader.pages)
+            start = time.perf_counter()
+            chunks = views.semantic_chunking(text, max_tokens=300)
+            elapsed = time.perf_counter() - start
+            out[f"{pages}_pages"] = {
+                "seconds": elapsed,
+                "chunks": len(chunks),
+                "chunks_per_sec": len(chunks) / elapsed,
+            }
+            self.stdout.write(f"⏱️ chunk {pages} pages: {len(chunks) / elapsed:.1f} chunks/sec")
+            if len(chunks) > len(largest_chunks):
+                largest_chunks = chunks
+        return out, largest_chunks
+
+    def bench_embedding(self, views, chunks):
+        # The ingestion path; `embedding_benchmark` compares process counts
+        views.INGEST_EMBEDDER.encode(chunks[:8])  # warm-up
+        start = time.perf_counter()
+        vecs = views.INGEST_EMBEDDER.encode(chunks)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"⏱️ embed {len(chunks)} chunks: {len(chunks) / elapsed:.1f} embeddings/sec")
+        return {
+            "chunks": len(chunks),
+            "dimension": int(vecs.shape[1]),
+            "seconds": elapsed,
+            "embeddings_per_sec": len(chunks) / elapsed,
+        }
+
+    def bench_search(self, sizes, n_queries, rng):
+        import faiss
+
+        np_rng = np.random.default_rng(rng.randint(0, 2**31))
+        out = {}
+        for size in sizes:
+            index = faiss.IndexFlatL2(384)
+            index.add(np_rng.standard_normal((size, 384), dtype=np.float32))
+            queries = np_rng.standard_normal((n_queries, 384), dtype=np.float32)
+            latencies = []
+            for i in range(n_queries):
+                start = time.perf_counter()
+                index.search(queries[i:i + 1], 3)
+                latencies.append((time.perf_counter() - start) * 1000)
+            out[f"{size}_vectors"] = {
+                "queries": n_queries,
+                "latency": percentiles(latencies),
+                "queries_per_sec": n_queries / (sum(latencies) / 1000),
+            }
+            self.stdout.write(f"⏱️ search {size} vectors: p50 {out[f'{size}_vectors']['latency']['p50_ms']:.3f} ms")
+        return out
+
+    def bench_end_to_end(self, views, pdf_path, workdir, n_queries, llm_latency, rng):
+        media_dir = os.path.join(workdir, "media")
+        os.makedirs(media_dir, exist_ok=True)
+        factory = RequestFactory()
+        chat_id = 0
+        real_model, real_media_dir, real_scheduler = views.model, views.MEDIA_DIR, views.LLM_SCHEDULER
+        fake_model = FakeGeminiModel(latency=llm_latency)
+        views.model, views.MEDIA_DIR = fake_model, media_dir
+        # The fake model has no rate limits to respect; time the pipeline, not the pacing
+        views.LLM_SCHEDULER = LLMScheduler(0, 0, max_in_flight=1024, max_queue={INTERACTIVE: 1024, BATCH: 1024},
+                                           max_wait={INTERACTIVE: 60, BATCH: 60})
+        try:
+            with override_settings(MEDIA_ROOT=media_dir):
+                with open(pdf_path, "rb") as f:
+                    request = factory.post(f"/rag/chats/{chat_id}/upload_pdf/", {"file": f})
+                    start = time.perf_counter()
+                    response = views.UploadPDFToChatView.as_view()(request, chat_id=chat_id)
+                    upload_seconds = time.perf_counter() - start
+                if response.status_code != 200:
+                    raise RuntimeError(f"Benchmark upload failed: {response.data}")
+
+                query_view = views.ChatQueryView.as_view()
+                latencies = []
+                for _ in range(n_queries):
+                    question = synthetic_text(12, rng).rstrip(".") + "?"
+                    request = factory.post(f"/rag/chats/{chat_id}/query/", {"question": question},
+                                           content_type="application/json")
+                    start = time.perf_counter()
+                    response = query_view(request, chat_id=chat_id)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"Benchmark query failed: {response.data}")
+        finally:
+            views.model, views.MEDIA_DIR, views.LLM_SCHEDULER = real_model, real_media_dir, real_scheduler
+
+        latency = percentiles(latencies)
+        self.stdout.write(
+            f"⏱️ end-to-end query: p50 {latency['p50_ms']:.1f} ms, "
+            f"p95 {latency['p95_ms']:.1f} ms, p99 {latency['p99_ms']:.1f} ms"
+        )
+        return {
+            "upload_seconds": upload_seconds,
+            "queries": n_queries,
+            "llm_calls": fake_model.calls,
+            "latency": latency,
+            "queries_per_sec": n_queries / (sum(latencies) / 1000),
+        }
@@ -0,0 +1,125 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rag.benchmarking import environment_info, run_closed_loop, save_results
+
+
+def _children(pid: int):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The command name may contain spaces; fields after it are fixed
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def process_memory(pid: int) -> dict:
+    """
+    RSS, PSS, USS and shared memory of a process in bytes. PSS splits shared pages
+    between the processes mapping them, so summing it over workers gives their real
+    footprint; USS is what the process would free on exit.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[0].endswith(":") and parts[2] == "kB":
+                    fields[parts[0][:-1]] = int(parts[1]) * 1024
+    except FileNotFoundError:
+        # Kernels before 4.14: RSS only
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    fields["Rss"] = int(line.split()[1]) * 1024
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", fields.get("Rss", 0)),
+        "uss": private,
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Report memory per gunicorn worker (RSS/PSS/USS) and, optionally, query throughput "
+        "of a running server. Run once with RAG_PRELOAD=1 and once with RAG_PRELOAD=0 "
+        "and compare with --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pid", type=int, help="Gunicorn master pid.")
+        parser.add_argument("--pidfile", help="File holding the gunicorn master pid.")
+        parser.add_argument("--label", default="server", help="Name of this layout, e.g. preload or per-worker.")
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--chat-id", type=int, help="Chat with an uploaded PDF to send queries to.")
+        parser.add_argument("--duration", type=float, default=15.0, help="Seconds of query load; 0 to skip.")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--output", default="worker_memory.json")
+        parser.add_argument("--baseline", help="Results JSON of the other layout to compare against.")
+
+    def handle(self, *args, **options):
+        pid = options["pid"]
+        if options["pidfile"]:
+            with open(options["pidfile"], "r") as f:
+                pid = int(f.read().strip())
+        if not pid:
+            raise CommandError("Pass --pid or --pidfile of the gunicorn master")
+        if not os.path.exists(f"/proc/{pid}"):
+            raise CommandError(f"No process {pid} (this report needs Linux /proc)")
+
+        workers = {str(child): process_memory(child) for child in _children(pid)}
+        if not workers:
+            raise CommandError(f"Process {pid} has no workers")
+        master = process_memory(pid)
+        total_pss = master["pss"] + sum(w["pss"] for w in workers.values())
+        results = {
+            "label": options["label"],
+            "environment": environment_info(),
+            "workers": len(workers),
+            "master": master,
+            "per_worker": workers,
+            "total_pss_mb": total_pss / 2**20,
+            "pss_per_worker_mb": sum(w["pss"] for w in workers.values()) / len(workers) / 2**20,
+            "uss_per_worker_mb": sum(w["uss"] for w in workers.values()) / len(workers) / 2**20,
+        }
+        self.stdout.write(f"🧠 {options['label']}: {len(workers)} workers, {results['total_pss_mb']:.0f} MB PSS in total")
+        for worker_pid, mem in workers.items():
+            self.stdout.write(
+                f"  worker {worker_pid}: RSS {mem['rss'] / 2**20:.0f} MB, PSS {mem['pss'] / 2**20:.0f} MB, "
+                f"USS {mem['uss'] / 2**20:.0f} MB, shared {mem['shared'] / 2**20:.0f} MB"
+            )
+
+        if options["duration"] and options["chat_id"] is not None:
+            url = f"{options['base_url'].rstrip('/')}/rag/chats/{options['chat_id']}/query/"
+            mix = [("POST", url, {"json": {"question": f"What does clause {i} cover?"}}) for i in range(50)]
+            results["query"] = run_closed_loop(mix, options["concurrency"], options["duration"])
+            q = results["query"]
+            self.stdout.write(
+                f"⏱️ query: {q['requests_per_sec']:.1f} req/s, p50 {q['latency']['p50_ms']:.0f} ms, "
+                f"errors {q['error_rate']:.2%}"
+            )
+
+        save_results(results, options["output"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Saved {options['label']} results to {options['output']}"))
+
+        if options["baseline"]:
+            with open(options["baseline"], "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            self.stdout.write(f"Compared with {baseline.get('label', options['baseline'])}:")
+            ratio = results["pss_per_worker_mb"] / baseline["pss_per_worker_mb"]
+            self.stdout.write(f"  PSS per worker: {baseline['pss_per_worker_mb']:.0f} -> "
+                              f"{results['pss_per_worker_mb']:.0f} MB ({ratio:.2f}x)")
+            if "query" in results and "query" in baseline and baseline["query"]["requests_per_sec"]:
+                ratio = results["query"]["requests_per_sec"] / baseline["query"]["requests_per_sec"]
+                self.stdout.write(f"  query throughput: {ratio:.2f}x")
@@ -0,0 +1,106 @@
+import logging
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ChatMessage, ChatSummary
+
+logger = logging.getLogger(__name__)
+
+# summarizer(previous_summary, messages) -> new summary
+Summarizer = Callable[[str, List[ChatMessage]], str]
+
+
+class ConversationMemory:
+    """
+    Bounded prompt memory for one chat: the last `window_turns` turns verbatim plus
+    a rolling summary of everything older. The summary is extended incrementally,
+    one batch of at least `summary_batch` messages at a time, and stored in
+    ChatSummary so each message is summarized once. After a failed summary call
+    the chat is not summarized again for `RAG_MEMORY_SUMMARY_BACKOFF` seconds.
+    """
+
+    def __init__(self, chat_id, summarizer: Optional[Summarizer] = None,
+                 window_turns: int = None, summary_batch: int = None):
+        self.chat_id = chat_id
+        self.summarizer = summarizer
+        self.window = 2 * (window_turns or getattr(settings, "RAG_MEMORY_TURNS", 4))
+        self.summary_batch = summary_batch or getattr(settings, "RAG_MEMORY_SUMMARY_BATCH", 6)
+        self.max_pending = 8 * self.summary_batch
+        self.max_calls = getattr(settings, "RAG_MEMORY_SUMMARY_CALLS", 3)
+        self.backoff = getattr(settings, "RAG_MEMORY_SUMMARY_BACKOFF", 60)
+        self.summary_chars = getattr(settings, "RAG_MEMORY_SUMMARY_CHARS", 2000)
+        self.message_chars = getattr(settings, "RAG_MEMORY_MESSAGE_CHARS", 1000)
+
+    @property
+    def _backoff_key(self) -> str:
+        return f"rag:memory:summary_failed:{self.chat_id}"
+
+    def load(self):
+        """Return (summary, verbatim messages oldest-first), folding older messages into the summary if due."""
+        row = ChatSummary.objects.filter(chat_id=self.chat_id).first()
+        summary = row.summary if row else ""
+        through = row.summarized_through if row else 0
+
+        recent = list(
+            ChatMessage.objects.filter(chat_id=self.chat_id, id__gt=through).order_by("-id")[:self.window]
+        )[::-1]
+        if len(recent) < self.window:
+            return summary, recent
+
+        # Fold the oldest unsummarized messages in, a batch per call, until fewer than
+        # a batch are left, at most `max_calls` calls per query
+        calls = 0
+        while self.summarizer is not None and calls < self.max_calls and not cache.get(self._backoff_key):
+            pending = list(
+                ChatMessage.objects.filter(chat_id=self.chat_id, id__gt=through, id__lt=recent[0].id)
+                .order_by("id")[:self.max_pending]
+            )
+            if len(pending) < self.summary_batch:
+                break
+            calls += 1
+            try:
+                new_summary = self.summarizer(summary, pending)[:self.summary_chars]
+            except Exception as e:
+                # Do not pay for the same failing call on every query
+                logger.warning(f"Conversation summary failed for chat {self.chat_id}: {e}")
+                cache.set(self._backoff_key, True, self.backoff)
+                break
+            if self._save(through, new_summary, pending[-1].id):
+                summary, through = new_summary, pending[-1].id
+            else:
+                # A concurrent request advanced the summary first; continue from its state
+                row = ChatSummary.objects.get(chat_id=self.chat_id)
+                summary, through = row.summary, row.summarized_through
+
+        # Whatever is still unsummarized is kept verbatim from the newest side, so the
+        # messages sent are contiguous with the window
+        unsummarized = list(
+            ChatMessage.objects.filter(chat_id=self.chat_id, id__gt=through, id__lt=recent[0].id)
+            .order_by("-id")[:self.summary_batch]
+        )[::-1]
+        return summary, unsummarized + recent
+
+    def _save(self, through: int, summary: str, new_through: int) -> bool:
+        """Store the summary unless a concurrent request already moved past `through`."""
+        if through == 0:
+            _, created = ChatSummary.objects.get_or_create(
+                chat_id=self.chat_id, defaults={"summary": summary, "summarized_through": new_through}
+            )
+            if created:
+                return True
+        # Optimistic update: a concurrent request may already have advanced the summary
+        return ChatSummary.objects.filter(chat_id=self.chat_id, summarized_through=through).update(
+            summary=summary, summarized_through=new_through
+        ) == 1
+
+    def render(self) -> str:
+        """Conversation history as prompt text, bounded by window and summary size."""
+        summary, messages = self.load()
+        lines = []
+        if summary:
+            lines.append("Summary of earlier conversation: " + summary)
+        for message in messages:
+            lines.append(f"{message.sender}: {message.content[:self.message_chars]}")
+        return "\n".join(lines)
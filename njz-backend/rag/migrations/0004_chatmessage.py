@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _parse_timestamp(value, fallback):
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return fallback
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_default_timezone())
+    return parsed
+
+
+def copy_messages_to_table(apps, schema_editor):
+    Chat = apps.get_model('rag', 'Chat')
+    ChatMessage = apps.get_model('rag', 'ChatMessage')
+    batch = []
+    for chat in Chat.objects.only('id', 'created_at', 'messages').iterator():
+        for message in chat.messages or []:
+            if not isinstance(message, dict):
+                continue
+            batch.append(ChatMessage(
+                chat_id=chat.id,
+                sender=str(message.get('sender', 'user'))[:16],
+                content=message.get('content', ''),
+                created_at=_parse_timestamp(message.get('timestamp'), chat.created_at),
+            ))
+        if len(batch) >= 1000:
+            ChatMessage.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        ChatMessage.objects.bulk_create(batch)
+
+
+def copy_messages_to_json(apps, schema_editor):
+    Chat = apps.get_model('rag', 'Chat')
+    ChatMessage = apps.get_model('rag', 'ChatMessage')
+    for chat in Chat.objects.iterator():
+        chat.messages = [
+            {'content': m.content, 'sender': m.sender, 'timestamp': str(m.created_at)}
+            for m in ChatMessage.objects.filter(chat_id=chat.id).order_by('id')
+        ]
+        chat.save(update_fields=['messages'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0003_remove_chat_conversation_chat_messages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sender', models.CharField(max_length=16)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='rag.chat')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['chat', 'id'], name='rag_chatmsg_chat_id_idx')],
+            },
+        ),
+        migrations.RunPython(copy_messages_to_table, copy_messages_to_json),
+        migrations.RemoveField(
+            model_name='chat',
+            name='messages',
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='chat',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='rag.chat'),
+        ),
+    ]
@@ -1,14 +1,36 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Create your models here.
 
 class Chat(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chats')
     name = models.CharField(max_length=255)
-    messages = models.JSONField(default=list, blank=True)  # Store structured message data
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Serves the newest-first chat list of a user as a backward index scan
+        indexes = [models.Index(fields=['user', 'created_at', 'id'], name='rag_chat_user_created_idx')]
+
+class ChatMessage(models.Model):
+    # One row per message so appends never rewrite the conversation
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
+    sender = models.CharField(max_length=16)
+    content = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['chat', 'id'], name='rag_chatmsg_chat_id_idx')]
+
+class ChatSummary(models.Model):
+    # Rolling summary of the messages that fell out of the verbatim memory window
+    chat = models.OneToOneField(Chat, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    summary = models.TextField(blank=True, default='')
+    summarized_through = models.BigIntegerField(default=0)  # id of the last ChatMessage folded in
+    updated_at = models.DateTimeField(auto_now=True)
+
 class KnowledgeGraph(models.Model):
     chat = models.OneToOneField(Chat, on_delete=models.CASCADE, related_name='knowledge_graph')
     graph_data = models.JSONField()
@@ -0,0 +1,43 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class MessageCursorPagination(CursorPagination):
+    """
+    Keyset pagination over message ids. The first page holds the newest
+    messages; "next" walks back in time. Each page is returned oldest-first
+    so it can be rendered directly.
+    """
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 200
+
+    def get_paginated_response(self, data):
+        return Response({
+            'messages': list(reversed(data)),
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        })
+
+
+class ChatCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a user's chats, newest first. Pages seek on
+    created_at through the (user, created_at, id) index, so a page costs the
+    same at any depth and no COUNT(*) is run. The cursor holds a single
+    created_at position: chats created in the same instant are stepped over
+    with an offset in the cursor, which id keeps stable, and are never
+    skipped or repeated.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_paginated_response(self, data):
+        return Response({
+            'chats': data,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        })
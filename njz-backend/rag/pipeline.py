@@ -0,0 +1,285 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pypdf import PdfReader
+
+from . import tracing
+from .knowledge_graph import CooccurrenceCounts
+from .metrics import count_items, stage
+
+# A sentence running across this many characters of page text is chunked as-is
+# rather than carried into the next page, so the carry never grows unbounded
+MAX_CARRY_CHARS = 20_000
+
+
+# ========== SENTENCE CHUNKING ==========
+class SentenceChunker:
+    """
+    Incremental form of semantic_chunking: feed spaCy sentences one at a time and
+    collect chunks as they close. Chunks are limited by whitespace token count and
+    start with the last `overlap` spaCy tokens of what came before.
+    """
+
+    def __init__(self, nlp, max_tokens: int = 400, overlap: int = 100):
+        self.nlp = nlp
+        self.max_tokens = max_tokens
+        self.current_sents: List[str] = []
+        self.current_token_count = 0
+        self.token_tail = deque(maxlen=overlap) if overlap > 0 else None
+
+    def add(self, sent) -> Optional[str]:
+        """Add one sentence; returns the chunk it closed, if any."""
+        emitted = None
+        sent_token_count = len(sent.text.split())
+        if self.current_token_count + sent_token_count > self.max_tokens:
+            chunk_text = " ".join(self.current_sents).strip()
+            if chunk_text:
+                emitted = chunk_text
+            # Overlap from the end of the last chunk
+            overlap_text = " ".join(self.token_tail) if self.token_tail else ""
+            overlap_sents = [s.text for s in self.nlp(overlap_text).sents]
+            self.current_sents = overlap_sents + [sent.text]
+            self.current_token_count = len(" ".join(self.current_sents).split())
+        else:
+            self.current_sents.append(sent.text)
+            self.current_token_count += sent_token_count
+        if self.token_tail is not None:
+            self.token_tail.extend(tok.text for tok in sent)
+        return emitted
+
+    def flush(self) -> Optional[str]:
+        chunk_text = " ".join(self.current_sents).strip()
+        self.current_sents = []
+        self.current_token_count = 0
+        return chunk_text or None
+
+
+# ========== STAGES ==========
+def iter_pages(file_path: str) -> Iterator[str]:
+    """Page texts, one at a time; the document is never joined into one string."""
+    reader = PdfReader(file_path)
+    for page in reader.pages:
+        with stage("extract"):
+            text = page.extract_text() or ""
+        count_items("extract", 1, "pages")
+        yield text
+
+
+def iter_chunks(pages: Iterable[str], nlp, max_tokens: int = 300, overlap: int = 100,
+                on_doc: Optional[Callable] = None) -> Iterator[str]:
+    """
+    Chunk a stream of page texts. The last (possibly unfinished) sentence of each
+    page is carried into the next one so sentence boundaries match chunking the
+    joined text. `on_doc` is given each parsed spaCy doc, e.g. to count entities
+    without running the pipeline again; carried sentences are parsed twice.
+    """
+    chunker = SentenceChunker(nlp, max_tokens=max_tokens, overlap=overlap)
+    carry = ""
+    for page_text in pages:
+        text = carry + "\n\n" + page_text if carry else page_text
+        with stage("chunk"):
+            doc = nlp(text)
+            if on_doc is not None:
+                on_doc(doc)
+            sents = list(doc.sents)
+            if sents and len(text) - sents[-1].start_char <= MAX_CARRY_CHARS:
+                closing, carry = sents[:-1], text[sents[-1].start_char:]
+            else:
+                closing, carry = sents, ""
+            chunks = [c for c in (chunker.add(sent) for sent in closing) if c]
+        count_items("chunk", len(chunks), "chunks")
+        yield from chunks
+    with stage("chunk"):
+        chunks = []
+        if carry:
+            doc = nlp(carry)
+            if on_doc is not None:
+                on_doc(doc)
+            chunks = [c for c in (chunker.add(sent) for sent in doc.sents) if c]
+        last = chunker.flush()
+        if last:
+            chunks.append(last)
+    count_items("chunk", len(chunks), "chunks")
+    yield from chunks
+
+
+def iter_embedding_batches(chunks: Iterable[str], embedder, batch_size: int = 64):
+    """(chunk texts, float32 vectors) per batch of `batch_size` chunks."""
+    def encode(batch):
+        with stage("embed"):
+            vecs = embedder.encode(batch, batch_size=batch_size, convert_to_numpy=True).astype("float32")
+        count_items("embed", len(batch), "vectors")
+        return batch, vecs
+
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield encode(batch)
+            batch = []
+    if batch:
+        yield encode(batch)
+
+
+# ========== THREADED PIPELINE ==========
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def pipelined(source: Iterable, *stages: Callable[[Iterator], Iterator], maxsize: int = 4) -> Iterator:
+    """
+    Run `source` and each stage in its own thread, connected by bounded queues, and
+    yield the last stage's output. Each stage takes an iterator and returns one.
+    The queues bound how far a fast stage can run ahead, which keeps memory flat.
+    pypdf and spaCy hold the GIL, so parsing and chunking take turns rather than run
+    together; what overlaps is the embedding stage, whose torch kernels release the
+    GIL, with the parsing and chunking of the next pages. Whole files are chunked in
+    parallel by ChunkingPool instead.
+    """
+    stop = threading.Event()
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def drain(q) -> Iterator:
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+
+    def run(iterable, out_q):
+        try:
+            for item in iterable:
+                if not put(out_q, item):
+                    return
+            put(out_q, _DONE)
+        except BaseException as e:
+            put(out_q, _Failure(e))
+
+    threads = []
+    # Stage threads open their spans under the caller's current span
+    run = tracing.traced(run)
+    q = queue.Queue(maxsize=maxsize)
+    threads.append(threading.Thread(target=run, args=(source, q), daemon=True))
+    for stage_fn in stages:
+        out_q = queue.Queue(maxsize=maxsize)
+        threads.append(threading.Thread(target=run, args=(stage_fn(drain(q)), out_q), daemon=True))
+        q = out_q
+    for thread in threads:
+        thread.start()
+    try:
+        yield from drain(q)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+
+def stream_pdf_to_index(file_path: str, source: str, index, embedder, nlp,
+                        max_tokens: int = 300, batch_size: int = 64, on_doc: Optional[Callable] = None) -> List[dict]:
+    """
+    Extract, chunk, embed and append one PDF to `index` with the stages overlapped.
+    Returns the metadata entries for the appended vectors, in index order.
+    """
+    metadata = []
+    batches = pipelined(
+        iter_pages(file_path),
+        lambda pages: iter_chunks(pages, nlp, max_tokens=max_tokens, on_doc=on_doc),
+        lambda chunks: iter_embedding_batches(chunks, embedder, batch_size=batch_size),
+    )
+    for chunks, vecs in batches:
+        with stage("index_write"):
+            index.add(vecs)
+        metadata.extend(
+            {"source": source, "chunk_id": len(metadata) + i, "chunk_text": chunk} for i, chunk in enumerate(chunks)
+        )
+    return metadata
+
+
+# ========== CHUNKING PROCESSES ==========
+_worker_nlp = None
+
+
+def _init_chunking_worker(spacy_model: str):
+    global _worker_nlp
+    import spacy
+
+    _worker_nlp = spacy.load(spacy_model)
+
+
+def chunk_pdf(file_path: str, nlp, max_tokens: int = 300, overlap: int = 100, max_entities: Optional[int] = None):
+    """
+    (chunks, entity counts, None) for one PDF, or (None, None, error). Entities are
+    counted from the chunking parse when `max_entities` is given.
+    """
+    counts = CooccurrenceCounts(max_entities=max_entities) if max_entities is not None else None
+    try:
+        chunks = list(iter_chunks(iter_pages(file_path), nlp, max_tokens=max_tokens, overlap=overlap,
+                                  on_doc=counts.add_doc if counts is not None else None))
+    except Exception as e:
+        return None, None, str(e)
+    return chunks, counts, None
+
+
+def _chunk_pdf(file_path: str, max_tokens: int, overlap: int, max_entities: Optional[int]):
+    return chunk_pdf(file_path, _worker_nlp, max_tokens=max_tokens, overlap=overlap, max_entities=max_entities)
+
+
+class ChunkingPool:
+    """
+    Extract and chunk whole PDFs in worker processes. pypdf and spaCy hold the GIL,
+    so threads would only take turns; processes run them on separate cores. The
+    pool is started on first use with spawn (never fork a process that has run
+    torch), each worker loading its own spaCy pipeline, and then kept.
+    """
+
+    def __init__(self, processes: int, spacy_model: str):
+        self.processes = processes
+        self.spacy_model = spacy_model
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "ChunkingPool":
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_chunking_worker, initargs=(self.spacy_model,),
+                )
+        return self
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def map(self, file_paths: Sequence[str], max_tokens: int = 300, overlap: int = 100,
+            max_entities: Optional[int] = None) -> Iterator[Tuple[Optional[List[str]], Optional[CooccurrenceCounts], Optional[str]]]:
+        """chunk_pdf's result per file, in input order, as each is ready."""
+        self.start()
+        return self._pool.map(_chunk_pdf, file_paths, itertools.repeat(max_tokens), itertools.repeat(overlap),
+                              itertools.repeat(max_entities))
@@ -0,0 +1,47 @@
+"""
+Model preloading for pre-forked servers.
+
+With gunicorn's preload_app the master imports the app once; `preload_models`
+then loads the embedding model, the spaCy pipeline, the global index and the
+hot chat indexes before any worker is forked, so workers share those pages
+copy-on-write instead of each holding a private copy. See gunicorn.conf.py.
+"""
+import gc
+import os
+
+
+def set_inference_threads(threads: int):
+    """Pin the torch and FAISS (OpenMP) thread pools of this process."""
+    import faiss
+    import torch
+
+    torch.set_num_threads(threads)
+    faiss.omp_set_num_threads(threads)
+
+
+def threads_per_worker(workers: int) -> int:
+    configured = os.environ.get("RAG_TORCH_THREADS")
+    if configured:
+        return max(1, int(configured))
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def preload_models():
+    # Run the warm-up single-threaded so no OpenMP pool exists in the master at fork
+    # time; each worker sizes its own pool after forking.
+    set_inference_threads(1)
+
+    from django.db import connections
+    from rag import views
+
+    # Touch the lazily initialised parts of the models before forking
+    views.embedding_model.encode(["warm up"], convert_to_numpy=True)
+    views.nlp("Warm up.")
+    views.preload_hot_chats()
+
+    # Workers must open their own database connections
+    connections.close_all()
+    # Move everything loaded so far out of the collector's reach: collections in the
+    # workers would otherwise write to these objects' headers and un-share their pages
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,134 @@
+import cProfile
+import hmac
+import logging
+import os
+import pstats
+import random
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "HTTP_X_RAG_PROFILE"
+PROFILE_TOKEN_HEADER = "HTTP_X_RAG_PROFILE_TOKEN"
+
+
+# ========== REQUEST SELECTION ==========
+def _request_user(request):
+    """
+    The signed-in user of a Django request: the session user, or the user of a
+    bearer token. The profiled views turn DRF authentication off, so the token
+    is checked here, from its claims and without a database lookup.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken
+
+    try:
+        authenticated = JWTStatelessUserAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return authenticated[0] if authenticated else None
+
+
+def _is_authorized(request) -> bool:
+    user = _request_user(request)
+    if user is not None and getattr(user, "is_staff", False):
+        return True
+    expected = getattr(settings, "RAG_PROFILING_TOKEN", "")
+    supplied = request.META.get(PROFILE_TOKEN_HEADER, "")
+    return bool(expected) and hmac.compare_digest(expected, supplied)
+
+
+def profiling_mode(request) -> Optional[str]:
+    """
+    "requested" when an authorized caller asked for a profile via the
+    X-RAG-Profile header or ?profile=1, "sampled" when picked by
+    RAG_PROFILE_SAMPLE_RATE, otherwise None.
+    """
+    flag = request.META.get(PROFILE_HEADER) or request.GET.get("profile")
+    if flag and flag.lower() not in ("0", "false", "no") and _is_authorized(request):
+        return "requested"
+    rate = getattr(settings, "RAG_PROFILE_SAMPLE_RATE", 0.0)
+    if rate > 0 and random.random() < rate:
+        return "sampled"
+    return None
+
+
+# ========== STORAGE & SUMMARY ==========
+def get_profile_dir() -> str:
+    profile_dir = getattr(settings, "RAG_PROFILE_DIR", None) or os.path.join(settings.BASE_DIR, ".profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    return profile_dir
+
+
+def summarize_profile(profiler: cProfile.Profile, limit: int = 25) -> List[dict]:
+    """Top functions by cumulative time."""
+    stats = pstats.Stats(profiler).stats
+    rows = []
+    for (filename, lineno, funcname), (cc, ncalls, tottime, cumtime, _) in stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{lineno}({funcname})",
+            "ncalls": ncalls,
+            "tottime": round(tottime, 6),
+            "cumtime": round(cumtime, 6),
+        })
+    rows.sort(key=lambda row: row["cumtime"], reverse=True)
+    return rows[:limit]
+
+
+def save_profile(profiler: cProfile.Profile, view_name: str) -> str:
+    """Dump the raw profile (readable with pstats/snakeviz) and a text summary next to it."""
+    profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{view_name}-{uuid.uuid4().hex[:8]}"
+    base = os.path.join(get_profile_dir(), profile_id)
+    profiler.dump_stats(base + ".prof")
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        stats = pstats.Stats(profiler, stream=f)
+        stats.sort_stats("cumulative").print_stats(getattr(settings, "RAG_PROFILE_TOP_N", 25))
+    return profile_id
+
+
+# ========== VIEW MIXIN ==========
+class ProfiledViewMixin:
+    """
+    Opt-in cProfile wrapper for APIViews. Requested profiles are saved and their
+    top functions are returned under "profile" in the JSON body; sampled profiles
+    are only saved to RAG_PROFILE_DIR.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        mode = profiling_mode(request)
+        if mode is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return super().dispatch(request, *args, **kwargs)
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        finally:
+            profiler.disable()
+
+        view_name = type(self).__name__
+        try:
+            profile_id = save_profile(profiler, view_name)
+        except OSError as e:
+            logger.warning(f"Could not save profile for {view_name}: {e}")
+            return response
+        logger.info(f"🔬 Saved {mode} profile {profile_id}")
+        response["X-RAG-Profile-Id"] = profile_id
+        if mode == "requested" and isinstance(getattr(response, "data", None), dict):
+            response.data["profile"] = {
+                "id": profile_id,
+                "top_functions": summarize_profile(profiler, getattr(settings, "RAG_PROFILE_TOP_N", 25)),
+            }
+        return response
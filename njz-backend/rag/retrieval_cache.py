@@ -0,0 +1,52 @@
+import hashlib
+import re
+import unicodedata
+from typing import List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import counter
+
+RETRIEVAL_CACHE_LOOKUPS = counter(
+    "rag_retrieval_cache_lookups_total", "Retrieval cache lookups by result.", ["result"]
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+Hits = Tuple[List[int], List[float]]
+
+
+def normalize_query(query: str) -> str:
+    """Queries differing only in case, Unicode form or spacing share a cache entry."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", query)).strip().casefold()
+
+
+def cache_key(chat_id, index_version: str, query: str, top_k: int, sources: Sequence[str] = ()) -> str:
+    scope = normalize_query(query)
+    if sources:
+        # A source-filtered search is a different result set for the same query
+        scope += "\x00" + "\x00".join(sorted(sources))
+    digest = hashlib.sha256(scope.encode("utf-8")).hexdigest()
+    return f"rag:retrieval:{chat_id}:{index_version}:{top_k}:{digest}"
+
+
+def get_hits(chat_id, index_version: str, query: str, top_k: int, sources: Sequence[str] = ()) -> Optional[Hits]:
+    """
+    Cached top-k (chunk ids, distances) of `query` against this version of the chat's
+    index. The version is part of the key, so rewriting the index invalidates every
+    entry for the chat without touching the cache; stale entries just expire.
+    """
+    ttl = getattr(settings, "RAG_RETRIEVAL_CACHE_TTL", 600)
+    if not ttl:
+        return None
+    hits = cache.get(cache_key(chat_id, index_version, query, top_k, sources))
+    RETRIEVAL_CACHE_LOOKUPS.inc(result="miss" if hits is None else "hit")
+    return hits
+
+
+def set_hits(chat_id, index_version: str, query: str, top_k: int, ids, distances, sources: Sequence[str] = ()):
+    ttl = getattr(settings, "RAG_RETRIEVAL_CACHE_TTL", 600)
+    if ttl:
+        hits = ([int(i) for i in ids], [float(x) for x in distances])
+        cache.set(cache_key(chat_id, index_version, query, top_k, sources), hits, ttl)
@@ -1,12 +1,25 @@
 from rest_framework import serializers
-from .models import Chat, KnowledgeGraph
+from .models import Chat, ChatMessage, KnowledgeGraph
 
 class ChatSerializer(serializers.ModelSerializer):
     class Meta:
         model = Chat
         fields = '__all__'
 
+class ChatListSerializer(serializers.ModelSerializer):
+    # List rows only; messages are paged separately through ChatMessageView
+    class Meta:
+        model = Chat
+        fields = ['id', 'name', 'created_at']
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    timestamp = serializers.DateTimeField(source='created_at', read_only=True)
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'content', 'sender', 'timestamp']
+
 class KnowledgeGraphSerializer(serializers.ModelSerializer):
     class Meta:
         model = KnowledgeGraph
-        fields = '__all__' 
\ No newline at end of file
+        fields = '__all__' 
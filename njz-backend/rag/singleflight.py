@@ -0,0 +1,58 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from .metrics import counter
+
+FLIGHT_CALLS = counter(
+    "rag_singleflight_calls_total", "Computations actually run by a singleflight group.", ["flight"]
+)
+FLIGHT_SAVED_CALLS = counter(
+    "rag_singleflight_saved_calls_total",
+    "Callers that shared an identical in-flight computation instead of running their own.",
+    ["flight"],
+)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the function,
+    callers arriving while it runs wait for it and get the same result (or exception).
+    Nothing is cached once the call finishes; that is left to the callers' caches.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            FLIGHT_SAVED_CALLS.inc(flight=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        FLIGHT_CALLS.inc(flight=self.name)
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -1,3 +1,1568 @@
-from django.test import TestCase
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import runpy
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, TestCase, SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient
+
+import faiss
+import numpy as np
+
+from api.authentication import ClaimsRefreshToken
+
+from . import preload, tiering, tracing, views
+from .batch_answering import group_by_overlap, parse_batch_answers
+from .benchmarking import compare_results, make_synthetic_pdf, percentiles
+from .chunkstore import ChunkStore, append_chunk_store, load_chunk_store, truncate_chunk_store, write_chunk_store
+from .embedding_engine import EmbeddingEngine, length_sorted_batches
+from .gemini_rest import GeminiRESTModel
+from .knowledge_graph import CooccurrenceCounts, GraphStore, extract_cooccurrences
+from .llm_scheduler import BATCH, INTERACTIVE, LLMBusy, LLMScheduler
+from .loadtest import FakeGeminiServer, poisson_schedule, run_open_loop
+from .management.commands import ingest_pdfs
+from .memory import ConversationMemory
+from .metrics import Counter, Gauge, Histogram, Registry, count_items, stage
+from .models import Chat, ChatMessage
+from .pagination import ChatCursorPagination
+from .pipeline import iter_chunks, iter_pages, pipelined
+from .singleflight import FLIGHT_SAVED_CALLS, SingleFlight
+from .transfer import FileTooLarge, download_to_temp, save_upload_to_temp
+
+
+# Requests to the traced views write their spans here rather than to the real RAG_TRACE_DIR
+_trace_settings = None
+
+
+def setUpModule():
+    global _trace_settings
+    _trace_settings = override_settings(RAG_TRACE_DIR=tempfile.mkdtemp())
+    _trace_settings.enable()
+
+
+def tearDownModule():
+    trace_dir = settings.RAG_TRACE_DIR
+    _trace_settings.disable()
+    shutil.rmtree(trace_dir, ignore_errors=True)
+
+
+class BenchmarkingTests(SimpleTestCase):
+    def test_percentiles_of_no_samples(self):
+        self.assertEqual(percentiles([]), {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0})
+
+    def test_single_sample_is_every_percentile(self):
+        self.assertEqual(percentiles([12.5], points=(0, 50, 100), suffix='_s'),
+                         {'p0_s': 12.5, 'p50_s': 12.5, 'p100_s': 12.5})
+
+    def test_percentiles_are_nearest_rank(self):
+        self.assertEqual(percentiles(list(range(100, 0, -1))), {'p50_ms': 50, 'p95_ms': 95, 'p99_ms': 99})
+        self.assertEqual(percentiles([4, 1, 3, 2], points=(25, 50, 75)), {'p25_ms': 1, 'p50_ms': 2, 'p75_ms': 3})
+
+    def test_regressions_past_the_tolerance(self):
+        baseline = {'query': {'p95_ms': 100.0, 'queries_per_sec': 50.0}, 'ingest': {'pages_per_sec': 10.0}}
+        current = {'query': {'p95_ms': 111.0, 'queries_per_sec': 44.0}, 'ingest': {'pages_per_sec': 9.4}}
+        self.assertEqual(compare_results(current, baseline, tolerance=0.10), [
+            'query.p95_ms: 100.00 -> 111.00',
+            'query.queries_per_sec: 50.00 -> 44.00',
+        ])
+        self.assertEqual(compare_results(current, baseline, tolerance=0.05), [
+            'query.p95_ms: 100.00 -> 111.00',
+            'query.queries_per_sec: 50.00 -> 44.00',
+            'ingest.pages_per_sec: 10.00 -> 9.40',
+        ])
+
+    def test_what_is_not_a_regression(self):
+        baseline = {'p50_ms': 100.0, 'docs_per_sec': 10.0, 'chunks': 40, 'startup_ms': 0, 'removed_ms': 5.0}
+        current = {'p50_ms': 110.0, 'docs_per_sec': 30.0, 'chunks': 10, 'startup_ms': 50.0, 'added_ms': 1.0}
+        # At the tolerance, better, not a timing or rate, no baseline value, or only on one side
+        self.assertEqual(compare_results(current, baseline, tolerance=0.10), [])
+
+
+class ChatMessageQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bob', password='S3cure-pass-123')
+        self.chat = Chat.objects.create(user=self.user, name='policy questions')
+        ChatMessage.objects.bulk_create([
+            ChatMessage(chat=self.chat, sender='user' if i % 2 == 0 else 'ai', content=f'message {i}')
+            for i in range(120)
+        ])
+        self.client = APIClient()
+        self.url = reverse('rag:chat_message', args=[self.chat.id])
+
+    def test_message_page_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'limit': 20})
+        self.assertEqual(response.status_code, 200)
+        contents = [m['content'] for m in response.data['messages']]
+        self.assertEqual(contents, [f'message {i}' for i in range(100, 120)])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_next_cursor_walks_back_in_time(self):
+        first = self.client.get(self.url, {'limit': 50})
+        with self.assertNumQueries(1):
+            second = self.client.get(first.data['next'])
+        contents = [m['content'] for m in second.data['messages']]
+        self.assertEqual(contents, [f'message {i}' for i in range(20, 70)])
+
+    def test_previous_link_returns_newer_page_oldest_first(self):
+        first = self.client.get(self.url, {'limit': 30})
+        second = self.client.get(first.data['next'])
+        with self.assertNumQueries(1):
+            back = self.client.get(second.data['previous'])
+        self.assertEqual([m['content'] for m in back.data['messages']], [f'message {i}' for i in range(90, 120)])
+        self.assertEqual(back.data['messages'], first.data['messages'])
+
+    def test_append_cost_does_not_grow_with_history(self):
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, {'content': 'short chat', 'sender': 'user'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(chat=self.chat, sender='user', content='filler') for _ in range(1000)
+        ])
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, {'content': 'long chat', 'sender': 'user'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_append_to_missing_chat(self):
+        url = reverse('rag:chat_message', args=[self.chat.id + 1])
+        response = self.client.post(url, {'content': 'hello'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class ConversationMemoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.chat = Chat.objects.create(user=User.objects.create_user(username='erin'), name='memory')
+        self.calls = []
+
+    def add_messages(self, count):
+        ChatMessage.objects.bulk_create([
+            ChatMessage(chat=self.chat, sender='user', content=f'message {i}') for i in range(count)
+        ])
+
+    def summarize(self, summary, messages):
+        self.calls.append([m.content for m in messages])
+        return f'{summary}+{len(messages)}'
+
+    def memory(self, summarizer=None):
+        return ConversationMemory(self.chat.id, summarizer or self.summarize, window_turns=2, summary_batch=3)
+
+    def test_short_chat_is_verbatim(self):
+        self.add_messages(3)
+        summary, messages = self.memory().load()
+        self.assertEqual(summary, '')
+        self.assertEqual([m.content for m in messages], ['message 0', 'message 1', 'message 2'])
+        self.assertEqual(self.calls, [])
+
+    def test_older_messages_are_summarized_once(self):
+        self.add_messages(10)
+        summary, messages = self.memory().load()
+        self.assertEqual(summary, '+6')
+        self.assertEqual([m.content for m in messages], [f'message {i}' for i in range(6, 10)])
+        self.assertEqual(self.calls, [[f'message {i}' for i in range(6)]])
+        self.assertEqual(self.memory().load()[0], '+6')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_less_than_a_batch_stays_verbatim(self):
+        self.add_messages(6)
+        summary, messages = self.memory().load()
+        self.assertEqual(summary, '')
+        self.assertEqual([m.content for m in messages], [f'message {i}' for i in range(6)])
+
+    def test_backlog_is_summarized_in_capped_batches(self):
+        # 96 messages before the window: 4 full batches of 8 * summary_batch
+        self.add_messages(100)
+        with self.settings(RAG_MEMORY_SUMMARY_CALLS=3):
+            summary, messages = self.memory().load()
+        self.assertEqual(summary, '+24+24+24')
+        self.assertEqual([len(batch) for batch in self.calls], [24, 24, 24])
+        self.assertEqual(self.calls[1][0], 'message 24')
+        # What is left is sent from the newest side, contiguous with the window
+        self.assertEqual([m.content for m in messages], [f'message {i}' for i in range(93, 100)])
+        self.memory().load()
+        self.assertEqual(len(self.calls), 4)
+
+    def test_failed_summary_keeps_newest_messages_and_backs_off(self):
+        self.add_messages(10)
+        failing = mock.Mock(side_effect=RuntimeError('LLM down'))
+        summary, messages = self.memory(failing).load()
+        self.assertEqual(summary, '')
+        self.assertEqual([m.content for m in messages], [f'message {i}' for i in range(3, 10)])
+        self.memory(failing).load()
+        self.assertEqual(failing.call_count, 1)
+        cache.clear()  # backoff expired
+        self.assertEqual(self.memory().load()[0], '+6')
+
+
+class ChatMessageMigrationTests(TransactionTestCase):
+    before = [('rag', '0003_remove_chat_conversation_chat_messages')]
+    after = [('rag', '0004_chatmessage')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_json_messages_become_rows_and_back(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model('auth', 'User').objects.create(username='grace')
+        Chat = apps.get_model('rag', 'Chat')
+        chat = Chat.objects.create(user_id=user.id, name='old', messages=[
+            {'content': 'first', 'sender': 'user', 'timestamp': '2025-01-02T03:04:05'},
+            'not a message',
+            {'content': 'second', 'sender': 'assistant-with-a-long-name', 'timestamp': 'yesterday'},
+            {'content': 'third'},
+        ])
+        empty = Chat.objects.create(user_id=user.id, name='empty', messages=[])
+
+        apps = self.migrate(self.after)
+        rows = list(apps.get_model('rag', 'ChatMessage').objects.filter(chat_id=chat.id).order_by('id'))
+        self.assertEqual([(m.content, m.sender) for m in rows],
+                         [('first', 'user'), ('second', 'assistant-with-a'), ('third', 'user')])
+        self.assertEqual(rows[0].created_at, datetime(2025, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc))
+        # Missing or unreadable timestamps fall back to the chat's creation time
+        self.assertEqual(rows[1].created_at, chat.created_at)
+        self.assertFalse(apps.get_model('rag', 'ChatMessage').objects.filter(chat_id=empty.id).exists())
+
+        apps = self.migrate(self.before)
+        restored = apps.get_model('rag', 'Chat').objects.get(id=chat.id).messages
+        self.assertEqual([(m['content'], m['sender']) for m in restored],
+                         [('first', 'user'), ('second', 'assistant-with-a'), ('third', 'user')])
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def load_settings(self, **env):
+        """backend/settings.py evaluated with only the given DB_* variables set."""
+        with mock.patch.dict(os.environ, env):
+            for name in [name for name in os.environ if name.startswith('DB_') and name not in env]:
+                del os.environ[name]
+            return runpy.run_path(os.path.join(settings.BASE_DIR, 'backend', 'settings.py'))['DATABASES']['default']
+
+    def test_postgres_block(self):
+        db = self.load_settings(DB_ENGINE='postgres', DB_NAME='rag', DB_HOST='db', DB_CONN_MAX_AGE='30')
+        self.assertEqual((db['ENGINE'], db['NAME'], db['HOST']), ('django.db.backends.postgresql', 'rag', 'db'))
+        self.assertEqual((db['CONN_MAX_AGE'], db['OPTIONS']), (30, {}))
+        self.assertTrue(db['CONN_HEALTH_CHECKS'])
+        pooled = self.load_settings(DB_ENGINE='postgresql', DB_POOL='on', DB_POOL_MAX_SIZE='4')
+        # The pool owns the connections; Django does not also keep them
+        self.assertEqual(pooled['CONN_MAX_AGE'], 0)
+        self.assertEqual(pooled['OPTIONS']['pool'], {'min_size': 2, 'max_size': 4, 'timeout': 10})
+
+    def test_sqlite_tuning_is_applied_to_the_connection(self):
+        db = self.load_settings(DB_NAME=os.path.join(tempfile.mkdtemp(), 'tuned.sqlite3'))
+        self.assertEqual(db['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        tuned = DatabaseWrapper(connections.configure_settings({'default': db})['default'], alias='tuned')
+        self.addCleanup(tuned.close)
+        with tuned.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 20000)
+        other = sqlite3.connect(db['NAME'], timeout=0)
+        self.addCleanup(other.close)
+        # What atomic() does on entry: begin a transaction with the configured mode
+        tuned.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        # BEGIN IMMEDIATE took the write lock before anything was written
+        with self.assertRaisesRegex(sqlite3.OperationalError, 'locked'):
+            other.execute('BEGIN IMMEDIATE')
+        tuned.rollback()
+        tuned.set_autocommit(True)
+        other.execute('BEGIN IMMEDIATE')
+        other.rollback()
+
+    def test_sqlite_tuning_can_be_turned_off(self):
+        db = self.load_settings(DB_SQLITE_TUNING='off')
+        self.assertEqual((db['ENGINE'], db['OPTIONS'], db['CONN_MAX_AGE']), ('django.db.backends.sqlite3', {}, 0))
+
+
+class DatabaseBenchmarkCommandTests(TestCase):
+    def test_benchmark_user_and_messages_are_removed(self):
+        from .management.commands import db_benchmark
+
+        def chat_write(requests_mix, concurrency, duration):
+            chat = Chat.objects.get(user__username=db_benchmark.BENCH_USERNAME)
+            ChatMessage.objects.create(chat=chat, sender='user', content='benchmark message')
+            raise RuntimeError('server went away')
+
+        mock.patch.object(db_benchmark.Command, 'login', return_value='token').start()
+        mock.patch.object(db_benchmark, 'run_closed_loop', side_effect=chat_write).start()
+        self.addCleanup(mock.patch.stopall)
+        with self.assertRaises(RuntimeError):
+            call_command('db_benchmark', output=os.path.join(tempfile.mkdtemp(), 'bench.json'))
+        self.assertFalse(User.objects.filter(username=db_benchmark.BENCH_USERNAME).exists())
+        self.assertEqual(ChatMessage.objects.count(), 0)
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_labels_are_escaped(self):
+        calls = self.registry.register(Counter('test_calls_total', 'Calls.', ['path']))
+        calls.inc(path='/a')
+        calls.inc(2, path='say "hi"\\now')
+        self.assertEqual(self.registry.render().splitlines(), [
+            '# HELP test_calls_total Calls.',
+            '# TYPE test_calls_total counter',
+            'test_calls_total{path="/a"} 1.0',
+            'test_calls_total{path="say \\"hi\\"\\\\now"} 2.0',
+        ])
+
+    def test_histogram_buckets_are_cumulative(self):
+        latency = self.registry.register(Histogram('test_seconds', 'Latency.', ['stage'], buckets=(0.1, 1.0)))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.observe(value, stage='embed')
+        self.assertEqual(self.registry.render().splitlines()[2:], [
+            'test_seconds_bucket{stage="embed",le="0.1"} 2',
+            'test_seconds_bucket{stage="embed",le="1.0"} 3',
+            'test_seconds_bucket{stage="embed",le="+Inf"} 4',
+            'test_seconds_sum{stage="embed"} 3.65',
+            'test_seconds_count{stage="embed"} 4',
+        ])
+
+    def test_gauge_functions_are_read_at_scrape_time(self):
+        size = self.registry.register(Gauge('test_entries', 'Entries.', ['cache']))
+        entries = []
+        size.set_function(lambda: len(entries), cache='documents')
+        size.set_function(lambda: 1 / 0, cache='broken')
+        entries.extend('ab')
+        # A function that raises is left out rather than failing the scrape
+        self.assertEqual(self.registry.render().splitlines()[2:], ['test_entries{cache="documents"} 2.0'])
+
+    def test_endpoint_is_local_only(self):
+        views.remember_document_index('sha-metrics', faiss.IndexFlatL2(views.d), [])
+        self.addCleanup(views._document_indexes.pop, 'sha-metrics', None)
+        response = self.client.get(reverse('rag:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('rag_cache_entries{cache="hackrx_documents"}', response.content.decode())
+        self.assertIn('rag_index_vectors{index="hackrx_documents"}', response.content.decode())
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get(reverse('rag:metrics')).status_code, 403)
+            self.assertEqual(self.client.get(reverse('rag:metrics'), REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profile_dir, ignore_errors=True)
+        self.enterContext(self.settings(RAG_PROFILING_TOKEN='s3cret', RAG_PROFILE_DIR=profile_dir,
+                                        RAG_PROFILE_SAMPLE_RATE=0.0))
+        self.url = reverse('rag:chat_query', args=[5])
+
+    def query(self, **headers):
+        # Fails validation right away; the profile is attached to the error body
+        return self.client.post(self.url, {}, content_type='application/json', **headers)
+
+    def bearer(self, **fields):
+        user = User.objects.create_user(username='frank', **fields)
+        return f'Bearer {ClaimsRefreshToken.for_user(user).access_token}'
+
+    def assertProfiled(self, response):
+        self.assertEqual(response.status_code, 400)
+        profile = response.json()['profile']
+        self.assertEqual(profile['id'], response['X-RAG-Profile-Id'])
+        self.assertTrue(profile['top_functions'])
+        self.assertTrue(os.path.exists(os.path.join(
+            settings.RAG_PROFILE_DIR, response['X-RAG-Profile-Id'] + '.prof')))
+
+    def assertNotProfiled(self, response):
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('profile', response.json())
+        self.assertNotIn('X-RAG-Profile-Id', response)
+
+    def test_profile_token(self):
+        self.assertProfiled(self.query(HTTP_X_RAG_PROFILE='1', HTTP_X_RAG_PROFILE_TOKEN='s3cret'))
+        self.assertNotProfiled(self.query(HTTP_X_RAG_PROFILE='1', HTTP_X_RAG_PROFILE_TOKEN='guess'))
+        # The token alone does not ask for a profile
+        self.assertNotProfiled(self.query(HTTP_X_RAG_PROFILE_TOKEN='s3cret'))
+
+    def test_staff_bearer_token(self):
+        self.assertProfiled(self.query(HTTP_X_RAG_PROFILE='1', HTTP_AUTHORIZATION=self.bearer(is_staff=True)))
+
+    def test_other_users_are_not_profiled(self):
+        self.assertNotProfiled(self.query(HTTP_X_RAG_PROFILE='1', HTTP_AUTHORIZATION=self.bearer()))
+        self.assertNotProfiled(self.query(HTTP_X_RAG_PROFILE='1', HTTP_AUTHORIZATION='Bearer not-a-token'))
+
+
+class StreamedTransferTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.payload = b'%PDF-1.4 ' + os.urandom(3 * 1024 * 1024)
+
+    def test_upload_is_hashed_while_copied(self):
+        upload = SimpleUploadedFile('doc.pdf', self.payload)
+        streamed = save_upload_to_temp(upload, directory=self.dir)
+        self.assertEqual(streamed.sha256, hashlib.sha256(self.payload).hexdigest())
+        self.assertEqual(streamed.size, len(self.payload))
+        with open(streamed.path, 'rb') as f:
+            self.assertEqual(f.read(), self.payload)
+
+    def test_oversized_download_leaves_no_file(self):
+        response = mock.MagicMock()
+        response.__enter__.return_value = response
+        response.headers = {}
+        response.iter_content.return_value = iter([self.payload[i:i + 65536] for i in range(0, len(self.payload), 65536)])
+        with mock.patch('rag.transfer.HTTP_SESSION.get', return_value=response) as get:
+            with self.assertRaises(FileTooLarge):
+                download_to_temp('http://example.com/doc.pdf', directory=self.dir, max_bytes=1024 * 1024)
+        self.assertEqual(get.call_args.kwargs['stream'], True)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_declared_length_is_rejected_before_reading(self):
+        response = mock.MagicMock()
+        response.__enter__.return_value = response
+        response.headers = {'Content-Length': str(len(self.payload))}
+        with mock.patch('rag.transfer.HTTP_SESSION.get', return_value=response):
+            with self.assertRaises(FileTooLarge):
+                download_to_temp('http://example.com/doc.pdf', directory=self.dir, max_bytes=1024)
+        response.iter_content.assert_not_called()
+
+
+class MultiFileUploadTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # One chunking pool for the class; starting worker processes is the slow part
+        cls.addClassCleanup(views.CHUNKING_POOL.close)
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(views, 'MEDIA_DIR', self.media).start()
+        self.enterContext(self.settings(MEDIA_ROOT=self.media))
+        self.pdfs = []
+        for seed in range(2):
+            path = make_synthetic_pdf(os.path.join(self.media, f'src_{seed}.pdf'), pages=2, seed=seed)
+            with open(path, 'rb') as f:
+                self.pdfs.append(f.read())
+
+    def upload(self, files):
+        return self.client.post(reverse('rag:upload_pdf_to_chat', args=[9]), {
+            'files': [SimpleUploadedFile(name, data, content_type='application/pdf') for name, data in files],
+        })
+
+    def test_files_are_indexed_with_one_commit(self):
+        save_index = mock.patch.object(views, 'save_chat_index', side_effect=views.save_chat_index).start()
+        response = self.upload([('a.pdf', self.pdfs[0]), ('b.pdf', self.pdfs[1]),
+                                ('a-again.pdf', self.pdfs[0]), ('broken.pdf', b'%PDF-1.4 not really')])
+        self.assertEqual(response.status_code, 200)
+        files = response.data['files']
+        self.assertEqual([f['status'] for f in files], ['indexed', 'indexed', 'duplicate', 'error'])
+        self.assertEqual(files[2]['duplicate_of'], 'a.pdf')
+        save_index.assert_called_once()
+
+        metadata = views.get_chat_metadata(9)
+        self.assertEqual(len(metadata), files[0]['chunks'] + files[1]['chunks'])
+        self.assertEqual(views.get_chat_index(9, for_write=True).ntotal, len(metadata))
+        self.assertEqual(metadata.source(0), 'a.pdf')
+        self.assertEqual(metadata.source(len(metadata) - 1), 'b.pdf')
+        self.assertEqual(set(views.get_chat_documents(9)), {hashlib.sha256(pdf).hexdigest() for pdf in self.pdfs})
+
+        again = self.upload([('b-again.pdf', self.pdfs[1])])
+        self.assertEqual(again.data['files'][0], {'name': 'b-again.pdf', 'status': 'duplicate', 'duplicate_of': 'b.pdf'})
+        save_index.assert_called_once()
+
+    def test_all_files_failing_is_a_bad_request(self):
+        response = self.upload([('broken.pdf', b'%PDF-1.4 not really')])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(os.path.exists(views.get_chat_index_path(9)))
+
+    def test_failed_commit_reports_every_file(self):
+        with mock.patch.object(views, 'save_chat_index', side_effect=OSError('disk full')):
+            response = self.upload([('a.pdf', self.pdfs[0]), ('b.pdf', self.pdfs[1])])
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual([f['status'] for f in response.data['files']], ['error', 'error'])
+        self.assertEqual(len(views.get_chat_metadata(9)), 0)
+        self.assertEqual([name for name in os.listdir(views.get_chat_dir(9)) if name.endswith('.pdf')], [])
+
+    def test_stale_document_list_does_not_undo_a_commit(self):
+        with mock.patch.object(views, 'save_chat_documents', side_effect=OSError('disk full')):
+            response = self.upload([('a.pdf', self.pdfs[0]), ('b.pdf', self.pdfs[1])])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([f['status'] for f in response.data['files']], ['indexed', 'indexed'])
+        self.assertEqual(len(views.get_chat_metadata(9)), sum(f['chunks'] for f in response.data['files']))
+        self.assertTrue(os.path.exists(os.path.join(views.get_chat_dir(9), 'a.pdf')))
+
+    def test_document_list_is_merged_when_committing(self):
+        self.upload([('a.pdf', self.pdfs[0])])
+        # The list as read by an upload that started before a.pdf was committed
+        stale = [{}]
+        get_chat_documents = views.get_chat_documents
+        with mock.patch.object(views, 'get_chat_documents',
+                               side_effect=lambda chat_id: stale.pop() if stale else get_chat_documents(chat_id)):
+            response = self.upload([('b.pdf', self.pdfs[1]), ('c.pdf', b'%PDF-1.4 not really')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(views.get_chat_documents(9)), {hashlib.sha256(pdf).hexdigest() for pdf in self.pdfs})
+
+    def test_oversized_file_is_not_spooled(self):
+        from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+        spooled = []
+        receive = TemporaryFileUploadHandler.receive_data_chunk
+
+        def count(handler, raw_data, start):
+            spooled.append((handler.file_name, len(raw_data)))
+            return receive(handler, raw_data, start)
+        limit = max(len(pdf) for pdf in self.pdfs)
+        with self.settings(RAG_UPLOAD_MAX_BYTES=limit), \
+                mock.patch.object(TemporaryFileUploadHandler, 'receive_data_chunk', autospec=True, side_effect=count):
+            response = self.upload([('a.pdf', self.pdfs[0]), ('big.pdf', os.urandom(8 * limit))])
+            single = self.client.post(reverse('rag:upload_pdf_to_chat', args=[9]), {
+                'file': SimpleUploadedFile('big.pdf', os.urandom(8 * limit), content_type='application/pdf'),
+            })
+        self.assertEqual([(f['name'], f['status']) for f in response.data['files']],
+                         [('big.pdf', 'error'), ('a.pdf', 'indexed')])
+        self.assertEqual(single.status_code, 413)
+        self.assertLessEqual(sum(n for name, n in spooled if name == 'big.pdf'), limit)
+        self.assertNotIn('big.pdf', os.listdir(views.get_chat_dir(9)))
+
+
+class IngestCommandTests(SimpleTestCase):
+    def setUp(self):
+        self.folder, self.output = tempfile.mkdtemp(), tempfile.mkdtemp()
+        for seed in range(3):
+            make_synthetic_pdf(os.path.join(self.folder, f'doc_{seed}.pdf'), pages=1, seed=seed)
+
+    def ingest(self, output, **options):
+        call_command('ingest_pdfs', self.folder, output=output, workers=1, embed_processes=0,
+                     checkpoint_every=1, stdout=io.StringIO(), **options)
+        with open(os.path.join(output, 'checkpoint.json'), encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        metadata, vectors = [], []
+        for shard in checkpoint['shards']:
+            with open(os.path.join(output, f"{shard['name']}.json"), encoding='utf-8') as f:
+                metadata.extend(json.load(f))
+            index = faiss.read_index(os.path.join(output, f"{shard['name']}.idx"))
+            vectors.append(index.reconstruct_n(0, index.ntotal))
+        return checkpoint, metadata, np.concatenate(vectors)
+
+    def test_interrupted_run_resumes_to_the_same_output(self):
+        _, full_metadata, full_vectors = self.ingest(tempfile.mkdtemp())
+        # Stop right after the first file's shard is checkpointed
+        with mock.patch.object(ingest_pdfs.Command, 'report_progress', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.ingest(self.output)
+        with open(os.path.join(self.output, 'checkpoint.json'), encoding='utf-8') as f:
+            self.assertEqual(len(json.load(f)['shards']), 1)
+
+        checkpoint, metadata, vectors = self.ingest(self.output)
+        self.assertEqual([shard['files'] for shard in checkpoint['shards']], [1, 1, 1])
+        self.assertEqual(metadata, full_metadata)
+        np.testing.assert_allclose(vectors, full_vectors)
+
+    def test_file_replaced_under_the_same_name_is_ingested_again(self):
+        self.ingest(self.output)
+        make_synthetic_pdf(os.path.join(self.folder, 'doc_1.pdf'), pages=2, seed=7)
+        checkpoint, metadata, _ = self.ingest(self.output)
+        self.assertEqual(len(checkpoint['shards']), 4)
+        self.assertEqual(metadata[-1]['source'], 'doc_1.pdf')
+
+    def test_merge_saves_the_index_before_the_chunk_store(self):
+        checkpoint, metadata, _ = self.ingest(self.output)
+        index_path, chunks_path = os.path.join(self.output, 'merged.idx'), os.path.join(self.output, 'merged')
+        command = ingest_pdfs.Command(stdout=io.StringIO())
+        with mock.patch.object(ingest_pdfs, '_write_index_atomic', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                command.merge_shards(self.output, checkpoint, index_path, chunks_path)
+        self.assertFalse(ChunkStore.exists(chunks_path))
+        command.merge_shards(self.output, checkpoint, index_path, chunks_path)
+        self.assertEqual(faiss.read_index(index_path).ntotal, len(load_chunk_store(chunks_path)))
+        self.assertEqual(len(metadata), len(load_chunk_store(chunks_path)))
+
+
+class PipelineTests(SimpleTestCase):
+    def test_streamed_chunks_match_chunking_the_whole_document(self):
+        path = os.path.join(tempfile.mkdtemp(), 'doc.pdf')
+        make_synthetic_pdf(path, pages=4, seed=3)
+        chunks, _ = views.extract_and_chunk(path)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(list(iter_chunks(iter_pages(path), views.nlp)), chunks)
+        self.assertEqual(list(pipelined(iter_pages(path), lambda pages: iter_chunks(pages, views.nlp))), chunks)
+
+    def test_stage_error_is_raised_to_the_consumer(self):
+        def failing(items):
+            for item in items:
+                if item == 3:
+                    raise ValueError('bad page')
+                yield item
+
+        results = []
+        with self.assertRaisesRegex(ValueError, 'bad page'):
+            for item in pipelined(range(10), failing, lambda items: (item * 2 for item in items)):
+                results.append(item)
+        self.assertEqual(results, [0, 2, 4])
+
+    def test_closing_the_consumer_stops_the_stage_threads(self):
+        produced = []
+
+        def source():
+            for i in itertools.count():
+                produced.append(i)
+                yield i
+
+        threads_before = threading.active_count()
+        batches = pipelined(source(), lambda items: iter(items), maxsize=2)
+        self.assertEqual([next(batches) for _ in range(3)], [0, 1, 2])
+        batches.close()
+        # The bounded queues held the source back, and closing stopped it
+        self.assertLess(len(produced), 3 + 3 * 2 + 3)
+        stopped_at = len(produced)
+        time.sleep(0.3)
+        self.assertEqual(len(produced), stopped_at)
+        self.assertEqual(threading.active_count(), threads_before)
+
+
+def entity_nlp():
+    import spacy
+
+    nlp = spacy.blank('en')
+    nlp.add_pipe('sentencizer')
+    ruler = nlp.add_pipe('entity_ruler')
+    ruler.add_patterns([
+        {'label': 'ORG', 'pattern': 'Star Health'}, {'label': 'ORG', 'pattern': 'Apollo'},
+        {'label': 'ORG', 'pattern': 'Fortis'}, {'label': 'GPE', 'pattern': 'Mumbai'},
+        {'label': 'GPE', 'pattern': 'Pune'}, {'label': 'CARDINAL', 'pattern': 'two'},
+    ])
+    return nlp
+
+
+class KnowledgeGraphTests(SimpleTestCase):
+    chunks = [
+        'Star Health covers Apollo in Mumbai. Fortis is in Pune.',
+        # Starts with the overlap of the previous chunk
+        'Fortis is in Pune. Star Health lists  Apollo and two others.',
+    ]
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(views, 'MEDIA_DIR', self.media).start()
+        mock.patch.object(views, 'nlp', entity_nlp()).start()
+
+    def counts(self):
+        return extract_cooccurrences(self.chunks, views.nlp)
+
+    def test_sentences_are_counted_once_and_numbers_ignored(self):
+        counts = extract_cooccurrences(self.chunks, views.nlp, batch_size=1)
+        star, apollo = ('Star Health', 'ORG'), ('Apollo', 'ORG')
+        self.assertEqual(counts.mentions[star], 2)
+        self.assertEqual(counts.mentions[('Fortis', 'ORG')], 1)
+        self.assertEqual(counts.pairs[(apollo, star)], 2)
+        self.assertEqual(counts.pairs[(('Fortis', 'ORG'), ('Pune', 'GPE'))], 1)
+        self.assertNotIn(('two', 'CARDINAL'), counts.mentions)
+
+    def test_entities_are_counted_from_the_chunking_parse(self):
+        counts = CooccurrenceCounts()
+        # Each text as a page; the sentence carried into the next page is counted once
+        list(iter_chunks(self.chunks, views.nlp, on_doc=counts.add_doc))
+        self.assertEqual(counts.mentions, self.counts().mentions)
+        self.assertEqual(counts.pairs, self.counts().pairs)
+
+    def test_updates_accumulate_and_pages_walk_every_neighbour(self):
+        self.assertEqual(views.update_chat_graph(3, {'a.pdf': self.counts()}), {'entities': 5, 'relations': 4})
+        views.update_chat_graph(3, {'b.pdf': self.counts()})
+        with GraphStore.for_chat_dir(views.get_chat_dir(3)) as store:
+            self.assertEqual(store.stats(), {'entities': 5, 'relations': 4})
+            star = store.find('Star  Health')[0]
+            self.assertEqual(star['mentions'], 4)
+            seen, cursor = [], None
+            while True:
+                page, cursor = store.neighbours(star['id'], 1, cursor)
+                seen.extend(page)
+                if cursor is None:
+                    break
+            self.assertEqual([n['weight'] for n in seen], [4, 2])
+            plan = ' '.join(row[3] for row in store.conn.execute(
+                'EXPLAIN QUERY PLAN SELECT dst, weight FROM edges WHERE src = ? AND (weight, dst) < (?, ?) '
+                'ORDER BY weight DESC, dst DESC LIMIT 2', (star['id'], 4, 99)))
+            self.assertIn('edges_by_weight', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_totals_are_read_without_counting(self):
+        views.update_chat_graph(3, {'a.pdf': self.counts(), 'b.pdf': self.counts()})
+        path = os.path.join(views.get_chat_dir(3), 'graph.sqlite3')
+        with GraphStore(path) as store:
+            statements = []
+            store.conn.set_trace_callback(statements.append)
+            self.assertEqual(store.stats(), {'entities': 5, 'relations': 4})
+            self.assertFalse([sql for sql in statements if 'COUNT(' in sql.upper()])
+            # A graph written before totals were kept is counted once when opened
+            store.conn.executescript('DROP TRIGGER count_entities; DROP TRIGGER count_edges; DROP TABLE totals;')
+        # Read-only, it is counted without being changed
+        with GraphStore(path, read_only=True) as store:
+            self.assertEqual(store.stats(), {'entities': 5, 'relations': 4})
+        with GraphStore(path, read_only=True) as store:
+            self.assertFalse(store.has_totals)
+        with GraphStore(path) as store:
+            self.assertEqual(store.stats(), {'entities': 5, 'relations': 4})
+
+    def test_view_pages_entities_and_neighbourhoods(self):
+        url = reverse('rag:knowledge_graph_retrieve', args=[3])
+        # Before any upload: an empty graph, and nothing is created on disk
+        self.assertEqual(self.client.get(url).json(),
+                         {'entities': [], 'totals': {'entities': 0, 'relations': 0}, 'next': None})
+        self.assertEqual(self.client.get(url, {'entity': 'Apollo'}).status_code, 404)
+        self.assertEqual(os.listdir(self.media), [])
+        views.update_chat_graph(3, {'a.pdf': self.counts()})
+
+        first = self.client.get(url, {'limit': 3}).json()
+        second = self.client.get(first['next']).json()
+        entities = first['entities'] + second['entities']
+        names = [e['name'] for e in entities]
+        self.assertEqual([e['mentions'] for e in entities], [2, 2, 1, 1, 1])
+        self.assertEqual(sorted(names), ['Apollo', 'Fortis', 'Mumbai', 'Pune', 'Star Health'])
+        self.assertIsNone(second['next'])
+        self.assertEqual(first['totals'], {'entities': 5, 'relations': 4})
+
+        graph = self.client.get(url, {'entity': 'Apollo', 'depth': 2}).json()
+        self.assertEqual(graph['entity']['name'], 'Apollo')
+        self.assertEqual({n['name'] for n in graph['nodes']}, {'Apollo', 'Star Health', 'Mumbai'})
+        self.assertEqual(len(graph['edges']), 3)
+        self.assertEqual(self.client.get(url, {'entity': 'Nowhere'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'depth': 5}).status_code, 400)
+
+    def test_upload_updates_the_graph(self):
+        pdf = make_synthetic_pdf(os.path.join(self.media, 'src.pdf'), pages=1)
+        with self.settings(MEDIA_ROOT=self.media), open(pdf, 'rb') as f:
+            with mock.patch.object(views, 'update_chat_graph', wraps=views.update_chat_graph) as update, \
+                    mock.patch('rag.knowledge_graph.extract_cooccurrences') as second_pass:
+                response = self.client.post(reverse('rag:upload_pdf_to_chat', args=[4]), {'file': f})
+        self.assertEqual(response.status_code, 200)
+        update.assert_called_once()
+        # Entities come from the chunking parse, not a second NER pass
+        second_pass.assert_not_called()
+        self.assertTrue(GraphStore.exists(views.get_chat_dir(4)))
+
+
+class ChatCommitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(views, 'MEDIA_DIR', self.media).start()
+        self.enterContext(self.settings(MEDIA_ROOT=self.media))
+        self.answer = mock.patch.object(views, 'answer_with_gemini', return_value='answer').start()
+        self.addCleanup(tiering.RESIDENT.discard, 6)
+        self.pdfs = {}
+        for seed, name in enumerate(['a.pdf', 'b.pdf']):
+            path = make_synthetic_pdf(os.path.join(self.media, f'src_{seed}.pdf'), pages=2, seed=seed)
+            with open(path, 'rb') as f:
+                self.pdfs[name] = f.read()
+
+    def upload(self, name):
+        return self.client.post(reverse('rag:upload_pdf_to_chat', args=[6]),
+                                {'file': SimpleUploadedFile(name, self.pdfs[name], content_type='application/pdf')})
+
+    def assert_aligned(self):
+        metadata = views.get_chat_metadata(6)
+        index = views.get_chat_index(6, for_write=True)
+        self.assertEqual(index.ntotal, len(metadata))
+        texts = [metadata.text(i) for i in range(len(metadata))]
+        expected = views.embedding_model.encode(texts, convert_to_numpy=True).astype('float32')
+        np.testing.assert_allclose(index.reconstruct_n(0, index.ntotal), expected, atol=1e-4)
+
+    def assert_answers_from(self, source):
+        response = self.client.post(reverse('rag:chat_query', args=[6]), {'question': 'What is covered?'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        metadata = views.get_chat_metadata(6)
+        texts = {metadata.text(i) for i in range(len(metadata)) if metadata.source(i) == source}
+        context = self.answer.call_args.args[1]
+        self.assertTrue(context)
+        self.assertTrue(set(context) <= texts)
+
+    def test_concurrent_commits_append_after_each_other(self):
+        real_save = views.save_chat_index
+
+        def slow_save(chat_id, index):
+            time.sleep(0.05)  # between reading the store's length and committing past it
+            real_save(chat_id, index)
+
+        def commit(worker):
+            for n in range(3):
+                value = worker * 10 + n
+                vectors = faiss.IndexFlatL2(views.d)
+                vectors.add(np.full((2, views.d), value, dtype='float32'))
+                views.commit_chat_chunks(6, vectors, [
+                    {'source': f'w{worker}.pdf', 'chunk_id': n * 2 + i, 'chunk_text': str(value)} for i in range(2)
+                ])
+
+        with mock.patch.object(views, 'save_chat_index', side_effect=slow_save):
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(commit, [1, 2]))
+        metadata = views.get_chat_metadata(6)
+        index = views.get_chat_index(6, for_write=True)
+        self.assertEqual((index.ntotal, len(metadata)), (12, 12))
+        # Every vector still points at its own chunk
+        self.assertEqual([int(index.reconstruct(i)[0]) for i in range(12)], [int(metadata.text(i)) for i in range(12)])
+
+    def test_failed_index_save_commits_nothing(self):
+        self.assertEqual(self.upload('a.pdf').status_code, 200)
+        with mock.patch.object(views, 'save_chat_index', side_effect=OSError('disk full')):
+            self.assertEqual(self.upload('b.pdf').status_code, 500)
+        self.assertEqual(set(views.get_chat_metadata(6).source_ranges()), {'a.pdf'})
+        self.assert_answers_from('a.pdf')
+        self.assertEqual(self.upload('b.pdf').status_code, 200)
+        self.assert_aligned()
+
+    def test_index_ahead_of_the_store_is_repaired(self):
+        self.assertEqual(self.upload('a.pdf').status_code, 200)
+        real_save = views.save_chat_index
+
+        def save_then_die(chat_id, index):
+            real_save(chat_id, index)
+            raise SystemError('worker killed')
+        with mock.patch.object(views, 'save_chat_index', side_effect=save_then_die):
+            self.assertEqual(self.upload('b.pdf').status_code, 500)
+        metadata = views.get_chat_metadata(6)
+        self.assertGreater(views.get_chat_index(6).ntotal, len(metadata))
+        self.assert_answers_from('a.pdf')
+        self.assertEqual(self.upload('b.pdf').status_code, 200)
+        self.assert_aligned()
+
+    def test_store_ahead_of_the_index_is_truncated(self):
+        self.assertEqual(self.upload('a.pdf').status_code, 200)
+        append_chunk_store(views.get_chat_chunks_path(6), [{'source': 'orphan.pdf', 'chunk_id': 0, 'chunk_text': 'x'}])
+        self.assertEqual(self.upload('b.pdf').status_code, 200)
+        self.assertNotIn('orphan.pdf', views.get_chat_metadata(6).source_ranges())
+        self.assert_aligned()
+
+
+class RetrievalCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        patcher = mock.patch.object(views, 'MEDIA_DIR', media)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.chat = Chat.objects.create(user=User.objects.create_user(username='carol'), name='cache')
+        rng = np.random.default_rng(0)
+        self.vectors = rng.random((10, views.d), dtype='float32')
+        self.write_index(self.vectors)
+        views.save_chat_metadata(self.chat.id, [{'source': 'a.pdf', 'chunk_id': i, 'chunk_text': f'chunk {i}'} for i in range(10)])
+        self.embed = mock.patch.object(views, 'embed_query', side_effect=lambda q: self.vectors[:1]).start()
+        self.answer = mock.patch.object(views, 'answer_with_gemini', return_value='answer').start()
+        self.addCleanup(mock.patch.stopall)
+        self.url = reverse('rag:chat_query', args=[self.chat.id])
+
+    def write_index(self, vectors):
+        index = faiss.IndexFlatL2(views.d)
+        index.add(vectors)
+        views.save_chat_index(self.chat.id, index)
+
+    def test_repeated_query_skips_embedding_and_search(self):
+        self.client.post(self.url, {'question': 'What is covered?'}, content_type='application/json')
+        self.client.post(self.url, {'question': '  what IS   covered? '}, content_type='application/json')
+        self.assertEqual(self.embed.call_count, 1)
+        first_context = self.answer.call_args_list[0].args[1]
+        self.assertEqual(self.answer.call_args_list[1].args[1], first_context)
+        self.assertEqual(first_context[0], 'chunk 0')
+
+    def test_index_rewrite_invalidates(self):
+        self.client.post(self.url, {'question': 'What is covered?'}, content_type='application/json')
+        self.write_index(self.vectors[::-1].copy())
+        self.client.post(self.url, {'question': 'What is covered?'}, content_type='application/json')
+        self.assertEqual(self.embed.call_count, 2)
+        self.assertEqual(self.answer.call_args.args[1][0], 'chunk 9')
+
+
+class SourceFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(views, 'MEDIA_DIR', tempfile.mkdtemp()).start()
+        self.chat = Chat.objects.create(user=User.objects.create_user(username='dave'), name='filter')
+        self.vectors = np.random.default_rng(0).random((10, views.d), dtype='float32')
+        index = faiss.IndexFlatL2(views.d)
+        index.add(self.vectors)
+        views.save_chat_index(self.chat.id, index)
+        views.save_chat_metadata(self.chat.id, [
+            {'source': 'a.pdf' if i < 4 else 'b.pdf', 'chunk_id': i, 'chunk_text': f'chunk {i}'} for i in range(10)
+        ])
+        self.embed = mock.patch.object(views, 'embed_query', side_effect=lambda q: self.vectors[:1]).start()
+        self.answer = mock.patch.object(views, 'answer_with_gemini', return_value='answer').start()
+        self.url = reverse('rag:chat_query', args=[self.chat.id])
+
+    def test_search_only_scans_selected_ranges(self):
+        index = faiss.IndexFlatL2(views.d)
+        index.add(self.vectors)
+        query = self.vectors[6:7] + 0.01
+        distances, indices = views.search_index(index, query, 3, [(0, 2), (5, 8)])
+        allowed = [0, 1, 5, 6, 7]
+        expected = sorted(allowed, key=lambda i: float(((self.vectors[i] - query[0]) ** 2).sum()))[:3]
+        self.assertEqual(indices[0].tolist(), expected)
+        self.assertEqual(indices[0][0], 6)
+        # Fewer selected vectors than top_k: the rest is padded with -1
+        self.assertEqual(views.search_index(index, query, 3, [(9, 10)])[1][0].tolist(), [9, -1, -1])
+
+    def test_query_is_limited_to_sources(self):
+        response = self.client.post(self.url, {'question': 'What is covered?', 'sources': 'b.pdf'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        context = self.answer.call_args.args[1]
+        self.assertEqual(len(context), 3)
+        self.assertTrue(all(int(text.split()[1]) >= 4 for text in context))
+        # The unfiltered query is cached separately
+        self.client.post(self.url, {'question': 'What is covered?'}, content_type='application/json')
+        self.assertEqual(self.answer.call_args.args[1][0], 'chunk 0')
+        self.assertEqual(self.embed.call_count, 2)
+
+    def test_unknown_source(self):
+        response = self.client.post(self.url, {'question': 'q', 'sources': ['c.pdf']}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['available_sources'], ['a.pdf', 'b.pdf'])
+
+    def test_retrieve_context_filter(self):
+        embedder = mock.Mock()
+        embedder.encode.return_value = self.vectors[:1]
+        index = views.get_chat_index(self.chat.id, for_write=True)
+        context = views.retrieve_context('q', index, views.get_chat_metadata(self.chat.id), embedder, sources=['b.pdf'])
+        self.assertEqual(len(context), 3)
+        self.assertNotIn('chunk 0', context)
+        with self.assertRaises(ValueError):
+            views.retrieve_context('q', index, views.get_chat_metadata(self.chat.id), embedder, sources=['c.pdf'])
+
+
+class HackRxMultiDocumentTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.docs = {}
+        for name in ('a', 'b'):
+            vectors = rng.random((3, views.d), dtype='float32')
+            index = faiss.IndexFlatL2(views.d)
+            index.add(vectors)
+            self.docs[f'http://docs/{name}.pdf'] = (f'sha-{name}', index, [
+                {'source': 'tmp.pdf', 'chunk_id': i, 'chunk_text': f'{name} chunk {i}'} for i in range(3)
+            ])
+        self.query = self.docs['http://docs/b.pdf'][1].reconstruct_n(0, 1)
+
+        def load(url):
+            if url not in self.docs:
+                raise ValueError('not a PDF')
+            return self.docs[url]
+
+        mock.patch.object(views, 'load_document_index', side_effect=load).start()
+        mock.patch.object(views, 'embed_query', return_value=self.query).start()
+        self.answer = mock.patch.object(views, 'answer_with_gemini', return_value='answer').start()
+        # Packed replies that answer nothing: every question falls back to its own call
+        self.packed = mock.patch.object(views, 'answer_batch_with_gemini', return_value={}).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_failed_document_does_not_fail_batch(self):
+        response = self.client.post(reverse('rag:hackrx_run'), {
+            'documents': ['http://docs/a.pdf', 'http://docs/bad.pdf', 'http://docs/b.pdf'],
+            'questions': ['q1', 'q2'],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['answers'], ['answer', 'answer'])
+        statuses = {d['url']: d['status'] for d in response.data['documents']}
+        self.assertEqual(statuses, {'http://docs/a.pdf': 'ok', 'http://docs/bad.pdf': 'error', 'http://docs/b.pdf': 'ok'})
+        self.assertEqual(response.data['sources'][0][0], 'http://docs/b.pdf')
+        self.assertEqual(set(response.data['sources'][0]), {'http://docs/a.pdf', 'http://docs/b.pdf'})
+        self.assertEqual(self.answer.call_args.args[1][0], 'b chunk 0')
+
+    def test_single_document_keeps_response_shape(self):
+        response = self.client.post(reverse('rag:hackrx_run'), {
+            'documents': 'http://docs/a.pdf', 'questions': ['q1'],
+        }, content_type='application/json')
+        self.assertEqual(response.data, {'answers': ['answer']})
+
+    def test_overlapping_questions_share_one_prompt(self):
+        self.packed.return_value = {1: 'packed one', 3: 'packed three'}
+        response = self.client.post(reverse('rag:hackrx_run'), {
+            'documents': 'http://docs/a.pdf', 'questions': ['q1', 'q2', 'q3'],
+        }, content_type='application/json')
+        self.assertEqual(response.data['answers'], ['packed one', 'answer', 'packed three'])
+        self.packed.assert_called_once()
+        questions, excerpts = self.packed.call_args.args
+        self.assertEqual(questions, ['q1', 'q2', 'q3'])
+        self.assertEqual(len(excerpts), len(set(excerpts)))
+        # Only the question the packed reply left out is asked again
+        self.assertEqual([c.args[0] for c in self.answer.call_args_list], ['q2'])
+
+    def test_llm_busy_mid_run_keeps_answers_so_far(self):
+        self.answer.side_effect = ['one', LLMBusy('LLM queue is full', retry_after=7)]
+        with self.settings(RAG_LLM_BATCH_QUESTIONS=1):
+            response = self.client.post(reverse('rag:hackrx_run'), {
+                'documents': 'http://docs/a.pdf', 'questions': ['q1', 'q2', 'q3'],
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'answers': ['one', None, None], 'deferred': [1, 2], 'retry_after': 7})
+        self.assertEqual(response['Retry-After'], '7')
+        # No call is made once the queue turned the run away
+        self.assertEqual(self.answer.call_count, 2)
+
+    def test_llm_busy_in_fallback_keeps_packed_answers(self):
+        self.packed.return_value = {1: 'packed one'}
+        self.answer.side_effect = LLMBusy('LLM queue is full', retry_after=3)
+        response = self.client.post(reverse('rag:hackrx_run'), {
+            'documents': ['http://docs/a.pdf'], 'questions': ['q1', 'q2'],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['answers'], ['packed one', None])
+        self.assertEqual(response.data['deferred'], [1])
+
+    def test_llm_busy_before_any_answer_is_429(self):
+        self.packed.side_effect = LLMBusy('LLM queue is full', retry_after=5)
+        response = self.client.post(reverse('rag:hackrx_run'), {
+            'documents': 'http://docs/a.pdf', 'questions': ['q1', 'q2'],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '5')
+
+    def test_concurrent_identical_packed_groups_share_one_call(self):
+        started, release = threading.Event(), threading.Event()
+
+        def packed_answer(questions, excerpts, caller):
+            started.set()
+            release.wait(5)
+            return {1: 'one', 2: 'two'}
+        self.packed.side_effect = packed_answer
+        saved = FLIGHT_SAVED_CALLS.value(flight='hackrx_question')
+        responses = []
+
+        def run(questions):
+            payload = {'documents': 'http://docs/a.pdf', 'questions': questions}
+            responses.append(Client().post(reverse('rag:hackrx_run'), payload, content_type='application/json'))
+        leader = threading.Thread(target=run, args=(['q1', 'q2'],))
+        leader.start()
+        started.wait(5)
+        # Differently spelled, identical after normalization
+        follower = threading.Thread(target=run, args=([' Q1', 'q2 '],))
+        follower.start()
+        while FLIGHT_SAVED_CALLS.value(flight='hackrx_question') < saved + 1:
+            time.sleep(0.001)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.packed.assert_called_once()
+        self.assertEqual([r.data['answers'] for r in responses], [['one', 'two']] * 2)
+
+
+class BatchAnsweringTests(SimpleTestCase):
+    def test_groups_follow_context_overlap(self):
+        contexts = [[1, 2, 3], [2, 3, 4], [7, 8, 9], [1, 2, 3], [8, 9, 10]]
+        self.assertEqual(group_by_overlap(contexts, max_questions=5, min_overlap=0.5),
+                         [[0, 1, 3], [2, 4]])
+        self.assertEqual(group_by_overlap(contexts, max_questions=2, min_overlap=0.5),
+                         [[0, 1], [2, 4], [3]])
+        self.assertEqual(group_by_overlap(contexts, max_questions=5, min_overlap=0.5, max_excerpts=3),
+                         [[0, 3], [1], [2], [4]])
+
+    def test_parses_the_reply_shapes_models_produce(self):
+        replies = [
+            '{"answers": [{"id": 1, "answer": "30 days."}, {"id": 2, "answer": "Yes."}]}',
+            '```json\n{"answers": [{"id": 2, "answer": "Yes."}, {"id": 1, "answer": "30 days."}]}\n```',
+            'Here you go: ["30 days.", "Yes."] Hope that helps.',
+            '{"1": "30 days.", "2": "Yes."}',
+            '1. 30 days.\n2) Yes.',
+            'Q1: 30 days.\nQ2: Yes.',
+        ]
+        for reply in replies:
+            with self.subTest(reply=reply):
+                self.assertEqual(parse_batch_answers(reply, 2), {1: '30 days.', 2: 'Yes.'})
+
+    def test_missing_and_invalid_answers_are_dropped(self):
+        self.assertEqual(parse_batch_answers('{"answers": [{"id": 1, "answer": ""}, {"id": 5, "answer": "x"}, '
+                                             '{"id": 2, "answer": "Yes."}]}', 2), {2: 'Yes.'})
+        self.assertEqual(parse_batch_answers('{"answers": [{"id": 1, "answer": "trunc', 2), {})
+        self.assertEqual(parse_batch_answers('I cannot answer that.', 2), {})
+
+
+class EmbeddingEngineTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.chunks = [' '.join(f'w{rng.randint(0, 500)}' for _ in range(rng.choice((3, 40, 150))))
+                       for _ in range(50)]
+
+    def test_batches_are_length_sorted_and_cover_every_chunk(self):
+        batches = length_sorted_batches(self.chunks, 8)
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(50)))
+        lengths = [len(self.chunks[i]) for batch in batches for i in batch]
+        self.assertEqual(lengths, sorted(lengths, reverse=True))
+        self.assertTrue(all(len(batch) == 8 for batch in batches[:-1]))
+
+    def test_vectors_come_back_in_input_order(self):
+        direct = views.embedding_model.encode(self.chunks, convert_to_numpy=True).astype('float32')
+        engine = EmbeddingEngine(model=views.embedding_model, batch_size=8, dimension=384)
+        with mock.patch.object(views.embedding_model, 'encode', wraps=views.embedding_model.encode) as encode:
+            vecs = engine.encode(self.chunks)
+        self.assertEqual(encode.call_count, 7)
+        np.testing.assert_allclose(vecs, direct, atol=1e-5)
+        self.assertEqual(engine.encode([]).shape, (0, 384))
+
+    def test_worker_processes_match_the_in_process_model(self):
+        direct = views.embedding_model.encode(self.chunks, convert_to_numpy=True).astype('float32')
+        engine = EmbeddingEngine(model_name=views.EMBEDDING_MODEL_NAME, processes=2,
+                                 threads_per_process=1, batch_size=4)
+        self.addCleanup(engine.close)
+        np.testing.assert_allclose(engine.encode(self.chunks), direct, atol=1e-5)
+        self.assertEqual(engine.feed_size, 16)
+
+
+class ChunkStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.base = os.path.join(tempfile.mkdtemp(), 'chunks')
+        self.entries = [
+            {'source': 'a.pdf' if i < 3 else 'b.pdf', 'chunk_id': i % 3, 'chunk_text': f'chunk {i} – ünïcode'}
+            for i in range(5)
+        ]
+
+    def test_round_trip_and_append(self):
+        write_chunk_store(self.base, self.entries[:3])
+        append_chunk_store(self.base, self.entries[3:])
+        store = ChunkStore.open(self.base)
+        self.assertEqual(len(store), 5)
+        self.assertEqual(list(store), self.entries)
+        self.assertEqual(store.sources, ['a.pdf', 'b.pdf'])
+        self.assertEqual(store.text(-1), 'chunk 4 – ünïcode')
+        with self.assertRaises(IndexError):
+            store[5]
+
+    def test_truncate_then_append(self):
+        write_chunk_store(self.base, self.entries)
+        truncate_chunk_store(self.base, 2)
+        self.assertEqual(list(ChunkStore.open(self.base)), self.entries[:2])
+        append_chunk_store(self.base, self.entries[4:])
+        self.assertEqual(list(ChunkStore.open(self.base)), self.entries[:2] + self.entries[4:])
+
+    def test_legacy_json_is_converted(self):
+        legacy = self.base + '.json'
+        with open(legacy, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        self.assertEqual(list(load_chunk_store(self.base, legacy_json_path=legacy)), self.entries)
+        self.assertTrue(ChunkStore.exists(self.base))
+        self.assertEqual(len(load_chunk_store(self.base + '-missing')), 0)
+
+    def test_source_ranges(self):
+        entries = self.entries + [dict(self.entries[0], chunk_id=3)]
+        write_chunk_store(self.base, entries)
+        self.assertEqual(ChunkStore.open(self.base).source_ranges(), {'a.pdf': [(0, 3), (5, 6)], 'b.pdf': [(3, 5)]})
+        self.assertEqual(ChunkStore.empty().source_ranges(), {})
+
+
+class ChatTieringTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        mock.patch.object(views, 'MEDIA_DIR', media).start()
+        self.addCleanup(mock.patch.stopall)
+        vectors = np.random.default_rng(2).random((4, views.d), dtype='float32')
+        index = faiss.IndexFlatL2(views.d)
+        index.add(vectors)
+        views.save_chat_index(7, index)
+        views.save_chat_metadata(7, [{'source': 'a.pdf', 'chunk_id': i, 'chunk_text': f'chunk {i}'} for i in range(4)])
+        self.chat_dir = views.get_chat_dir(7)
+
+    def test_cold_chat_is_decompressed_on_access(self):
+        version = views.get_chat_index_version(7)
+        tiering.compress_chat(self.chat_dir)
+        self.assertTrue(tiering.is_compressed(self.chat_dir))
+        self.assertFalse(os.path.exists(views.get_chat_index_path(7)))
+        self.assertEqual(views.get_chat_metadata(7).text(3), 'chunk 3')
+        self.assertEqual(views.get_chat_index(7).ntotal, 4)
+        self.assertFalse(tiering.is_compressed(self.chat_dir))
+        self.assertNotEqual(views.get_chat_index_version(7), version)
+
+    def test_compressing_waits_for_an_append(self):
+        save_chat_index = views.save_chat_index
+        saving = threading.Event()
+
+        def slow_save(chat_id, index):
+            saving.set()
+            time.sleep(0.2)
+            save_chat_index(chat_id, index)
+
+        new_vectors = faiss.IndexFlatL2(views.d)
+        new_vectors.add(np.random.default_rng(3).random((2, views.d), dtype='float32'))
+        new_metadata = [{'source': 'b.pdf', 'chunk_id': i, 'chunk_text': f'new {i}'} for i in range(2)]
+        with mock.patch.object(views, 'save_chat_index', side_effect=slow_save):
+            appender = threading.Thread(target=views.commit_chat_chunks, args=(7, new_vectors, new_metadata))
+            appender.start()
+            saving.wait(5)
+            tiering.compress_chat(self.chat_dir)
+            appender.join()
+        self.assertTrue(tiering.is_compressed(self.chat_dir))
+        metadata = views.get_chat_metadata(7)
+        self.assertEqual([metadata.text(i) for i in range(len(metadata))],
+                         ['chunk 0', 'chunk 1', 'chunk 2', 'chunk 3', 'new 0', 'new 1'])
+        self.assertEqual(views.get_chat_index(7, for_write=True).ntotal, 6)
+
+    def test_recently_used_chat_is_not_compressed(self):
+        tiering.compress_chat(self.chat_dir, idle_seconds=3600)
+        self.assertFalse(tiering.is_compressed(self.chat_dir))
+        idle = time.time() - 7200
+        for name in tiering.COMPRESSIBLE_FILES:
+            os.utime(os.path.join(self.chat_dir, name), (idle, idle))
+        tiering.compress_chat(self.chat_dir, idle_seconds=3600)
+        self.assertTrue(tiering.is_compressed(self.chat_dir))
+
+    def test_search_index_comes_from_hot_tier_until_rewritten(self):
+        with self.settings(RAG_TIER_HOT_CHATS=1):
+            tiering.RESIDENT.discard(7)
+            first = views.get_chat_index(7)
+            self.assertIs(views.get_chat_index(7), first)
+            writable = views.get_chat_index(7, for_write=True)
+            self.assertIsNot(writable, first)
+            writable.add(writable.reconstruct_n(0, 1))
+            views.save_chat_index(7, writable)
+            self.assertEqual(views.get_chat_index(7).ntotal, 5)
+        tiering.RESIDENT.discard(7)
+
+    def test_query_without_data_is_not_counted(self):
+        response = self.client.post(reverse('rag:chat_query', args=[8]), {'question': 'anything?'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(tiering.ACCESS.score(8), 0.0)
+        self.assertFalse(os.path.exists(os.path.join(views.get_chat_dir(8), tiering.ACCESS_FILE)))
+
+    def test_tier_assignment(self):
+        now = 1_000_000.0
+        chats = {
+            'busy': {'score': 50.0, 'last_access': now - 60},
+            'quiet': {'score': 1.0, 'last_access': now - 3600},
+            'idle': {'score': 9.0, 'last_access': now - 90 * 86400},
+        }
+        tiers = tiering.assign_tiers(chats, hot_chats=1, cold_after_seconds=30 * 86400, now=now)
+        self.assertEqual(tiers, {'busy': 'hot', 'quiet': 'warm', 'idle': 'cold'})
+        self.assertEqual(tiering.tier_changes({'busy': 'warm', 'idle': 'cold'}, tiers), {'warm->hot': 1})
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_duplicates_share_one_call(self):
+        flight = SingleFlight('test')
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'answer'
+
+        leader = threading.Thread(target=lambda: results.append(flight.do('q', compute)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do('q', compute))) for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        while FLIGHT_SAVED_CALLS.value(flight='test') < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['answer'] * 5)
+        # Finished flights are not cached
+        self.assertEqual(flight.do('q', lambda: 'fresh'), 'fresh')
+
+    def test_failed_call_is_not_remembered(self):
+        flight = SingleFlight('test-error')
+        with self.assertRaises(ValueError):
+            flight.do('q', mock.Mock(side_effect=ValueError('boom')))
+        self.assertEqual(flight.do('q', lambda: 'ok'), 'ok')
+
+
+class LLMSchedulerTests(SimpleTestCase):
+    def make_scheduler(self, **kwargs):
+        options = dict(requests_per_minute=0, tokens_per_minute=0, max_in_flight=1,
+                       max_queue={INTERACTIVE: 8, BATCH: 8}, max_wait={INTERACTIVE: 5, BATCH: 5})
+        options.update(kwargs)
+        return LLMScheduler(**options)
+
+    def test_interactive_first_and_round_robin_across_callers(self):
+        scheduler = self.make_scheduler()
+        scheduler.acquire(INTERACTIVE, 'holder')
+        order, threads = [], []
+
+        def call(priority, caller, label):
+            with scheduler.slot(priority, caller):
+                order.append(label)
+
+        waiting = 0
+        for priority, caller, label in [(BATCH, 'job', 'b1'), (INTERACTIVE, 'x', 'x1'), (INTERACTIVE, 'x', 'x2'),
+                                        (INTERACTIVE, 'y', 'y1'), (BATCH, 'job', 'b2')]:
+            thread = threading.Thread(target=call, args=(priority, caller, label))
+            thread.start()
+            threads.append(thread)
+            waiting += 1
+            while scheduler.depth(INTERACTIVE) + scheduler.depth(BATCH) < waiting:
+                time.sleep(0.001)
+        scheduler.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, ['x1', 'y1', 'x2', 'b1', 'b2'])
+
+    def test_full_queue_is_rejected_with_retry_after(self):
+        scheduler = self.make_scheduler(requests_per_minute=60, max_queue={INTERACTIVE: 0, BATCH: 0})
+        with self.assertRaises(LLMBusy) as raised:
+            scheduler.acquire(BATCH, 'job')
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+
+    def test_token_bucket_paces_calls(self):
+        scheduler = self.make_scheduler(requests_per_minute=600, max_in_flight=10)
+        start = time.monotonic()
+        for _ in range(70):
+            with scheduler.slot(INTERACTIVE, 'x'):
+                pass
+        # A burst of 60 (a tenth of the minute's budget), then 10 calls per second
+        self.assertGreater(time.monotonic() - start, 0.8)
+
+    def test_chat_query_returns_429_under_backpressure(self):
+        busy = mock.patch.object(views, 'answer_with_gemini', side_effect=LLMBusy('LLM queue is full', 7)).start()
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(views, 'MEDIA_DIR', tempfile.mkdtemp()).start()
+        mock.patch.object(views, 'get_chat_metadata', return_value=['chunk']).start()
+        mock.patch.object(views, 'get_chat_index_version', return_value='v1').start()
+        mock.patch.object(views.Chat.objects, 'filter').start()
+        mock.patch.object(views.retrieval_cache, 'get_hits', return_value=([], [])).start()
+        mock.patch.object(views, 'ConversationMemory').start()
+        response = self.client.post(reverse('rag:chat_query', args=[3]), {'question': 'q'}, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        busy.assert_called_once()
+
+
+class PreloadTests(SimpleTestCase):
+    def gunicorn_config(self):
+        return runpy.run_path(os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'))
+
+    def test_threads_per_worker(self):
+        with mock.patch.dict(os.environ, {'RAG_TORCH_THREADS': ''}), mock.patch('os.cpu_count', return_value=8):
+            self.assertEqual(preload.threads_per_worker(2), 4)
+            self.assertEqual(preload.threads_per_worker(3), 2)
+            self.assertEqual(preload.threads_per_worker(16), 1)
+        with mock.patch.dict(os.environ, {'RAG_TORCH_THREADS': '3'}):
+            self.assertEqual(preload.threads_per_worker(2), 3)
+        with mock.patch.dict(os.environ, {'RAG_TORCH_THREADS': '0'}):
+            self.assertEqual(preload.threads_per_worker(2), 1)
+
+    def test_forked_worker_pins_its_threads(self):
+        server, worker = mock.Mock(), mock.Mock()
+        server.cfg.workers = 4
+        with mock.patch.object(preload, 'set_inference_threads') as set_threads, \
+                mock.patch.dict(os.environ, {'RAG_TORCH_THREADS': '2'}):
+            self.gunicorn_config()['post_fork'](server, worker)
+        set_threads.assert_called_once_with(2)
+
+    def test_master_closes_connections_before_forking(self):
+        calls = mock.Mock()
+        server = mock.Mock()
+        server.cfg.preload_app = True
+        with mock.patch.object(preload, 'set_inference_threads', calls.set_inference_threads), \
+                mock.patch.object(views, 'embedding_model', calls.embedding_model), \
+                mock.patch.object(views, 'nlp', calls.nlp), \
+                mock.patch.object(views, 'preload_hot_chats', calls.preload_hot_chats), \
+                mock.patch.object(connections, 'close_all', calls.close_all), \
+                mock.patch('gc.freeze', calls.freeze):
+            self.gunicorn_config()['on_starting'](server)
+        names = [name for name, _, _ in calls.mock_calls]
+        # Warmed up single-threaded; nothing touches the database after close_all
+        self.assertEqual(calls.mock_calls[0], mock.call.set_inference_threads(1))
+        self.assertIn('embedding_model.encode', names)
+        self.assertEqual(names[-2:], ['close_all', 'freeze'])
+
+    def test_no_preload_without_preload_app(self):
+        server = mock.Mock()
+        server.cfg.preload_app = False
+        with mock.patch.object(preload, 'preload_models') as preload_models:
+            self.gunicorn_config()['on_starting'](server)
+        preload_models.assert_not_called()
+
+
+class LoadTestHarnessTests(SimpleTestCase):
+    def test_rest_model_against_fake_gemini(self):
+        server = FakeGeminiServer(latency_ms=0, documents=[b'%PDF-1.4 stub']).start()
+        self.addCleanup(server.stop)
+        model = GeminiRESTModel(server.url, 'gemini-2.5-flash')
+        self.assertIn('Stub answer', model.generate_content('What is covered?').text)
+        server.throttle_rate = 1.0
+        with self.assertRaises(LLMBusy) as raised:
+            model.generate_content('What is covered?')
+        self.assertEqual(raised.exception.retry_after, 1)
+        self.assertEqual(server.stats['calls'], 2)
+        self.assertEqual(server.stats['throttled'], 1)
+
+    def test_open_loop_keeps_the_offered_rate(self):
+        schedule = poisson_schedule({'a': 50, 'b': 0}, 20, random.Random(1))
+        self.assertAlmostEqual(len(schedule) / 20, 50, delta=5)
+        self.assertEqual({name for _, name in schedule}, {'a'})
+
+        slow = mock.Mock(side_effect=lambda session: time.sleep(0.2) or mock.Mock(status_code=200))
+        report = run_open_loop({'slow': slow}, {'slow': 40}, duration=0.5)
+        # Arrivals do not wait for responses, so 0.2 s calls still see the full 40/s
+        self.assertGreater(report['slow']['requests'], 10)
+        self.assertEqual(report['slow']['error_rate'], 0.0)
+        self.assertGreaterEqual(report['slow']['latency']['p50_ms'], 200)
+
+    def test_only_chats_created_by_a_started_server_are_removed(self):
+        media = tempfile.mkdtemp()
+        os.makedirs(os.path.join(media, 'chat_1000000'))
+
+        def run(endpoints, rates, duration, max_in_flight):
+            # Two uploads, to chats 1000001 and 1000002; the first chat already existed
+            session = mock.Mock()
+            for _ in range(2):
+                endpoints['upload'](session)
+                chat_id = session.post.call_args.args[0].rstrip('/').split('/')[-2]
+                os.makedirs(os.path.join(media, f'chat_{chat_id}'), exist_ok=True)
+            return {}
+        os.makedirs(os.path.join(media, 'chat_1000001'))
+        options = dict(documents=1, pages=1, duration=0, output=os.path.join(media, 'load.json'), stdout=io.StringIO())
+        with self.settings(MEDIA_ROOT=media), \
+                mock.patch('requests.post', return_value=mock.Mock(status_code=200)), \
+                mock.patch('rag.management.commands.load_test.run_open_loop', side_effect=run):
+            call_command('load_test', base_url='http://remote:8000', **options)
+            self.assertEqual(sorted(os.listdir(media))[:3], ['chat_1000000', 'chat_1000001', 'chat_1000002'])
+            shutil.rmtree(os.path.join(media, 'chat_1000002'))
+            with mock.patch('rag.management.commands.load_test.Command._start_server') as start:
+                call_command('load_test', start_server=True, **options)
+        start.return_value.terminate.assert_called_once()
+        self.assertEqual(sorted(name for name in os.listdir(media) if name.startswith('chat_')),
+                         ['chat_1000000', 'chat_1000001'])
+
+
+class ChatListPaginationTests(TestCase):
+    CHATS = 300
+    # Chats sharing each created_at, so page boundaries fall inside runs of ties
+    TIES = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='heavy', password='S3cure-pass-123')
+        other = User.objects.create_user(username='light', password='S3cure-pass-123')
+        Chat.objects.bulk_create([Chat(user=cls.user, name=f'chat {i}') for i in range(cls.CHATS)])
+        Chat.objects.bulk_create([Chat(user=other, name=f'other {i}') for i in range(100)])
+        ids = list(Chat.objects.filter(user=cls.user).order_by('id').values_list('id', flat=True))
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        for i in range(0, len(ids), cls.TIES):
+            Chat.objects.filter(id__in=ids[i:i + cls.TIES]).update(created_at=start + timedelta(minutes=i))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('rag:chat_list_create')
+
+    def test_pages_are_one_query_and_walk_newest_first(self):
+        newest = list(Chat.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True))
+        seen, url, params = [], self.url, {'limit': 40}
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(response.data['chats'][0]), {'id', 'name', 'created_at'})
+            seen += [chat['id'] for chat in response.data['chats']]
+            url, params = response.data['next'], None
+        # Every chat once, in order, across the runs of equal created_at
+        self.assertEqual(seen, newest)
+
+    def test_deep_page_seeks_through_the_index(self):
+        paginator = ChatCursorPagination()
+        paginator.base_url = f'http://testserver{self.url}?limit=20'
+        deep_chat = Chat.objects.filter(user=self.user).order_by('created_at', 'id')[100]
+        deep_url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(deep_chat.created_at)))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(deep_url)
+        self.assertEqual(len(response.data['chats']), 20)
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        # A seek on created_at, not an OFFSET past the newer chats
+        self.assertNotIn('OFFSET', sql.upper())
+        with connection.cursor() as cursor:
+            cursor.execute(('EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN ') + sql)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('rag_chat_user_created_idx', plan)
+        # Rows come out of the index in page order; nothing is sorted
+        for sort_step in ('TEMP B-TREE', 'SORT'):  # SQLite, PostgreSQL
+            self.assertNotIn(sort_step, plan.upper())
+
+    def test_other_users_chats_only_in_debug(self):
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(self.url, {'user': self.user.id}).status_code, 401)
+        with self.settings(DEBUG=True):
+            self.assertEqual(len(anonymous.get(self.url, {'user': self.user.id}).data['chats']), 20)
+            self.assertEqual(anonymous.get(self.url).data['chats'], [])
+            self.assertEqual(anonymous.get(self.url, {'user': 'abc'}).status_code, 400)
+
+
+class TracingTests(SimpleTestCase):
+    def setUp(self):
+        self.trace_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.trace_dir, ignore_errors=True)
+        self.enterContext(self.settings(RAG_TRACE_DIR=self.trace_dir, RAG_TRACE_SAMPLE_RATE=1.0, RAG_TRACE_SLOW_MS=10_000))
+
+    def read(self, prefix):
+        with open(os.path.join(self.trace_dir, f'{prefix}-{os.getpid()}.jsonl'), encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_span_tree_across_threads(self):
+        def extract(page):
+            with stage('extract'):
+                time.sleep(0.001)
+            count_items('extract', 1, 'pages')
+
+        with tracing.start_trace('Request', chat_id=7) as root:
+            with stage('download'):
+                pass
+            count_items('download', 2048, 'bytes')
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(tracing.traced(extract), range(3)))
+        spans = self.read('traces')
+        self.assertEqual([s['name'] for s in spans].count('extract'), 3)
+        self.assertTrue(all(s['trace_id'] == root.trace.trace_id for s in spans))
+        by_name = {s['name']: s for s in spans}
+        self.assertEqual(by_name['download']['attributes'], {'bytes': 2048})
+        self.assertEqual(by_name['extract']['parent_id'], root.span_id)
+        self.assertEqual(by_name['extract']['attributes'], {'pages': 1})
+        self.assertEqual(by_name['Request']['attributes'], {'chat_id': 7})
+        self.assertFalse(os.path.exists(os.path.join(self.trace_dir, f'slow-{os.getpid()}.jsonl')))
+
+    def test_slow_request_keeps_whole_tree(self):
+        with self.settings(RAG_TRACE_SLOW_MS=0, RAG_TRACE_SAMPLE_RATE=0.0):
+            with self.assertRaises(ValueError):
+                with tracing.start_trace('Request'):
+                    with tracing.span('llm'):
+                        with tracing.span('prompt_build', excerpts=3):
+                            pass
+                        raise ValueError('boom')
+        [tree] = self.read('slow')
+        self.assertEqual(tree['status'], 'error: ValueError')
+        [llm] = tree['children']
+        self.assertEqual((llm['name'], llm['status']), ('llm', 'error: ValueError'))
+        self.assertEqual(llm['children'][0]['attributes'], {'excerpts': 3})
+        self.assertFalse(os.path.exists(os.path.join(self.trace_dir, f'traces-{os.getpid()}.jsonl')))
+
+    def test_view_returns_trace_id(self):
+        mock.patch.object(views, 'MEDIA_DIR', tempfile.mkdtemp()).start()
+        self.addCleanup(mock.patch.stopall)
+        response = self.client.post(reverse('rag:chat_query', args=[5]), {'question': 'q'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        [root] = [span for span in self.read('traces') if span['parent_id'] is None]
+        self.assertEqual(response['X-RAG-Trace-Id'], root['trace_id'])
+        self.assertEqual(root['attributes']['chat_id'], 5)
+        self.assertEqual(root['attributes']['status'], 400)
@@ -0,0 +1,307 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Callable, Dict
+
+import faiss
+from django.conf import settings
+
+from .chunkstore import store_lock
+from .metrics import counter, gauge
+
+HOT, WARM, COLD = "hot", "warm", "cold"
+TIERS = (HOT, WARM, COLD)
+
+ACCESS_FILE = "access.json"
+STATE_FILE = "chat_tiers.json"
+COMPRESSED_SUFFIX = ".gz"
+# Files of a chat directory that are gzipped when the chat goes cold
+COMPRESSIBLE_FILES = ("faiss_index.idx", "chunks.text")
+# The chat's chunk store; its lock also covers compressing and decompressing
+CHUNKS_BASE = "chunks"
+
+TIER_CHANGES = counter(
+    "rag_tier_changes_total", "Chat index tier changes in this worker.", ["from_tier", "to_tier"]
+)
+RESIDENT_CHATS = gauge("rag_tier_resident_chats", "Hot chat indexes held in memory by this worker.")
+
+# Flat codes are mapped straight from the file (read-only) where faiss supports it
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def decay(score: float, last_access: float, now: float) -> float:
+    """Exponentially decayed access score; halves every RAG_TIER_HALF_LIFE_HOURS."""
+    half_life = _setting("RAG_TIER_HALF_LIFE_HOURS", 24) * 3600
+    if score <= 0 or now <= last_access:
+        return score
+    return score * 0.5 ** ((now - last_access) / half_life)
+
+
+# ========== ACCESS TRACKING ==========
+def read_access(chat_dir: str) -> dict:
+    path = os.path.join(chat_dir, ACCESS_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"score": 0.0, "last_access": 0.0, "hits": 0}
+
+
+def _write_access(chat_dir: str, stats: dict):
+    fd, tmp = tempfile.mkstemp(dir=chat_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+    os.replace(tmp, os.path.join(chat_dir, ACCESS_FILE))
+
+
+class AccessTracker:
+    """
+    Decayed per-chat access scores for this worker. Hits are merged into the chat's
+    access.json at most every RAG_TIER_ACCESS_FLUSH_SECONDS, so a busy chat does not
+    rewrite the file on every query; other workers' hits merge the same way.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chats: Dict[object, dict] = {}
+
+    def record(self, chat_id, chat_dir: str) -> float:
+        now = time.time()
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is None:
+                stored = read_access(chat_dir)
+                entry = self._chats[chat_id] = {
+                    "score": decay(stored["score"], stored["last_access"], now),
+                    # A chat's first hit in this worker is written through right away
+                    "last_access": now, "pending": 0, "flushed_at": 0.0,
+                }
+            entry["score"] = decay(entry["score"], entry["last_access"], now) + 1
+            entry["last_access"] = now
+            entry["pending"] += 1
+            flush = now - entry["flushed_at"] >= _setting("RAG_TIER_ACCESS_FLUSH_SECONDS", 30)
+            if flush:
+                pending, entry["pending"], entry["flushed_at"] = entry["pending"], 0, now
+            score = entry["score"]
+        if flush:
+            self._flush(chat_dir, pending, now)
+        return score
+
+    def score(self, chat_id) -> float:
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            return decay(entry["score"], entry["last_access"], time.time()) if entry else 0.0
+
+    def flush_all(self, chat_dirs: Callable[[object], str]):
+        now = time.time()
+        with self._lock:
+            pending = [(chat_id, e["pending"]) for chat_id, e in self._chats.items() if e["pending"]]
+            for chat_id, _ in pending:
+                self._chats[chat_id].update(pending=0, flushed_at=now)
+        for chat_id, hits in pending:
+            self._flush(chat_dirs(chat_id), hits, now)
+
+    @staticmethod
+    def _flush(chat_dir: str, hits: int, now: float):
+        stored = read_access(chat_dir)
+        stored["score"] = decay(stored["score"], stored["last_access"], now) + hits
+        stored["last_access"] = now
+        stored["hits"] = stored.get("hits", 0) + hits
+        _write_access(chat_dir, stored)
+
+
+# ========== COLD TIER ==========
+def is_compressed(chat_dir: str) -> bool:
+    return any(os.path.exists(os.path.join(chat_dir, name + COMPRESSED_SUFFIX)) for name in COMPRESSIBLE_FILES)
+
+
+def _convert(src: str, dst: str, opener_in, opener_out):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), suffix=".tmp")
+    os.close(fd)
+    try:
+        with opener_in(src) as fin, opener_out(tmp) as fout:
+            shutil.copyfileobj(fin, fout, 1024 * 1024)
+        os.replace(tmp, dst)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    # Callers hold the chat's lock, so no other worker is converting it
+    os.remove(src)
+
+
+def last_used(chat_dir: str) -> float:
+    """Last query recorded for the chat, or its last write if that is later."""
+    times = [read_access(chat_dir)["last_access"]]
+    for name in COMPRESSIBLE_FILES:
+        try:
+            times.append(os.path.getmtime(os.path.join(chat_dir, name)))
+        except FileNotFoundError:
+            pass
+    return max(times)
+
+
+def compress_chat(chat_dir: str, idle_seconds: float = 0) -> int:
+    """
+    Gzip the large files of a chat directory; returns the bytes saved. Runs under
+    the chunk store's lock, so no upload is appending meanwhile, and skips the chat
+    if it was queried or written within `idle_seconds`.
+    """
+    saved = 0
+    with store_lock(os.path.join(chat_dir, CHUNKS_BASE)):
+        if time.time() - last_used(chat_dir) < idle_seconds:
+            return 0
+        for name in COMPRESSIBLE_FILES:
+            path = os.path.join(chat_dir, name)
+            if not os.path.exists(path):
+                continue
+            before = os.path.getsize(path)
+            _convert(path, path + COMPRESSED_SUFFIX, lambda p: open(p, "rb"), lambda p: gzip.open(p, "wb", compresslevel=6))
+            saved += before - os.path.getsize(path + COMPRESSED_SUFFIX)
+    return saved
+
+
+def ensure_warm(chat_dir: str) -> bool:
+    """Decompress a cold chat in place so it can be memory-mapped; True if it was cold."""
+    if not is_compressed(chat_dir):
+        return False
+    was_cold = False
+    with store_lock(os.path.join(chat_dir, CHUNKS_BASE)):
+        for name in COMPRESSIBLE_FILES:
+            path = os.path.join(chat_dir, name)
+            compressed = path + COMPRESSED_SUFFIX
+            if os.path.exists(compressed):
+                was_cold = True
+                _convert(compressed, path, lambda p: gzip.open(p, "rb"), lambda p: open(p, "wb"))
+    if was_cold:
+        TIER_CHANGES.inc(from_tier=COLD, to_tier=WARM)
+    return was_cold
+
+
+# ========== HOT AND WARM TIERS ==========
+class ResidentIndexes:
+    """
+    Hot tier: fully loaded indexes of the highest-scoring chats, at most
+    RAG_TIER_HOT_CHATS per worker. Every other chat is warm and searched through a
+    read-only memory map of its index file, leaving residency to the page cache.
+    """
+
+    def __init__(self, tracker: AccessTracker):
+        self.tracker = tracker
+        self._lock = threading.Lock()
+        self._indexes: Dict[object, tuple] = {}
+
+    def capacity(self) -> int:
+        return _setting("RAG_TIER_HOT_CHATS", 16)
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def get(self, chat_id, path: str, version: str):
+        """Index for searching only: the resident copy, a new resident copy, or an mmap."""
+        with self._lock:
+            entry = self._indexes.get(chat_id)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        if entry is not None or self._admits(chat_id):
+            index = faiss.read_index(path)
+            self._promote(chat_id, version, index, reloaded=entry is not None)
+            return index
+        return faiss.read_index(path, MMAP_FLAGS)
+
+    def preload(self, chat_id, path: str, version: str):
+        if version is not None and len(self) < self.capacity():
+            self._promote(chat_id, version, faiss.read_index(path), reloaded=False)
+
+    def _admits(self, chat_id) -> bool:
+        capacity = self.capacity()
+        if capacity <= 0:
+            return False
+        with self._lock:
+            if len(self._indexes) < capacity:
+                return True
+            coldest = min(self.tracker.score(c) for c in self._indexes)
+        return self.tracker.score(chat_id) > coldest
+
+    def _promote(self, chat_id, version, index, reloaded):
+        with self._lock:
+            self._indexes[chat_id] = (version, index)
+            while len(self._indexes) > max(self.capacity(), 0):
+                coldest = min(self._indexes, key=self.tracker.score)
+                del self._indexes[coldest]
+                TIER_CHANGES.inc(from_tier=HOT, to_tier=WARM)
+        if not reloaded:
+            TIER_CHANGES.inc(from_tier=WARM, to_tier=HOT)
+
+    def discard(self, chat_id):
+        with self._lock:
+            self._indexes.pop(chat_id, None)
+
+
+ACCESS = AccessTracker()
+RESIDENT = ResidentIndexes(ACCESS)
+RESIDENT_CHATS.set_function(lambda: len(RESIDENT))
+
+
+# ========== POLICY ==========
+def load_state(media_dir: str) -> dict:
+    try:
+        with open(os.path.join(media_dir, STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(media_dir: str, state: dict):
+    fd, tmp = tempfile.mkstemp(dir=media_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, os.path.join(media_dir, STATE_FILE))
+
+
+def hottest_chats(media_dir: str, limit: int) -> list:
+    """Chat ids ranked hottest first by the last tiering run."""
+    return load_state(media_dir).get("hot", [])[:limit]
+
+
+def assign_tiers(chats: Dict[str, dict], hot_chats: int, cold_after_seconds: float, now: float) -> Dict[str, str]:
+    """
+    Tier per chat from its access stats: the `hot_chats` highest decayed scores are
+    hot, anything not accessed within `cold_after_seconds` is cold, the rest warm.
+    """
+    ranked = sorted(chats, key=lambda c: decay(chats[c]["score"], chats[c]["last_access"], now), reverse=True)
+    tiers = {}
+    for rank, chat_id in enumerate(ranked):
+        stats = chats[chat_id]
+        if now - stats["last_access"] > cold_after_seconds:
+            tiers[chat_id] = COLD
+        elif rank < hot_chats and stats["score"] > 0:
+            tiers[chat_id] = HOT
+        else:
+            tiers[chat_id] = WARM
+    return tiers
+
+
+def tier_changes(previous: Dict[str, str], current: Dict[str, str]) -> Dict[str, int]:
+    changes = {}
+    for chat_id, tier in current.items():
+        before = previous.get(chat_id)
+        if before and before != tier:
+            key = f"{before}->{tier}"
+            changes[key] = changes.get(key, 0) + 1
+    return changes
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file(follow_symlinks=False):
+            total += entry.stat().st_size
+    return total
@@ -0,0 +1,249 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = "X-RAG-Trace-Id"
+
+_current_span = contextvars.ContextVar("rag_current_span", default=None)
+_last_closed = contextvars.ContextVar("rag_last_closed_span", default=None)
+
+
+# ========== SPANS ==========
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start", "_started", "duration", "attributes", "status")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """The spans of one request. Spans may be opened from several threads."""
+
+    def __init__(self, max_spans: int):
+        self.trace_id = uuid.uuid4().hex
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def open(self, name: str, parent_id: Optional[str], attributes: dict) -> Span:
+        span = Span(self, name, parent_id, attributes)
+        with self._lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                # Still usable as a parent, just not exported
+                self.dropped += 1
+        return span
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def tree(self) -> dict:
+        """Spans nested under their parents, starting from the root."""
+        nodes = {span.span_id: dict(span.to_dict(), children=[]) for span in self.spans}
+        for span in self.spans[1:]:
+            parent = nodes.get(span.parent_id)
+            if parent is not None:
+                parent["children"].append(nodes[span.span_id])
+        return nodes[self.root.span_id]
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace.trace_id if span else None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Open a child of the current span for the duration of the block. Outside a
+    traced request this does nothing and yields None.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.trace.open(name, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.status = f"error: {type(e).__name__}"
+        raise
+    finally:
+        child.finish()
+        _current_span.reset(token)
+        _last_closed.set(child)
+
+
+def annotate(**attributes):
+    """Set attributes on the current span, if any."""
+    span = _current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def add_to_stage(stage_name: str, key: str, amount: float):
+    """
+    Add to a counter attribute of the `stage_name` span: the open one, or the one
+    that just closed under the current span, since items are usually counted right
+    after the timed block. Otherwise the current span gets it.
+    """
+    current = _current_span.get()
+    if current is None:
+        return
+    target = current
+    if current.name != stage_name:
+        last = _last_closed.get()
+        if last is not None and last.name == stage_name and last.parent_id == current.span_id:
+            target = last
+    target.add(key, amount)
+
+
+def traced(fn):
+    """
+    Wrap `fn` to run under the caller's current span, for work handed to other
+    threads (pools, pipeline stages); contextvars do not follow threads by themselves.
+    """
+    parent = _current_span.get()
+
+    def run(*args, **kwargs):
+        token = _current_span.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return run
+
+
+# ========== EXPORT ==========
+_writers: Dict[str, RotatingFileHandler] = {}
+_writers_lock = threading.Lock()
+
+
+def get_trace_dir() -> str:
+    trace_dir = getattr(settings, "RAG_TRACE_DIR", None) or os.path.join(settings.BASE_DIR, ".traces")
+    os.makedirs(trace_dir, exist_ok=True)
+    return trace_dir
+
+
+def write_jsonl(filename: str, records: List[dict]):
+    """
+    Append records to a size-rotated JSONL file in RAG_TRACE_DIR. The file name
+    carries the pid so gunicorn workers never rotate each other's files.
+    """
+    path = os.path.join(get_trace_dir(), f"{filename}-{os.getpid()}.jsonl")
+    with _writers_lock:
+        handler = _writers.get(path)
+        if handler is None:
+            handler = _writers[path] = RotatingFileHandler(
+                path, maxBytes=getattr(settings, "RAG_TRACE_MAX_BYTES", 20 * 1024 * 1024),
+                backupCount=getattr(settings, "RAG_TRACE_BACKUPS", 5), encoding="utf-8", delay=True,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+    for record in records:
+        handler.handle(logging.LogRecord(__name__, logging.INFO, __file__, 0,
+                                         json.dumps(record, default=str, ensure_ascii=False), None, None))
+
+
+def export(trace: Trace):
+    """
+    Spans of a sampled trace go to traces-<pid>.jsonl, one line per span. A trace
+    slower than RAG_TRACE_SLOW_MS is always kept, as one nested tree per line in
+    slow-<pid>.jsonl.
+    """
+    root = trace.root
+    if trace.dropped:
+        root.set(dropped_spans=trace.dropped)
+    try:
+        if random.random() < getattr(settings, "RAG_TRACE_SAMPLE_RATE", 0.01):
+            write_jsonl("traces", [span.to_dict() for span in trace.spans])
+        if root.duration * 1000 >= getattr(settings, "RAG_TRACE_SLOW_MS", 2000):
+            write_jsonl("slow", [trace.tree()])
+            logger.warning(f"🐢 Slow request {root.name} took {root.duration:.3f}s (trace {trace.trace_id})")
+    except OSError as e:
+        logger.warning(f"Could not export trace {trace.trace_id}: {e}")
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """Root span of a new trace; the trace is exported when the block exits."""
+    trace = Trace(getattr(settings, "RAG_TRACE_MAX_SPANS", 2000))
+    root = trace.open(name, None, attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.status = f"error: {type(e).__name__}"
+        raise
+    finally:
+        root.finish()
+        _current_span.reset(token)
+        export(trace)
+
+
+# ========== VIEW MIXIN ==========
+class TracedViewMixin:
+    """
+    Trace each request to an APIView: a root span named after the view, carrying
+    the method, path, URL kwargs (e.g. chat_id) and status, with the pipeline
+    stages below it. The trace id is returned in the X-RAG-Trace-Id header.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not getattr(settings, "RAG_TRACE_ENABLED", True):
+            return super().dispatch(request, *args, **kwargs)
+        with start_trace(type(self).__name__, method=request.method, path=request.path, **kwargs) as root:
+            response = super().dispatch(request, *args, **kwargs)
+            root.set(status=response.status_code)
+            if response.status_code >= 500:
+                root.status = "error"
+            response[TRACE_HEADER] = root.trace.trace_id
+        return response
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Iterable, NamedTuple, Optional, Tuple
+
+import requests
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+class TransferError(Exception):
+    """A download or upload could not be streamed to disk."""
+
+
+class FileTooLarge(TransferError):
+    pass
+
+
+class StreamedFile(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+
+# ========== HTTP SESSION ==========
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    pool_size = getattr(settings, "RAG_HTTP_POOL_SIZE", 10)
+    # Only failed connects are retried; a response that started streaming is not replayed
+    retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Shared by the worker's threads so keep-alive connections are reused across requests
+HTTP_SESSION = _build_session()
+
+
+def max_bytes_setting(name: str) -> int:
+    return getattr(settings, name, DEFAULT_MAX_BYTES)
+
+
+# ========== STREAMING ==========
+def stream_to_file(chunks: Iterable[bytes], f: BinaryIO, max_bytes: Optional[int] = None) -> Tuple[str, int]:
+    """Write `chunks` to `f`, hashing them on the way; returns (sha256 hex digest, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise FileTooLarge(f"File is larger than the {max_bytes} byte limit")
+        digest.update(chunk)
+        f.write(chunk)
+    return digest.hexdigest(), size
+
+
+def stream_to_temp(chunks: Iterable[bytes], directory: Optional[str] = None, suffix: str = ".pdf",
+                   max_bytes: Optional[int] = None) -> StreamedFile:
+    """Stream `chunks` into a new temp file; the file is removed again if streaming fails."""
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            sha256, size = stream_to_file(chunks, f, max_bytes)
+    except BaseException:
+        os.remove(path)
+        raise
+    return StreamedFile(path, sha256, size)
+
+
+def download_to_temp(url: str, directory: Optional[str] = None, suffix: str = ".pdf",
+                     max_bytes: Optional[int] = None) -> StreamedFile:
+    """
+    Download `url` to a temp file in CHUNK_SIZE pieces with the pooled session.
+    Raises FileTooLarge as soon as the declared or received size passes the limit.
+    """
+    if max_bytes is None:
+        max_bytes = max_bytes_setting("RAG_DOWNLOAD_MAX_BYTES")
+    timeout = getattr(settings, "RAG_DOWNLOAD_TIMEOUT", (5, 30))
+    with HTTP_SESSION.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length", "")
+        if declared.isdigit() and int(declared) > max_bytes:
+            raise FileTooLarge(f"Document is {declared} bytes, over the {max_bytes} byte limit")
+        return stream_to_temp(response.iter_content(CHUNK_SIZE), directory, suffix, max_bytes)
+
+
+def save_upload_to_temp(uploaded_file, directory: Optional[str] = None, suffix: str = ".pdf",
+                        max_bytes: Optional[int] = None) -> StreamedFile:
+    """Copy a Django UploadedFile to a temp file chunk by chunk, without reading it whole."""
+    if max_bytes is None:
+        max_bytes = max_bytes_setting("RAG_UPLOAD_MAX_BYTES")
+    if uploaded_file.size is not None and uploaded_file.size > max_bytes:
+        raise FileTooLarge(f"Upload is {uploaded_file.size} bytes, over the {max_bytes} byte limit")
+    return stream_to_temp(uploaded_file.chunks(CHUNK_SIZE), directory, suffix, max_bytes)
+
+
+# ========== UPLOAD HANDLER ==========
+class MaxSizeUploadHandler(FileUploadHandler):
+    """
+    Listed before TemporaryFileUploadHandler: counts the bytes of each uploaded file
+    as they arrive and skips a file as soon as it passes RAG_UPLOAD_MAX_BYTES, so the
+    rest of it is read and dropped instead of spooled to disk. The names of skipped
+    files are kept in `request.oversized_uploads` for the view to report.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.max_bytes = max_bytes_setting("RAG_UPLOAD_MAX_BYTES")
+        self.request.oversized_uploads = []
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_bytes:
+            self.request.oversized_uploads.append(self.file_name)
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def oversized_upload_error(name: str) -> str:
+    return f"Upload {name} is over the {max_bytes_setting('RAG_UPLOAD_MAX_BYTES')} byte limit"
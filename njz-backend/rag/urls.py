@@ -6,6 +6,7 @@ from .views import (
     KnowledgeGraphRetrieveView,
     ChatMessageView,
     HackRxRunView,
+    MetricsView,
 )
 
 app_name = 'rag'
@@ -17,4 +18,5 @@ urlpatterns = [
     path('chats/<int:chat_id>/messages/', ChatMessageView.as_view(), name='chat_message'),
     path('chats/<int:chat_id>/knowledge_graph/', KnowledgeGraphRetrieveView.as_view(), name='knowledge_graph_retrieve'),
     path('hackrx/run', HackRxRunView.as_view(), name='hackrx_run'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file